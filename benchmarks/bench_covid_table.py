@@ -0,0 +1,99 @@
+"""
+micro benchmark: rows per second of the previous BeautifulSoup loop vs. the columnar lxml parser of the covid table
+(datascraping.covid.parse_table) for a growing number of countries
+
+run from the repository root: python benchmarks/bench_covid_table.py [--rows 200 1000 5000] [--no-save]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from corpus import TABLE_HEADING, write_covid_table  # noqa: E402
+from datascraping.covid import parse_columns, parse_table  # noqa: E402
+from results import make_result, report  # noqa: E402
+
+
+def loop_parse_table(site: str) -> list:
+    """
+    the previous covid.parse_table implementation (whole page tree, one try/except per cell)
+    """
+    html_parsed = BeautifulSoup(site, 'lxml')
+    table = html_parsed.find('table', id="main_table_countries_today")
+    table_heading = TABLE_HEADING
+    table_body = table.tbody
+    content = []
+    rows = table_body.find_all('tr')
+    for row in rows:
+        entry = {}
+        cols = row.find_all('td')
+        cols = [ele.text.replace(',', '').replace('+', '').strip() for ele in cols]
+        if len(cols) != len(table_heading):
+            print(f'FAILED to get data for {entry}')
+            break
+        for i in range(len(table_heading)):
+            if i == 8 or i == 9:
+                continue
+            cur_value = cols[i]
+            try:
+                if '.' in cols[i]:
+                    cur_value = float(cols[i])
+                else:
+                    cur_value = int(cols[i])
+            except ValueError:
+                pass
+            entry[table_heading[i]] = cur_value
+        print(f'got data for {entry[table_heading[0]]} successfully')
+        content.append(entry)
+    return content
+
+
+def best_of(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='covid table parsing: BeautifulSoup loop vs. columnar lxml parser')
+    parser.add_argument('--rows', type=int, nargs='+', default=[200, 1000, 5000], help='countries in the table')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions (best is used)')
+    parser.add_argument('--no-save', action='store_true', help='do not append the results to results.ndjson')
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"rows":>6} {"loop (rows/s)":>14} {"columns (rows/s)":>17} {"records (rows/s)":>17}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, f'covid_{rows}.html')
+            write_covid_table(path, countries=rows)
+            with open(path, encoding='utf-8') as f:
+                site = f.read()
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert parse_table(site) == loop_parse_table(site)
+                loop = best_of(lambda: loop_parse_table(site), args.repeat)
+            columns = best_of(lambda: parse_columns(site), args.repeat)
+            records = best_of(lambda: parse_table(site), args.repeat)
+            print(f'{rows:>6} {rows / loop:>14.0f} {rows / columns:>17.0f} {rows / records:>17.0f}')
+            results.append(make_result('covid_bs4_loop', rows, loop, rows / loop, 'rows/s'))
+            results.append(make_result('covid_columns', rows, columns, rows / columns, 'rows/s'))
+            results.append(make_result('covid_records', rows, records, rows / records, 'rows/s'))
+
+    report(results, save=not args.no_save)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+micro benchmark: words per second of the old nested loop search vs. TermMatcher for a growing number of search terms
+run from the repository root: python benchmarks/bench_matcher.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datascraping.matcher import TermMatcher, tokenize  # noqa: E402
+
+TERM_COUNTS = [1, 10, 50, 100, 500]
+TEXT_WORDS = 20000
+
+
+def nested_loop_search(search: list, text: str) -> dict:
+    """
+    the previous Site.search_words implementation (O(words x terms))
+    """
+    wrd_cnt = {w: 0 for w in search}
+    wrds = list(filter(None, text.lower().replace('\n', ' ').replace('/', ' ').split(' ')))
+    for w in wrds:
+        for search_word in search:
+            if search_word == w:
+                wrd_cnt[search_word] += 1
+    return wrd_cnt
+
+
+def random_word(rnd: random.Random) -> str:
+    return ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyzäöü') for _ in range(rnd.randint(2, 10)))
+
+
+def best_of(func, repeat=3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rnd = random.Random(42)
+    vocabulary = sorted({random_word(rnd) for _ in range(5000)})
+    text = ' '.join(rnd.choice(vocabulary) for _ in range(TEXT_WORDS))
+
+    print(f'{"terms":>6} {"nested loop (words/s)":>22} {"matcher (words/s)":>18} {"matcher +prefix/phrase":>23}')
+    for term_count in TERM_COUNTS:
+        terms = rnd.sample(vocabulary, term_count)
+        mixed = terms[:term_count // 2] + [t[:3] + '*' for t in terms[term_count // 2:term_count * 3 // 4]] + \
+            [f'{a} {b}' for a, b in zip(terms[term_count * 3 // 4:], vocabulary)]
+        matcher = TermMatcher(terms)
+        mixed_matcher = TermMatcher(mixed)
+        assert matcher.count(tokenize(text)) == nested_loop_search(terms, text)
+
+        nested = best_of(lambda: nested_loop_search(terms, text))
+        single = best_of(lambda: matcher.count(tokenize(text)))
+        mixed_time = best_of(lambda: mixed_matcher.count(tokenize(text)))
+        print(f'{term_count:>6} {TEXT_WORDS / nested:>22,.0f} {TEXT_WORDS / single:>18,.0f} {TEXT_WORDS / mixed_time:>23,.0f}')
+
+
+if __name__ == '__main__':
+    main()
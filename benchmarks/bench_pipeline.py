@@ -0,0 +1,199 @@
+"""
+offline benchmarks of the whole pipeline: end to end crawl, Site.search_words, covid table parsing and plot generation
+at several corpus sizes. The corpus is served by local http servers and MongoDB is replaced by mongomock, so no live
+site or database is needed. Every result is appended to benchmarks/results.ndjson and compared with the last result
+of the same benchmark and size.
+
+run from the repository root (needs mongomock):
+    python benchmarks/bench_pipeline.py [--sizes 10 50 200] [--sites 2] [--corpus benchmarks/corpus/recorded]
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+try:
+    import mongomock
+except ImportError:
+    raise SystemExit('the pipeline benchmarks need mongomock as local MongoDB stand-in: pip install mongomock')
+
+from corpus import BENCH_TERMS, generate_corpus, serve_corpus  # noqa: E402
+from results import make_result, report  # noqa: E402
+
+BENCHMARKS = ('crawl', 'search_words', 'covid_table', 'plot')
+# runs per site stored for the plot benchmark = size * PLOT_RUNS_PER_ARTICLE
+PLOT_RUNS_PER_ARTICLE = 10
+
+
+def best_of(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_settings(workdir: str, site_urls: dict, concurrency: int) -> dict:
+    """
+    settings.json content pointing to the local servers
+    :param workdir:
+    :param site_urls: {site name: url}
+    :param concurrency: parallel article downloads per host
+    :return: settings
+    """
+    settings = {
+        'search_terms': BENCH_TERMS,
+        'search_sites': [{'url': url, 'name': name} for name, url in site_urls.items()],
+        'fetch': {'concurrency': concurrency, 'delay': 0}
+    }
+    os.makedirs(os.path.join(workdir, 'backup'), exist_ok=True)
+    return settings
+
+
+def article_texts(corpus_dir: str) -> list:
+    from bs4 import BeautifulSoup
+
+    texts = []
+    for root, _, files in os.walk(corpus_dir):
+        for file_name in files:
+            if file_name.endswith('.html') and file_name not in ('index.html', 'covid.html'):
+                with open(os.path.join(root, file_name), encoding='utf-8', errors='replace') as f:
+                    texts.extend(article.get_text() for article in BeautifulSoup(f.read(), 'lxml').find_all('article'))
+    return texts
+
+
+def bench_crawl(settings: dict, db) -> tuple:
+    """
+    crawls all sites and writes the runs, like one run of the scrape command
+    :return: (seconds, articles)
+    """
+    from datascraping.dedup import SeenIndex
+    from datascraping.fetcher import Fetcher
+    from datascraping.metrics import Metrics
+    from datascraping.persist import RunWriter
+    from datascraping.scrape import crawl_site
+
+    fetcher = Fetcher.from_settings(settings)
+    seen_index = SeenIndex()
+    metrics = Metrics()
+    start = time.perf_counter()
+    run_writer = RunWriter(db, 'worduse', metrics=metrics)
+    articles = 0
+    now = datetime.datetime.now()
+    for site_item in settings['search_sites']:
+        result = crawl_site(site_item, now, fetcher, seen_index, metrics, settings)
+        articles += result['run']['mainPageArticles']['totalArticles']
+        run_writer.add(result['name'], result['url'], result['run'])
+    run_writer.close()
+    seconds = time.perf_counter() - start
+    fetcher.close()
+    seen_index.close()
+    return seconds, articles
+
+
+def seed_runs(db, sites: int, runs: int):
+    """
+    stores runs per site over the last days for the plot benchmark
+    """
+    now = datetime.datetime.now().replace(microsecond=0)
+    db['worduse'].drop()
+    for site_index in range(sites):
+        data = [{
+            'createdAt': now - datetime.timedelta(hours=3 * i),
+            'mainPage': {'totalWords': {term: i % 7 for term in BENCH_TERMS}, 'totalArticles': 50},
+            'mainPageArticles': {'totalWords': {term: (i * 13 + site_index) % 97 for term in BENCH_TERMS},
+                                 'totalArticles': 40 + i % 20}
+        } for i in reversed(range(runs))]
+        db['worduse'].insert_one({'_id': f'site{site_index}', 'url': '', 'createdAt': data[0]['createdAt'],
+                                  'updatedAt': data[-1]['createdAt'], 'data': data})
+
+
+def bench_plot(db, settings: dict, workdir: str):
+    from plotly.offline import plot
+
+    from datascraping.plot import build_figure
+    from datascraping.query import query_runs
+    from datascraping.series import build_matrix
+
+    runs_by_site = query_runs(db, 'worduse', settings, terms=BENCH_TERMS)
+    matrix = build_matrix(runs_by_site, BENCH_TERMS)
+    fig = build_figure(matrix, BENCH_TERMS)
+    plot(fig, filename=os.path.join(workdir, 'backup', 'bench.html'), auto_open=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='offline benchmarks of the scraping pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200], help='articles per site')
+    parser.add_argument('--sites', type=int, default=2, help='number of generated sites')
+    parser.add_argument('--corpus', help='recorded corpus directory (instead of generated corpora, one size)')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel article downloads per site')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions of the micro benchmarks (best is used)')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--no-save', action='store_true', help='do not append the results to results.ndjson')
+    args = parser.parse_args()
+
+    db = mongomock.MongoClient().get_database('bench')
+    cwd = os.getcwd()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        corpora = [(None, args.corpus)] if args.corpus else \
+            [(size, os.path.join(tmp, f'corpus_{size}')) for size in args.sizes]
+        for size, corpus_dir in corpora:
+            if size is not None:
+                generate_corpus(corpus_dir, sites=args.sites, articles=size)
+            workdir = os.path.join(tmp, f'work_{size}')
+            os.makedirs(workdir, exist_ok=True)
+            with serve_corpus(corpus_dir) as site_urls:
+                settings = bench_settings(workdir, site_urls, args.concurrency)
+                os.chdir(workdir)
+                measured = {}
+                try:
+                    # progress output of the scripts is not part of the result
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        from datascraping import covid
+                        from datascraping.fetcher import Fetcher
+                        from datascraping.scrape import Site
+
+                        if 'crawl' in args.only:
+                            seconds, articles = bench_crawl(settings, db)
+                            size = size if size is not None else articles // max(len(site_urls), 1)
+                            measured['crawl'] = (seconds, articles / seconds, 'articles/s')
+                        if 'search_words' in args.only:
+                            texts = article_texts(corpus_dir)
+                            words = sum(len(text.split()) for text in texts)
+                            site = Site(next(iter(site_urls.values())), fetcher=Fetcher(streaming=True))
+                            site.specifiy_search(BENCH_TERMS)
+                            seconds = best_of(lambda: [site.search_words(text) for text in texts], args.repeat)
+                            measured['search_words'] = (seconds, words / seconds, 'words/s')
+                        if 'covid_table' in args.only:
+                            with open(os.path.join(corpus_dir, 'covid.html'), encoding='utf-8') as f:
+                                covid_html = f.read()
+                            rows = len(covid.parse_table(covid_html))
+                            seconds = best_of(lambda: covid.parse_table(covid_html), args.repeat)
+                            measured['covid_table'] = (seconds, rows / seconds, 'rows/s')
+                        if 'plot' in args.only:
+                            runs = (size or 10) * PLOT_RUNS_PER_ARTICLE
+                            seed_runs(db, len(site_urls), runs)
+                            seconds = best_of(lambda: bench_plot(db, settings, workdir), args.repeat)
+                            measured['plot'] = (seconds, runs * len(site_urls) / seconds, 'runs/s')
+                finally:
+                    os.chdir(cwd)
+            for benchmark, (seconds, throughput, unit) in measured.items():
+                results.append(make_result(benchmark, size, seconds, throughput, unit,
+                                           corpus='recorded' if args.corpus else 'generated'))
+
+    report(results, save=not args.no_save)
+
+if __name__ == '__main__':
+    main()
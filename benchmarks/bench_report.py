@@ -0,0 +1,92 @@
+"""
+micro benchmark: rendering time and html size of the single figure (SVG traces, plotly.js embedded) vs. the per site
+report (WebGL traces downsampled with LTTB, one shared plotly.js) for a growing number of runs per site
+
+run from the repository root: python benchmarks/bench_report.py [--runs 2000 20000] [--sites 10] [--no-save]
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np  # noqa: E402
+from plotly.offline import plot  # noqa: E402
+
+from datascraping.plot import build_figure, write_site_reports  # noqa: E402
+from datascraping.series import build_matrix  # noqa: E402
+from results import make_result, report  # noqa: E402
+
+TERMS = ['corona', 'virus', 'wahl', 'klima', 'krieg']
+
+
+def synthetic_runs(sites: int, runs: int) -> dict:
+    """
+    runs every 3 hours with random article and term counts
+    """
+    rng = np.random.default_rng(0)
+    start = datetime.datetime(2020, 1, 1)
+    dates = [start + datetime.timedelta(hours=3 * i) for i in range(runs)]
+    runs_by_site = {}
+    for site in range(sites):
+        articles = rng.integers(10, 60, runs)
+        counts = rng.integers(0, 120, (runs, len(TERMS)))
+        runs_by_site[f'site {site}'] = [
+            {'createdAt': dates[i], 'totalArticles': int(articles[i]),
+             'totalWords': dict(zip(TERMS, counts[i].tolist()))} for i in range(runs)]
+    return runs_by_site
+
+
+def directory_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='word use report: single figure vs. per site WebGL files')
+    parser.add_argument('--runs', type=int, nargs='+', default=[2000, 20000], help='runs per site')
+    parser.add_argument('--sites', type=int, default=10, help='number of sites')
+    parser.add_argument('--max-points', type=int, default=2000, help='points per trace of the per site report')
+    parser.add_argument('--no-save', action='store_true', help='do not append the results to results.ndjson')
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"runs":>6} {"single (s)":>11} {"single (MB)":>12} {"sites (s)":>10} {"sites (MB)":>11} '
+          f'{"unchanged (s)":>14}')
+    for runs in args.runs:
+        matrix = build_matrix(synthetic_runs(args.sites, runs), TERMS)
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            single_path = os.path.join(tmp, 'single.html')
+            plot(build_figure(matrix, TERMS), filename=single_path, auto_open=False)
+            single = time.perf_counter() - started
+            single_mb = os.path.getsize(single_path) / 1e6
+
+            directory = os.path.join(tmp, 'report')
+            started = time.perf_counter()
+            write_site_reports(matrix, TERMS, directory, args.max_points, {})
+            sites = time.perf_counter() - started
+            sites_mb = directory_size(directory) / 1e6
+            # second report without changes only compares the digests
+            started = time.perf_counter()
+            write_site_reports(matrix, TERMS, directory, args.max_points, {})
+            unchanged = time.perf_counter() - started
+        print(f'{runs:>6} {single:>11.2f} {single_mb:>12.1f} {sites:>10.2f} {sites_mb:>11.1f} {unchanged:>14.2f}')
+        points = runs * args.sites
+        results.append(make_result('report_single', points, single, points / single, 'points/s',
+                                   mb=round(single_mb, 2)))
+        results.append(make_result('report_sites', points, sites, points / sites, 'points/s', mb=round(sites_mb, 2)))
+        results.append(make_result('report_unchanged', points, unchanged, points / unchanged, 'points/s'))
+
+    report(results, save=not args.no_save)
+
+
+if __name__ == '__main__':
+    main()
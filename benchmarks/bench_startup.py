@@ -0,0 +1,87 @@
+"""
+startup time of the command line interface: --help, a dry run of the scrape command and the old script name, each
+in a fresh interpreter. Also fails if --help or a dry run import one of the heavy dependencies.
+
+run from the repository root: python benchmarks/bench_startup.py [--repeat 10] [--no-save]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from results import make_result, report  # noqa: E402
+
+HEAVY_MODULES = ('requests', 'pymongo', 'bs4', 'lxml', 'plotly', 'pandas', 'numpy')
+# prints the heavy modules which were imported while running the cli with the given arguments
+IMPORT_CHECK = '''
+import sys
+from datascraping.cli import main
+try:
+    main(sys.argv[1:])
+except SystemExit:
+    pass
+print('IMPORTED', ' '.join(sorted({name.split('.')[0] for name in sys.modules} & set(%r))))
+''' % (HEAVY_MODULES,)
+
+
+def median_ms(command: list, repeat: int, cwd: str) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True,
+                       env=dict(os.environ, PYTHONPATH=REPO_DIR))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def imported_heavy_modules(arguments: list, cwd: str) -> list:
+    output = subprocess.run([sys.executable, '-c', IMPORT_CHECK] + arguments, cwd=cwd, capture_output=True,
+                            text=True, check=True, env=dict(os.environ, PYTHONPATH=REPO_DIR)).stdout
+    return output.rsplit('IMPORTED', 1)[1].split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='startup time of the command line interface')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per command (median is used)')
+    parser.add_argument('--no-save', action='store_true', help='do not append the results to results.ndjson')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'settings.json'), 'w', encoding='utf-8') as f:
+            json.dump({'search_terms': ['corona', 'virus'],
+                       'search_sites': [{'url': 'https://www.spiegel.de/', 'name': 'spiegel'},
+                                        {'url': 'https://www.zeit.de/', 'name': 'zeit'}]}, f)
+        commands = {
+            'python_baseline': [sys.executable, '-c', 'pass'],
+            'startup_help': [sys.executable, '-m', 'datascraping', '--help'],
+            'startup_dry_run': [sys.executable, '-m', 'datascraping', 'scrape', '--dry-run'],
+            'startup_script': [sys.executable, os.path.join(REPO_DIR, 'worduse_webscrape.py'), '--help'],
+        }
+        results = []
+        for benchmark, command in commands.items():
+            seconds = median_ms(command, args.repeat, workdir)
+            results.append(make_result(benchmark, None, seconds, 1 / seconds, 'starts/s'))
+
+        failed = False
+        for arguments in (['--help'], ['scrape', '--dry-run'], ['plot', '--help']):
+            heavy = imported_heavy_modules(arguments, workdir)
+            if heavy:
+                print(f'{" ".join(arguments)} imports {", ".join(heavy)}')
+                failed = True
+
+    report(results, save=not args.no_save)
+    if failed:
+        raise SystemExit('heavy modules are imported at startup')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+html corpus for the offline benchmarks: recorded from the live sites or generated, and served by local http servers
+
+layout of a corpus directory:
+    <site name>/index.html        front page, links to the articles are root relative
+    <site name>/<article path>    articles
+    covid.html                    worldometers like country table
+
+record the front pages and articles of the sites in settings.json (run from the repository root):
+    python benchmarks/corpus.py record --out benchmarks/corpus/recorded [--articles 50]
+generate a synthetic corpus:
+    python benchmarks/corpus.py generate --out benchmarks/corpus/synthetic [--sites 2] [--articles 100]
+"""
+
+import argparse
+import functools
+import json
+import os
+import random
+import sys
+import threading
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datascraping.covid import COVID_URL  # noqa: E402
+
+# columns of the worldometers table in the order of the page
+TABLE_HEADING = ['country', 'totalCases', 'newCases', 'totalDeaths', 'newDeaths', 'totalRecovered',
+                 'activeCases', 'criticalCases', 'totalCases_for1M', 'totalDeaths_for1M',
+                 'firstCase']
+
+BENCH_TERMS = ['corona', 'virus', 'wahl', 'regierung', 'impf*', 'robert koch institut']
+FILLER_WORDS = ['der', 'die', 'das', 'und', 'nicht', 'mit', 'auf', 'für', 'ist', 'eine', 'auch', 'sich', 'nach',
+                'heute', 'bericht', 'stadt', 'land', 'menschen', 'jahr', 'politik', 'wirtschaft', 'sport']
+
+
+def _article_html(rnd: random.Random, title: str, words: int) -> str:
+    vocabulary = FILLER_WORDS * 20 + ['corona', 'virus', 'wahl', 'regierung', 'impfung', 'impfstoff', 'robert',
+                                      'koch', 'institut']
+    paragraphs = []
+    for _ in range(max(words // 80, 1)):
+        paragraphs.append(f'<p>{" ".join(rnd.choice(vocabulary) for _ in range(80))}</p>')
+    if rnd.random() < 0.3:
+        paragraphs.append('<p>laut dem Robert Koch Institut</p>')
+    return (f'<html><head><title>{title}</title><script>var tracking = "corona";</script></head><body>'
+            f'<nav><a href="/">start</a></nav><article><h1>{title}</h1>{"".join(paragraphs)}</article>'
+            f'<footer>impressum</footer></body></html>')
+
+
+def generate_corpus(directory: str, sites: int = 2, articles: int = 100, words: int = 600, seed: int = 42) -> dict:
+    """
+    writes a synthetic corpus
+    :param directory:
+    :param sites: number of sites
+    :param articles: articles per site
+    :param words: words per article
+    :param seed:
+    :return: {site name: number of articles}
+    """
+    rnd = random.Random(seed)
+    written = {}
+    for site_index in range(sites):
+        site_name = f'site{site_index}'
+        site_dir = os.path.join(directory, site_name)
+        os.makedirs(os.path.join(site_dir, 'artikel'), exist_ok=True)
+        teasers = []
+        for i in range(articles):
+            title = f'Artikel {i} von {site_name}'
+            with open(os.path.join(site_dir, 'artikel', f'{i}.html'), 'w', encoding='utf-8') as f:
+                f.write(_article_html(rnd, title, words))
+            teasers.append(f'<article><a href="/artikel/{i}.html?utm_source=start" title="{title}">{title}</a>'
+                           f'<p>{" ".join(rnd.choice(FILLER_WORDS + ["corona", "wahl"]) for _ in range(30))}</p>'
+                           f'</article>')
+        with open(os.path.join(site_dir, 'index.html'), 'w', encoding='utf-8') as f:
+            f.write(f'<html><head><title>{site_name}</title></head><body>{"".join(teasers)}</body></html>')
+        written[site_name] = articles
+    write_covid_table(os.path.join(directory, 'covid.html'), countries=max(articles, 50), seed=seed)
+    return written
+
+
+def write_covid_table(path: str, countries: int = 200, seed: int = 42):
+    """
+    writes a page with a country table in the format of worldometers
+    :param path:
+    :param countries: number of rows
+    :param seed:
+    :return:
+    """
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(countries):
+        cases = rnd.randrange(1000, 10000000)
+        values = [f'Country {i}', f'{cases:,}', f'+{rnd.randrange(1000):,}', f'{cases // 50:,}',
+                  f'+{rnd.randrange(50)}', f'{cases // 2:,}', f'{cases // 3:,}', str(rnd.randrange(5000)),
+                  f'{rnd.uniform(1, 9999):.1f}', f'{rnd.uniform(0, 999):.1f}', 'Feb 15']
+        rows.append('<tr>' + ''.join(f'<td>{value}</td>' for value in values[:len(TABLE_HEADING)]) + '</tr>')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<html><body><table id="main_table_countries_today"><thead><tr>'
+                + ''.join(f'<th>{heading}</th>' for heading in TABLE_HEADING)
+                + f'</tr></thead><tbody>{"".join(rows)}</tbody></table></body></html>')
+
+
+def _local_path(url: str) -> str:
+    path = urlsplit(url).path.lstrip('/')
+    if not path or path.endswith('/'):
+        path += 'index.html'
+    return path
+
+
+def record_corpus(directory: str, site_items: list, articles: int = 50) -> dict:
+    """
+    downloads the front pages and up to articles articles per site, absolute links to the site are made root relative
+    so the pages can be served from a local server
+    :param directory:
+    :param site_items: entries of search_sites
+    :param articles: maximum number of articles per site
+    :return: {site name: number of articles}
+    """
+    import requests
+
+    from datascraping.extract import extract_articles
+    from datascraping.matcher import TermMatcher
+    from bs4 import BeautifulSoup
+
+    recorded = {}
+    for site_item in site_items:
+        site_url = site_item['url']
+        site_name = (site_item.get('name') or urlsplit(site_url).netloc).lower()
+        site_dir = os.path.join(directory, site_name)
+        origin = f'{urlsplit(site_url).scheme}://{urlsplit(site_url).netloc}'
+        front_page = requests.get(site_url, timeout=15).text
+        links = [record.link for record in extract_articles(BeautifulSoup(front_page, 'lxml'), site_url, 'title',
+                                                            TermMatcher([])) if record.link]
+        pages = {_local_path(site_url): front_page}
+        for link in list(dict.fromkeys(links))[:articles]:
+            try:
+                pages[_local_path(link)] = requests.get(link, timeout=15).text
+            except requests.exceptions.RequestException as e:
+                print(f'could not record {link}: {e}')
+        for path, html in pages.items():
+            file_path = os.path.join(site_dir, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(html.replace(origin + '/', '/'))
+        recorded[site_name] = len(pages) - 1
+        print(f'recorded {site_name}: {len(pages) - 1} articles')
+    with open(os.path.join(directory, 'covid.html'), 'w', encoding='utf-8') as f:
+        f.write(requests.get(COVID_URL, timeout=15).text)
+    return recorded
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_corpus(directory: str):
+    """
+    serves every site of a corpus on its own local port (like a separate host)
+    :param directory:
+    :return: {site name: front page url}
+    """
+    servers = {}
+    try:
+        for site_name in sorted(os.listdir(directory)):
+            site_dir = os.path.join(directory, site_name)
+            if not os.path.isdir(site_dir):
+                continue
+            server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=site_dir))
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers[site_name] = server
+        yield {site_name: f'http://127.0.0.1:{server.server_address[1]}/' for site_name, server in servers.items()}
+    finally:
+        for server in servers.values():
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='record or generate an html corpus for the benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='download the sites of settings.json')
+    record_parser.add_argument('--out', required=True)
+    record_parser.add_argument('--articles', type=int, default=50, help='maximum articles per site')
+    generate_parser = subparsers.add_parser('generate', help='write a synthetic corpus')
+    generate_parser.add_argument('--out', required=True)
+    generate_parser.add_argument('--sites', type=int, default=2)
+    generate_parser.add_argument('--articles', type=int, default=100, help='articles per site')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        with open('settings.json', 'r', encoding='utf-8') as f:
+            print(record_corpus(args.out, json.load(f)['search_sites'], args.articles))
+    else:
+        print(generate_corpus(args.out, args.sites, args.articles))
@@ -0,0 +1,69 @@
+"""
+history of the benchmark results: one json line per result in benchmarks/results.ndjson, compared with the last result
+of the same benchmark and size
+"""
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = os.path.join(BENCH_DIR, 'results.ndjson')
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_result(benchmark: str, size, seconds: float, throughput: float, unit: str, **extra) -> dict:
+    return dict({
+        'createdAt': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'benchmark': benchmark,
+        'size': size,
+        'seconds': round(seconds, 4),
+        'throughput': round(throughput, 1),
+        'unit': unit
+    }, **extra)
+
+
+def last_results() -> dict:
+    """
+    :return: {(benchmark, size): last result}
+    """
+    results = {}
+    if os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    results[(result['benchmark'], result['size'])] = result
+    return results
+
+
+def report(results: list, save: bool = True):
+    """
+    prints the results with the change against the last run and appends them to results.ndjson
+    :param results: output of make_result
+    :param save:
+    :return:
+    """
+    previous = last_results()
+    print(f'{"benchmark":<16} {"size":>6} {"seconds":>9} {"throughput":>16}  {"change":>8}')
+    for result in results:
+        last = previous.get((result['benchmark'], result['size']))
+        change = f'{(result["seconds"] / last["seconds"] - 1) * 100:+.1f}%' if last and last['seconds'] else ''
+        print(f'{result["benchmark"]:<16} {str(result["size"]):>6} {result["seconds"]:>9.3f} '
+              f'{result["throughput"]:>10,.0f} {result["unit"]:<10} {change:>8}')
+    if save:
+        with open(RESULTS_FILE, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+        print(f'appended {len(results)} results to {RESULTS_FILE}')
@@ -0,0 +1,6 @@
+"""
+web scrapers for the word use of news sites and the covid country table
+
+the submodules are not imported here, so using one of them (e.g. datascraping.scrape.Site) or the command line interface
+does not load the dependencies of the others
+"""
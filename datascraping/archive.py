@@ -0,0 +1,262 @@
+"""
+append only archive of the raw pages, so extraction and counting can be repeated without crawling again:
+    python -m datascraping reprocess [--sites ...] [--since DATE] [--until DATE] [--write]
+
+every page is one WARC resource record compressed as its own gzip member in
+"<directory>/pages-<date>-<pid>-<n>.warc.gz", so a record can be read from its offset alone (and the files can be read
+by WARC tools). "<directory>/index.sqlite" maps url, site and run time to segment, offset and length. A page that did
+not change since its last record is only added to the index and points to the stored record.
+"""
+
+import base64
+import datetime
+import gzip
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import uuid
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from .extract import ARTICLE_STRAINER, extract_articles
+from .matcher import TermMatcher
+from .persist import KIND_FIELDS, run_key
+
+INDEX_FILE = 'index.sqlite'
+
+
+class PageArchive:
+    """
+    writes page records and their index entries (thread safe, one segment file per process)
+    """
+
+    def __init__(self, directory: str = './archive', segment_mb: float = 1024):
+        """
+        :param directory:
+        :param segment_mb: a new segment file is started when the current one gets larger
+        """
+        self.directory = directory
+        self.segment_bytes = int(segment_mb * 1024 * 1024)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segment = None
+        self._file = None
+        # processes crawling different hosts share the index
+        self._db = sqlite3.connect(os.path.join(directory, INDEX_FILE), timeout=60, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, url TEXT NOT NULL, '
+                         'site TEXT NOT NULL, kind TEXT NOT NULL, run_at TEXT NOT NULL, fetched_at TEXT NOT NULL, '
+                         'digest TEXT NOT NULL, charset TEXT, segment TEXT NOT NULL, offset INTEGER NOT NULL, '
+                         'length INTEGER NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS records_url ON records (url, fetched_at)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS records_digest ON records (url, digest)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS records_run ON records (site, run_at)')
+        self._db.commit()
+
+    @classmethod
+    def from_settings(cls, settings: dict):
+        """
+        creates the archive from the "archive" section of settings.json
+        :param settings: whole settings.json content
+        :return: None if pages are not archived
+        """
+        archive_settings = settings.get('archive')
+        if archive_settings is None:
+            return None
+        return cls(archive_settings.get('directory', './archive'), float(archive_settings.get('segment_mb', 1024)))
+
+    def _open_segment(self):
+        if self._file and self._file.tell() < self.segment_bytes:
+            return
+        if self._file:
+            self._file.close()
+        base = f'pages-{datetime.datetime.now().strftime("%Y%m%d-%H%M%S")}-{os.getpid()}'
+        number = 0
+        while os.path.exists(os.path.join(self.directory, f'{base}-{number}.warc.gz')):
+            number += 1
+        self._segment = f'{base}-{number}.warc.gz'
+        self._file = open(os.path.join(self.directory, self._segment), 'ab')
+
+    def add(self, url: str, site_name: str, kind: str, run_at: datetime.datetime, body: bytes, charset: str = None):
+        """
+        archives one page
+        :param url:
+        :param site_name:
+        :param kind: main (front page) or article
+        :param run_at: createdAt of the run
+        :param body: raw response body
+        :param charset: declared charset of the body
+        :return:
+        """
+        digest = 'sha1:' + base64.b32encode(hashlib.sha1(body).digest()).decode()
+        fetched_at = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            previous = self._db.execute('SELECT segment, offset, length FROM records WHERE url = ? AND digest = ? '
+                                        'ORDER BY fetched_at DESC LIMIT 1', (url, digest)).fetchone()
+            if previous:
+                segment, offset, length = previous
+            else:
+                headers = [
+                    'WARC/1.1',
+                    'WARC-Type: resource',
+                    f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>',
+                    f'WARC-Date: {fetched_at.strftime("%Y-%m-%dT%H:%M:%SZ")}',
+                    f'WARC-Target-URI: {url}',
+                    f'WARC-Payload-Digest: {digest}',
+                    'Content-Type: text/html' + (f'; charset={charset}' if charset else ''),
+                    f'Content-Length: {len(body)}',
+                ]
+                record = '\r\n'.join(headers).encode('utf-8') + b'\r\n\r\n' + body + b'\r\n\r\n'
+                self._open_segment()
+                segment = self._segment
+                offset = self._file.tell()
+                self._file.write(gzip.compress(record, compresslevel=6))
+                self._file.flush()
+                length = self._file.tell() - offset
+            self._db.execute('INSERT INTO records (url, site, kind, run_at, fetched_at, digest, charset, segment, '
+                             'offset, length) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (url, site_name, kind, run_key(run_at), fetched_at.isoformat(), digest, charset, segment,
+                              offset, length))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            if self._db:
+                self._db.close()
+                self._db = None
+
+
+class ArchiveReader:
+    """
+    random access to the archived pages through memory mapped segment files
+    """
+
+    def __init__(self, directory: str = './archive'):
+        self.directory = directory
+        self._db = sqlite3.connect(f'file:{os.path.join(directory, INDEX_FILE)}?mode=ro', uri=True,
+                                   check_same_thread=False)
+        self._maps = {}
+
+    def entries(self, sites: list = None, start: datetime.datetime = None, end: datetime.datetime = None) -> list:
+        """
+        index entries of the archived runs
+        :param sites: site names (None = all)
+        :param start: first run time (inclusive)
+        :param end: last run time (exclusive)
+        :return: [(url, site, kind, run_at, charset, segment, offset, length)] ordered by run and page
+        """
+        query = 'SELECT url, site, kind, run_at, charset, segment, offset, length FROM records WHERE 1 = 1'
+        parameters = []
+        if sites:
+            query += f' AND site IN ({",".join("?" * len(sites))})'
+            parameters.extend(sites)
+        if start:
+            query += ' AND run_at >= ?'
+            parameters.append(run_key(start))
+        if end:
+            query += ' AND run_at < ?'
+            parameters.append(run_key(end))
+        return self._db.execute(query + ' ORDER BY site, run_at, id', parameters).fetchall()
+
+    def find(self, url: str, at: datetime.datetime = None):
+        """
+        latest index entry of an url
+        :param url:
+        :param at: latest entry fetched before this time (None = latest)
+        :return: (url, site, kind, run_at, charset, segment, offset, length) or None
+        """
+        query = 'SELECT url, site, kind, run_at, charset, segment, offset, length FROM records WHERE url = ?'
+        parameters = [url]
+        if at:
+            query += ' AND fetched_at <= ?'
+            parameters.append(at.astimezone(datetime.timezone.utc).isoformat())
+        return self._db.execute(query + ' ORDER BY fetched_at DESC LIMIT 1', parameters).fetchone()
+
+    def read(self, segment: str, offset: int, length: int) -> tuple:
+        """
+        decompresses one record
+        :param segment:
+        :param offset:
+        :param length:
+        :return: (WARC headers dict, body bytes)
+        """
+        segment_map = self._maps.get(segment)
+        if segment_map is None:
+            with open(os.path.join(self.directory, segment), 'rb') as f:
+                segment_map = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        record = zlib.decompress(segment_map[offset:offset + length], wbits=31)
+        head, _, rest = record.partition(b'\r\n\r\n')
+        headers = dict(line.split(': ', 1) for line in head.decode('utf-8').split('\r\n')[1:])
+        return headers, rest[:int(headers['Content-Length'])]
+
+    def close(self):
+        for segment_map in self._maps.values():
+            segment_map.close()
+        self._maps = {}
+        self._db.close()
+
+
+def _count_entries(directory: str, terms: list, entries: list) -> dict:
+    """
+    process pool task: extracts and counts the archived pages of entries again
+    :param directory: archive directory
+    :param terms: search terms
+    :param entries: index entries (see ArchiveReader.entries)
+    :return: {(site, run_at): {'mainPage': Counter, 'mainPageArticles': Counter}}
+    """
+    reader = ArchiveReader(directory)
+    matcher = TermMatcher(terms)
+    counts = {}
+    try:
+        for url, site_name, kind, run_at, charset, segment, offset, length in entries:
+            _, body = reader.read(segment, offset, length)
+            html = BeautifulSoup(body.decode(charset or 'utf-8', errors='replace'), 'lxml',
+                                 parse_only=ARTICLE_STRAINER)
+            run_fields = counts.setdefault((site_name, run_at), {field: Counter() for field in KIND_FIELDS.values()})
+            for record in extract_articles(html, url, 'title', matcher):
+                run_fields[KIND_FIELDS[kind]].update(record.counts)
+    finally:
+        reader.close()
+    return counts
+
+
+def reprocess(directory: str, terms: list, sites: list = None, start: datetime.datetime = None,
+              end: datetime.datetime = None, workers: int = None) -> dict:
+    """
+    counts the search terms in the archived runs again, spread over all cores
+    :param directory: archive directory
+    :param terms: search terms
+    :param sites: site names (None = all)
+    :param start: first run time (inclusive)
+    :param end: last run time (exclusive)
+    :param workers: processes (default: number of cores)
+    :return: {(site, run_at): {'mainPage': {term: count}, 'mainPageArticles': {term: count}}}
+    """
+    reader = ArchiveReader(directory)
+    try:
+        entries = reader.entries(sites, start, end)
+    finally:
+        reader.close()
+    workers = workers or os.cpu_count() or 1
+    # several chunks per worker, so a slow chunk does not keep the other workers waiting
+    chunk_size = max(len(entries) // (workers * 4), 1)
+    run_counts = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_count_entries, directory, terms, entries[i:i + chunk_size])
+                   for i in range(0, len(entries), chunk_size)]
+        for future in futures:
+            for (site_name, run_at), fields in future.result().items():
+                run_fields = run_counts.setdefault((site_name, datetime.datetime.fromisoformat(run_at)),
+                                                   {field: dict.fromkeys(terms, 0) for field in KIND_FIELDS.values()})
+                for field, counts in fields.items():
+                    for term, count in counts.items():
+                        run_fields[field][term] += count
+    return run_counts
@@ -0,0 +1,240 @@
+"""
+append only backup of everything written to MongoDB: one compact json line per run (or covid table) in rotating, gzip
+compressed files "<directory>/<stream>-<date>-<pid>.ndjson.gz" (every process appends to its own files, so the daemon,
+scrape and reduce can write at the same time). The backups can be written back into an empty or outdated
+database with:
+    python -m datascraping restore [--since DATE] [--dry-run]
+
+dates are stored as {"$date": "<iso date>"} (like MongoDB extended json). orjson is used for serializing if it is
+installed, the standard json module otherwise.
+"""
+
+import datetime
+import glob
+import gzip
+import json
+import os
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _encode_default(value):
+    if isinstance(value, datetime.datetime):
+        return {'$date': value.isoformat()}
+    raise TypeError(f'{type(value).__name__} cannot be backed up')
+
+
+def dumps(record: dict) -> bytes:
+    """
+    one compact json line
+    :param record:
+    :return:
+    """
+    if orjson:
+        return orjson.dumps(record, default=_encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME) + b'\n'
+    line = json.dumps(record, default=_encode_default, ensure_ascii=False, separators=(',', ':'))
+    return line.encode('utf-8') + b'\n'
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if len(value) == 1 and '$date' in value:
+            return datetime.datetime.fromisoformat(value['$date'])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def loads(line: bytes) -> dict:
+    return _decode(orjson.loads(line) if orjson else json.loads(line))
+
+
+class BackupSink:
+    """
+    appends records to the newest backup file of a stream and starts a new file when it gets too large
+    """
+
+    def __init__(self, directory: str = './backup', stream: str = 'worduse', max_mb: float = 64, compress: bool = True,
+                 fsync_every: int = 16):
+        """
+        :param directory:
+        :param stream: worduse or covid
+        :param max_mb: size (on disk) after which a new file is started
+        :param compress: gzip the files
+        :param fsync_every: records written before the file is synced to disk (and on close)
+        """
+        self.directory = directory
+        self.stream = stream
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.suffix = '.ndjson.gz' if compress else '.ndjson'
+        self.fsync_every = max(fsync_every, 1)
+        self.path = None
+        self.written = 0
+        self._raw = None
+        self._file = None
+        self._unsynced = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings: dict, stream: str = 'worduse'):
+        """
+        creates the sink from the "backup" section of settings.json (backups are always written, the section only
+        changes the defaults)
+        :param settings: whole settings.json content
+        :param stream: worduse or covid
+        :return:
+        """
+        backup_settings = settings.get('backup', {})
+        return cls(backup_settings.get('directory', './backup'), stream, float(backup_settings.get('max_mb', 64)),
+                   bool(backup_settings.get('compress', True)), int(backup_settings.get('fsync_every', 16)))
+
+    def _open(self):
+        """
+        opens the newest file of the stream written by this process id if it is not full yet, a new one otherwise (a new
+        gzip member is appended to compressed files)
+        :return:
+        """
+        pid = os.getpid()
+        files = sorted(glob.glob(os.path.join(self.directory, f'{self.stream}-*-{pid}{self.suffix}')))
+        if files and os.path.getsize(files[-1]) < self.max_bytes:
+            self.path = files[-1]
+        else:
+            started = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+            self.path = os.path.join(self.directory, f'{self.stream}-{started}-{pid}{self.suffix}')
+        self._raw = open(self.path, 'ab')
+        self._file = gzip.GzipFile(fileobj=self._raw, mode='ab') if self.suffix.endswith('.gz') else self._raw
+
+    def _close_file(self):
+        # closing the gzip stream writes the end of the member into the raw file
+        if self._file is not self._raw:
+            self._file.close()
+        self._file = self._raw
+        self._sync()
+        self._raw.close()
+        self._raw = self._file = None
+
+    def _sync(self):
+        if self._file is not self._raw:
+            self._file.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._unsynced = 0
+
+    def write(self, record: dict):
+        """
+        appends one record
+        :param record: json serializable dict, datetimes are allowed
+        :return:
+        """
+        if self._raw is None:
+            self._open()
+        elif self._raw.tell() >= self.max_bytes:
+            self._close_file()
+            self._open()
+        self._file.write(dumps(record))
+        self.written += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self._sync()
+
+    def write_run(self, site_name: str, site_url: str, run: dict):
+        """
+        appends the run of a site (like persist.RunWriter.add)
+        :param site_name:
+        :param site_url:
+        :param run: run structure with createdAt
+        :return:
+        """
+        self.write({'site': site_name, 'url': site_url, 'run': run})
+
+    def close(self):
+        if self._raw is not None:
+            self._close_file()
+
+
+def read_records(directory: str = './backup', stream: str = 'worduse'):
+    """
+    streams the records of all backup files of a stream, oldest first. Reading a file stops at a record that was not
+    completely written (e.g. after a crash)
+    :param directory:
+    :param stream: worduse or covid
+    :return: generator of records
+    """
+    files = glob.glob(os.path.join(directory, f'{stream}-*.ndjson.gz')) + \
+        glob.glob(os.path.join(directory, f'{stream}-*.ndjson'))
+    for path in sorted(files, key=os.path.basename):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            try:
+                for line in f:
+                    if line.endswith(b'\n'):
+                        yield loads(line)
+                    else:
+                        print(f'{path}: incomplete last record skipped')
+            except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+                print(f'{path}: stopped reading at a damaged part ({e})')
+
+
+def restore_runs(records, collection, run_writer=None, since: datetime.datetime = None) -> int:
+    """
+    writes backed up runs which are newer than the last stored run of their site, the files of several processes are
+    not in the order of the runs, so every run is compared with the last run stored before the restore
+    :param records: records of the worduse stream
+    :param collection: word use collection (per site documents) for the last update of the sites
+    :param run_writer: persist.RunWriter (None = only count the runs)
+    :param since: only runs created at or after this time
+    :return: number of restored runs
+    """
+    from .persist import last_updates
+
+    updated = {}
+    # a run may be in the backup twice (e.g. a reduce which was repeated)
+    restored = {}
+    for record in records:
+        site_name, run = record['site'], record['run']
+        # MongoDB stores dates in milliseconds
+        created_at = run['createdAt'].replace(microsecond=run['createdAt'].microsecond // 1000 * 1000)
+        if site_name not in updated:
+            updated[site_name] = last_updates(collection, [site_name]).get(site_name)
+        if (updated[site_name] and created_at <= updated[site_name]) or (since and created_at < since) or \
+                (site_name, created_at) in restored:
+            continue
+        restored[(site_name, created_at)] = record
+    if run_writer:
+        # written in the order of the runs, so the runs of a site stay sorted and its updatedAt is the last run
+        for (site_name, _), record in sorted(restored.items(), key=lambda item: item[0][1]):
+            run_writer.add(site_name, record['url'], record['run'])
+    return len(restored)
+
+
+def restore_covid(records, collection, since: datetime.datetime = None, dry_run: bool = False,
+                  series_store=None) -> int:
+    """
+    inserts backed up covid tables of days which are not stored
+    :param records: records of the covid stream
+    :param collection: covid collection
+    :param since: only tables updated at or after this time
+    :param dry_run: only count the tables
+    :param series_store: covid_series.CovidSeriesStore, the tables are appended to the per country series instead
+    :return: number of restored tables
+    """
+    if series_store:
+        missing = [record for record in records if not (since and record['updatedAt'] < since) and
+                   not series_store.has_day(datetime.datetime.fromisoformat(record['_id']))]
+        if not dry_run:
+            series_store.ensure_indexes()
+            series_store.store_documents(sorted(missing, key=lambda record: record['_id']))
+        return len(missing)
+    restored = 0
+    for record in records:
+        if (since and record['updatedAt'] < since) or collection.count_documents({'_id': record['_id']}):
+            continue
+        if not dry_run:
+            collection.insert_one(record)
+        restored += 1
+    return restored
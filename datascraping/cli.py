@@ -0,0 +1,354 @@
+"""
+command line interface: python -m datascraping <command>, see python -m datascraping --help for the commands
+
+only argparse and the standard library are imported at startup, the modules of a command (requests, pymongo, plotly,
+...) are imported when the command runs
+"""
+
+import argparse
+import datetime
+import os
+import sys
+from urllib.parse import urlsplit
+
+from . import config
+
+
+def parse_date(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+
+def print_plan(settings: dict, processes: int):
+    """
+    shows what a scrape would do, without any request or database access
+    :param settings: whole settings.json content
+    :param processes:
+    :return:
+    """
+    fetch_settings = settings.get('fetch', {})
+    print(f'search terms ({len(settings["search_terms"])}): {", ".join(settings["search_terms"])}')
+    hosts = {}
+    for site_item in settings['search_sites']:
+        if 'url' not in site_item:
+            print('settings file keys cannot be found')
+            continue
+        hosts.setdefault(urlsplit(site_item['url']).netloc.lower(), []).append(site_item)
+    for host, site_items in hosts.items():
+        print(f'{host}:')
+        for site_item in site_items:
+            print(f'    {site_item.get("name")} | {site_item["url"]} '
+                  f'(concurrency {site_item.get("concurrency", fetch_settings.get("concurrency", 1))}, '
+                  f'delay {site_item.get("delay", fetch_settings.get("delay", 0.1))}s)')
+    print(f'processes: {min(processes, max(len(hosts), 1))}, streaming: {fetch_settings.get("streaming", False)}, '
+          f'storage: {settings.get("storage", {}).get("mode", "documents")}, '
+          f'cache: {settings["cache"].get("directory", "./cache/http") if "cache" in settings else "off"}')
+
+
+def scrape_command(args):
+    settings = config.load_settings(args.settings)
+    processes = args.processes or settings.get('processes', 1)
+    if args.dry_run:
+        print_plan(settings, processes)
+        return
+    from . import scrape
+
+    scrape.run(settings, config.get_database(args.config), config.collection_name('worduse_coll', args.config),
+               yes=args.yes, processes=processes)
+
+
+def covid_command(args):
+    from . import covid
+    from .backup import BackupSink
+    from .covid_series import CovidSeriesStore
+
+    # the covid scraper also runs without settings.json
+    settings = config.load_settings(args.settings) if os.path.exists(args.settings) else {}
+    db = config.get_database(args.config)
+    col_name = config.collection_name('covid_coll', args.config)
+    covid.run(db, col_name, url=args.url, backup=BackupSink.from_settings(settings, 'covid'),
+              series_store=CovidSeriesStore.from_settings(db, col_name, settings))
+
+
+def plot_command(args):
+    from . import plot
+
+    plot.run(config.get_database(args.config), config.collection_name('worduse_coll', args.config),
+             config.load_settings(args.settings), sites=args.sites, terms=args.terms, since=args.since,
+             until=args.until, resample=args.resample, measure=args.measure, mode=args.mode,
+             max_points=args.max_points)
+
+
+def migrate_command(args):
+    from .storage import BucketStore
+
+    if args.covid:
+        from .covid_series import CovidSeriesStore
+
+        store = CovidSeriesStore(config.get_database(args.config), config.collection_name('covid_coll', args.config))
+        print(f'migrated {store.migrate()} days into {store.collection.name}')
+        return
+    settings = config.load_settings(args.settings)
+    granularity = args.granularity or settings.get('storage', {}).get('granularity', 'month')
+    store = BucketStore(config.get_database(args.config), config.collection_name('worduse_coll', args.config),
+                        granularity)
+    print(f'migrated {store.migrate(drop_data=args.drop_data)} runs into {store.collection.name}')
+
+
+def rollup_command(args):
+    from .rollup import RollupStore
+
+    settings = config.load_settings(args.settings)
+    db = config.get_database(args.config)
+    rollup_store = RollupStore.from_settings(db, config.collection_name('worduse_coll', args.config), settings)
+    if rollup_store is None:
+        raise SystemExit('rollups are not enabled, add "rollup": {"enabled": true} to settings.json first')
+    print(f'added {rollup_store.rebuild(settings, args.sites)} runs to {rollup_store.collection.name}')
+
+
+def write_run_counts(args, settings: dict, run_counts: dict):
+    """
+    writes recomputed counts into the stored runs
+    :param args: parsed arguments (config file)
+    :param settings: whole settings.json content
+    :param run_counts: {(site, run_at): {'mainPage': {term: count}, 'mainPageArticles': {term: count}}}
+    :return:
+    """
+    from .persist import run_count_updates
+    from .rollup import RollupStore
+    from .storage import BucketStore
+
+    db = config.get_database(args.config)
+    col_name = config.collection_name('worduse_coll', args.config)
+    by_collection = {}
+    bucket_store = BucketStore.from_settings(db, col_name, settings)
+    for collection_name, operation in run_count_updates(run_counts, bucket_store, col_name):
+        by_collection.setdefault(collection_name, []).append(operation)
+    for collection_name, operations in by_collection.items():
+        result = db[collection_name].bulk_write(operations, ordered=False)
+        print(f'updated {result.matched_count // 2} of {len(operations) // 2} runs in {collection_name}')
+    rollup_store = RollupStore.from_settings(db, col_name, settings)
+    if rollup_store:
+        rollup_store.rebuild(settings, sorted({site_name for site_name, _ in run_counts}))
+
+
+def backfill_command(args):
+    from .persist import print_run_count_totals
+    from .term_index import TermIndex
+
+    settings = config.load_settings(args.settings)
+    term_index = TermIndex.from_settings(settings)
+    if term_index is None:
+        raise SystemExit('no "term_index" section in settings.json, there is nothing to backfill from')
+    try:
+        run_counts = term_index.run_counts(args.terms)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    finally:
+        term_index.close()
+
+    print_run_count_totals(run_counts, args.terms)
+    if args.dry_run:
+        return
+
+    write_run_counts(args, settings, run_counts)
+    missing = [term for term in args.terms if term not in settings['search_terms']]
+    if missing:
+        print(f'add {", ".join(missing)} to search_terms in settings.json to count them in the next runs')
+
+
+def reprocess_command(args):
+    settings = config.load_settings(args.settings)
+    directory = settings.get('archive', {}).get('directory', './archive')
+    if not os.path.exists(os.path.join(directory, 'index.sqlite')):
+        raise SystemExit(f'no page archive in {directory}, add an "archive" section to settings.json and scrape first')
+    from .archive import reprocess
+    from .persist import print_run_count_totals
+
+    terms = args.terms or settings['search_terms']
+    run_counts = reprocess(directory, terms, sites=args.sites, start=args.since, end=args.until,
+                           workers=args.workers)
+    print_run_count_totals(run_counts, terms)
+    if args.write:
+        write_run_counts(args, settings, run_counts)
+
+
+def restore_command(args):
+    from .backup import read_records, restore_covid, restore_runs
+    from .covid_series import CovidSeriesStore
+    from .persist import RunWriter
+    from .rollup import RollupStore
+    from .storage import BucketStore
+
+    settings = config.load_settings(args.settings) if os.path.exists(args.settings) else {}
+    directory = settings.get('backup', {}).get('directory', './backup')
+    db = config.get_database(args.config)
+    if 'worduse' in args.streams:
+        col_name = config.collection_name('worduse_coll', args.config)
+        run_writer = None
+        if not args.dry_run:
+            bucket_store = BucketStore.from_settings(db, col_name, settings)
+            if bucket_store:
+                bucket_store.ensure_indexes()
+            rollup_store = RollupStore.from_settings(db, col_name, settings)
+            if rollup_store:
+                rollup_store.ensure_indexes()
+            run_writer = RunWriter(db, col_name, bucket_store, rollup_store=rollup_store)
+        restored = restore_runs(read_records(directory, 'worduse'), db[col_name], run_writer, since=args.since)
+        if run_writer:
+            run_writer.close()
+        print(f'{"found" if args.dry_run else "restored"} {restored} missing run(s) in the backup')
+    if 'covid' in args.streams:
+        col_name = config.collection_name('covid_coll', args.config)
+        restored = restore_covid(read_records(directory, 'covid'), db[col_name], since=args.since,
+                                 dry_run=args.dry_run,
+                                 series_store=CovidSeriesStore.from_settings(db, col_name, settings))
+        print(f'{"found" if args.dry_run else "restored"} {restored} missing covid table(s) in the backup')
+
+
+def daemon_command(args):
+    from .daemon import Daemon
+
+    if not os.path.exists(args.settings):
+        raise SystemExit(f'settings file not found: {args.settings}')
+    Daemon(args.config, args.settings, covid=not args.no_covid).run_forever()
+
+
+def enqueue_command(args):
+    from .work_queue import WorkQueue, enqueue_sites
+
+    settings = config.load_settings(args.settings)
+    db = config.get_database(args.config)
+    col_name = config.collection_name('worduse_coll', args.config)
+    queue = WorkQueue.from_settings(db, col_name, settings)
+    print(f'queued {enqueue_sites(settings, db, col_name, queue)} articles, queue: {queue.status()}')
+
+
+def work_command(args):
+    from .work_queue import WorkQueue, work
+
+    settings = config.load_settings(args.settings)
+    queue = WorkQueue.from_settings(config.get_database(args.config),
+                                    config.collection_name('worduse_coll', args.config), settings)
+    print(f'processed {work(queue, settings, exit_when_empty=args.exit_when_empty)} articles')
+
+
+def reduce_command(args):
+    import time
+
+    from .work_queue import WorkQueue, reduce_runs
+
+    settings = config.load_settings(args.settings)
+    db = config.get_database(args.config)
+    col_name = config.collection_name('worduse_coll', args.config)
+    queue = WorkQueue.from_settings(db, col_name, settings)
+    while True:
+        print(f'saved {reduce_runs(queue, db, col_name, settings)} run(s), queue: {queue.status()}')
+        if not args.wait or not queue.open_runs():
+            return
+        time.sleep(10)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='datascraping', description='word use and covid scrapers')
+    parser.add_argument('--config', default=config.CONFIG_FILE, help='MongoDB configuration (default: config.ini)')
+    parser.add_argument('--settings', default=config.SETTINGS_FILE,
+                        help='sites, search terms and options (default: settings.json)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scrape_parser = subparsers.add_parser('scrape', help='count search terms in the articles of news sites')
+    scrape_parser.add_argument('-y', '--yes', '--batch', dest='yes', action='store_true',
+                               help='save all results to the database without asking (for unattended runs)')
+    scrape_parser.add_argument('-p', '--processes', type=int, default=None,
+                               help='crawl sites of different hosts in parallel processes (default: "processes" of '
+                                    'settings.json or 1)')
+    scrape_parser.add_argument('-n', '--dry-run', action='store_true',
+                               help='only show the sites and options that would be used')
+    scrape_parser.set_defaults(handler=scrape_command)
+
+    covid_parser = subparsers.add_parser('covid', help='store the covid country table of today')
+    # defaults and choices are repeated here so the modules of the commands are not imported for --help
+    covid_parser.add_argument('--url', default='https://www.worldometers.info/coronavirus/',
+                              help='page with the country table')
+    covid_parser.set_defaults(handler=covid_command)
+
+    plot_parser = subparsers.add_parser('plot', help='plot the word use of all sites into an html file')
+    plot_parser.add_argument('--sites', nargs='+', help='names of the sites to plot (default: all)')
+    plot_parser.add_argument('--terms', nargs='+', help='search terms to plot (default: search_terms of settings.json)')
+    plot_parser.add_argument('--since', type=parse_date, help='first date to plot (YYYY-MM-DD[THH:MM])')
+    plot_parser.add_argument('--until', type=parse_date, help='plot runs before this date (YYYY-MM-DD[THH:MM])')
+    plot_parser.add_argument('--resample', choices=('hour', 'day', 'week'),
+                             help='average the runs per hour, day or week (hour needs the rollups)')
+    plot_parser.add_argument('--measure', choices=('run', 'article', 'words'), default='run',
+                             help='occurrences per run (default), per article or per 1,000 words (article and '
+                                  'words need the rollups)')
+    plot_parser.add_argument('--mode', choices=('single', 'sites'),
+                             help='one figure with all sites, or one WebGL file per site with an index page (default: '
+                                  'from settings.json or single)')
+    plot_parser.add_argument('--max-points', type=int,
+                             help='points per line in mode sites (default: from settings.json or 2000, 0 = all)')
+    plot_parser.set_defaults(handler=plot_command)
+
+    migrate_parser = subparsers.add_parser('migrate', help='copy the runs of the per site documents into buckets '
+                                                           '(or the daily covid tables into per country series)')
+    migrate_parser.add_argument('--granularity', choices=('day', 'week', 'month'), default=None,
+                                help='bucket size (default: from settings.json or month)')
+    migrate_parser.add_argument('--drop-data', action='store_true',
+                                help='remove the data array from the per site documents afterwards')
+    migrate_parser.add_argument('--covid', action='store_true',
+                                help='copy the daily covid tables into per country series instead')
+    migrate_parser.set_defaults(handler=migrate_command)
+
+    rollup_parser = subparsers.add_parser('rollup',
+                                          help='rebuild the hourly, daily and weekly totals from the stored runs')
+    rollup_parser.add_argument('--sites', nargs='+', help='names of the sites (default: all)')
+    rollup_parser.set_defaults(handler=rollup_command)
+
+    backfill_parser = subparsers.add_parser('backfill',
+                                            help='count new search terms in earlier runs from the term index')
+    backfill_parser.add_argument('terms', nargs='+', help='words or prefixes (word*) to count')
+    backfill_parser.add_argument('-n', '--dry-run', action='store_true',
+                                 help='only print the counts, do not update the runs')
+    backfill_parser.set_defaults(handler=backfill_command)
+
+    reprocess_parser = subparsers.add_parser('reprocess',
+                                             help='extract and count the pages of the page archive again')
+    reprocess_parser.add_argument('--sites', nargs='+', help='names of the sites (default: all)')
+    reprocess_parser.add_argument('--terms', nargs='+',
+                                  help='search terms to count (default: search_terms of settings.json)')
+    reprocess_parser.add_argument('--since', type=parse_date, help='first run to count (YYYY-MM-DD[THH:MM])')
+    reprocess_parser.add_argument('--until', type=parse_date, help='count runs before this date (YYYY-MM-DD[THH:MM])')
+    reprocess_parser.add_argument('-w', '--workers', type=int, default=None,
+                                  help='parallel processes (default: number of cores)')
+    reprocess_parser.add_argument('--write', action='store_true', help='update the counts of the stored runs')
+    reprocess_parser.set_defaults(handler=reprocess_command)
+
+    restore_parser = subparsers.add_parser('restore', help='write runs and covid tables of the backup into MongoDB')
+    restore_parser.add_argument('--streams', nargs='+', choices=('worduse', 'covid'), default=['worduse', 'covid'],
+                                help='backups to restore (default: both)')
+    restore_parser.add_argument('--since', type=parse_date, help='only restore from this date (YYYY-MM-DD[THH:MM])')
+    restore_parser.add_argument('-n', '--dry-run', action='store_true',
+                                help='only count the runs and tables missing in the database')
+    restore_parser.set_defaults(handler=restore_command)
+
+    daemon_parser = subparsers.add_parser('daemon', help='crawl every site on its own interval until stopped')
+    daemon_parser.add_argument('--no-covid', action='store_true', help='do not store the covid table every day')
+    daemon_parser.set_defaults(handler=daemon_command)
+
+    enqueue_parser = subparsers.add_parser('enqueue',
+                                           help='count the frontpages and queue their articles for the workers')
+    enqueue_parser.set_defaults(handler=enqueue_command)
+
+    work_parser = subparsers.add_parser('work', help='fetch and count queued articles')
+    work_parser.add_argument('--exit-when-empty', action='store_true',
+                             help='stop when no article is pending (default: wait for new articles)')
+    work_parser.set_defaults(handler=work_command)
+
+    reduce_parser = subparsers.add_parser('reduce', help='save the runs of which all queued articles are done')
+    reduce_parser.add_argument('--wait', action='store_true', help='repeat until every queued run is saved')
+    reduce_parser.set_defaults(handler=reduce_command)
+    return parser
+
+
+def main(argv: list = None):
+    args = build_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    args.handler(args)
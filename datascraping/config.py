@@ -0,0 +1,59 @@
+"""
+configuration of the scripts, read on first use: config.ini (MongoDB connection and collection names) and
+settings.json (sites, search terms and options). The MongoDB client is created when a database is first requested.
+"""
+
+import configparser
+import functools
+import json
+
+CONFIG_FILE = 'config.ini'
+SETTINGS_FILE = 'settings.json'
+
+
+@functools.lru_cache(maxsize=None)
+def load_config(path: str = CONFIG_FILE) -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    if not config.read(path):
+        raise SystemExit(f'config file not found: {path}')
+    return config
+
+
+def load_settings(path: str = SETTINGS_FILE) -> dict:
+    """
+    reads settings.json (every call reads the file again, so changes are picked up)
+    :param path:
+    :return:
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise SystemExit(f'settings file not found: {path}')
+
+
+@functools.lru_cache(maxsize=None)
+def _client(connection_string: str):
+    import pymongo
+
+    return pymongo.MongoClient(connection_string)
+
+
+def get_database(config_path: str = CONFIG_FILE):
+    """
+    database of the [mongo-testing] section, one client per connection string is kept for the process
+    :param config_path:
+    :return:
+    """
+    config = load_config(config_path)
+    return _client(config['mongo']['connection_string']).get_database(config['mongo-testing']['db'])
+
+
+def collection_name(key: str, config_path: str = CONFIG_FILE) -> str:
+    """
+    name of a collection of the [mongo-testing] section
+    :param key: worduse_coll or covid_coll
+    :param config_path:
+    :return:
+    """
+    return load_config(config_path)['mongo-testing'][key]
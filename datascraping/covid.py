@@ -0,0 +1,175 @@
+"""
+covid scraper: stores the country table of worldometers once per day, as one document per day in "<covid_coll>" or
+appended to the per country series (see covid_series):
+    python -m datascraping covid [--url URL]
+"""
+
+import requests
+import lxml.html
+import numpy as np
+import datetime
+from .backup import BackupSink
+
+COVID_URL = 'https://www.worldometers.info/coronavirus/'
+
+
+# normalized header texts (lowercase letters and digits) of the worldometers table and the fields they are stored as
+HEADER_FIELDS = {
+    'country': 'country', 'countryother': 'country',
+    'totalcases': 'totalCases',
+    'newcases': 'newCases',
+    'totaldeaths': 'totalDeaths',
+    'newdeaths': 'newDeaths',
+    'totalrecovered': 'totalRecovered',
+    'activecases': 'activeCases',
+    'criticalcases': 'criticalCases', 'seriouscritical': 'criticalCases',
+    'totalcasesfor1m': 'totalCases_for1M', 'totcases1mpop': 'totalCases_for1M',
+    'totaldeathsfor1m': 'totalDeaths_for1M', 'deaths1mpop': 'totalDeaths_for1M',
+    'firstcase': 'firstCase', '1stcase': 'firstCase',
+}
+TEXT_FIELDS = ('country', 'firstCase')
+# fields which are parsed but not stored
+SKIPPED_FIELDS = ('totalCases_for1M', 'totalDeaths_for1M')
+TABLE_ID = 'main_table_countries_today'
+
+
+def _table_element(site: str):
+    """
+    parses only the country table (the rest of the page is not parsed if the table can be cut out of the html)
+    :param site: html of the worldometers page
+    :return: lxml element of the table
+    """
+    position = site.find(f'id="{TABLE_ID}"')
+    start = site.rfind('<table', 0, position)
+    end = site.find('</table>', position)
+    if position < 0 or start < 0 or end < 0:
+        start, end = 0, len(site)
+    table = lxml.html.fromstring(site[start:end + len('</table>')]).xpath(f'//table[@id="{TABLE_ID}"]')
+    if not table:
+        raise ValueError(f'no table with id {TABLE_ID} found')
+    return table[0]
+
+
+def _numeric_column(values: np.ndarray) -> np.ndarray:
+    """
+    converts cell texts like "1,234", "+56" or "" to float64 in one pass, empty and invalid cells are NaN
+    :param values: array of str
+    :return:
+    """
+    cleaned = np.char.strip(np.char.replace(np.char.replace(values, ',', ''), '+', ''))
+    try:
+        return np.where(cleaned == '', 'nan', cleaned).astype(np.float64)
+    except ValueError:
+        # texts like N/A
+        column = np.full(len(cleaned), np.nan)
+        for i, value in enumerate(cleaned):
+            try:
+                column[i] = float(value)
+            except ValueError:
+                pass
+        return column
+
+
+def parse_columns(site: str) -> dict:
+    """
+    reads the country table into one array per column, columns are found by their header text. Rows with a different
+    number of cells than the header are left out
+    :param site: html of the worldometers page
+    :return: {field: array}, float64 (NaN = empty) for numbers, object (None = empty) for texts
+    """
+    table = _table_element(site)
+    headers = [''.join(filter(str.isalnum, header.text_content().lower())) for header in table.xpath('./thead/tr/th')]
+    rows = [[cell.text_content() for cell in row.xpath('./td')] for row in table.xpath('./tbody/tr')]
+    complete = [row for row in rows if len(row) == len(headers)]
+    if len(complete) < len(rows):
+        print(f'left out {len(rows) - len(complete)} row(s) with missing cells')
+    grid = np.array(complete, dtype=str).reshape(len(complete), len(headers))
+    columns = {}
+    for index, header in enumerate(headers):
+        field = HEADER_FIELDS.get(header)
+        if field is None or field in columns:
+            continue
+        if field in TEXT_FIELDS:
+            texts = np.char.strip(grid[:, index]).astype(object)
+            texts[texts == ''] = None
+            columns[field] = texts
+        else:
+            columns[field] = _numeric_column(grid[:, index])
+    return columns
+
+
+def table_records(columns: dict) -> list:
+    """
+    converts the columns of the country table into rows
+    :param columns: output of parse_columns
+    :return: one dict per country, whole numbers as int and empty cells as None
+    """
+    columns = {field: values for field, values in columns.items() if field not in SKIPPED_FIELDS}
+    converted = []
+    for field, values in columns.items():
+        if values.dtype == object:
+            converted.append(values.tolist())
+        else:
+            whole = np.isfinite(values) & (values == np.floor(values))
+            cells = values.astype(object)
+            cells[whole] = values[whole].astype(np.int64).tolist()
+            cells[np.isnan(values)] = None
+            converted.append(cells.tolist())
+    return [dict(zip(columns, row)) for row in zip(*converted)]
+
+
+def parse_table(site: str) -> list:
+    """
+    reads the rows of the country table
+    :param site: html of the worldometers page
+    :return: one dict per country, whole numbers as int and empty cells as None
+    """
+    return table_records(parse_columns(site))
+
+
+def run(db, col_name: str, url: str = COVID_URL, backup: BackupSink = None, series_store=None):
+    """
+    stores the country table of today if it is not stored yet
+    :param db: mongo database
+    :param col_name: name of the covid collection
+    :param url: page with the country table
+    :param backup: sink of the covid stream, closed afterwards (default: ./backup)
+    :param series_store: covid_series.CovidSeriesStore, the table is appended to the per country series instead of
+                         being stored as one document per day
+    :return:
+    """
+    today = datetime.date.today()
+    day = datetime.datetime.combine(today, datetime.time())
+
+    if series_store:
+        stored = series_store.has_day(day)
+    else:
+        stored = db[col_name].count_documents({'_id': str(today)}) > 0
+    if not stored:
+
+        columns = parse_columns(requests.get(url).text)
+        content = table_records(columns)
+        print(f'got data for {len(content)} countries')
+
+        # now = datetime.datetime.now()
+        # save_file_name = f'{now.date()}T{now.hour}-{now.minute}_covid_dump.json'
+
+        mongo_format = {
+            '_id': str(today),
+            'updatedAt': datetime.datetime.now(),
+            'data': content
+        }
+        backup = backup or BackupSink(stream='covid')
+        try:
+            backup.write(mongo_format)
+        finally:
+            backup.close()
+        print(f'appended table to the backup: {backup.path}')
+        if series_store:
+            series_store.ensure_indexes()
+            print(f'appended {series_store.store_day(day, columns)} countries to {series_store.collection.name}')
+        else:
+            db[col_name].insert_one(mongo_format)
+    else:
+        print('already filled data for today')
+
@@ -0,0 +1,238 @@
+"""
+per country time series of the covid table
+
+instead of one document per day with the whole table (collection "<covid_coll>"), every country has one document per
+year in "<covid_coll>_series" with the days and the values of every column delta encoded (first value, then the
+differences to the previous day), indexed by country and year. The history of a country is read from one document per
+year and decoded into numpy arrays.
+
+enable with
+    "covid": {"storage": "series"}
+and copy the existing daily documents into series with:
+    python -m datascraping migrate --covid
+"""
+
+import datetime
+
+import numpy as np
+from pymongo import ASCENDING, ReplaceOne
+
+# numeric columns of covid.parse_columns which are stored
+SERIES_FIELDS = ('totalCases', 'newCases', 'totalDeaths', 'newDeaths', 'totalRecovered', 'activeCases',
+                 'criticalCases')
+
+
+def _number(value) -> float:
+    """
+    value of a stored daily document as float (empty and text cells are NaN)
+    """
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+def _delta(value: float):
+    # whole numbers are stored as int, so the documents stay small
+    return int(value) if value == int(value) else value
+
+
+def _append(doc: dict, day: datetime.datetime, values: dict, first_case) -> bool:
+    """
+    appends the values of one day to a series document
+    :param doc: series document of a country and year
+    :param day:
+    :param values: {field: float (NaN = missing)}
+    :param first_case: date of the first case (text)
+    :return: False if the day is not after the last stored day
+    """
+    previous = doc['lastDay'] or datetime.datetime(doc['year'], 1, 1)
+    if doc['lastDay'] and day <= doc['lastDay']:
+        return False
+    doc['days'].append((day - previous).days)
+    for field in SERIES_FIELDS:
+        value = values.get(field, np.nan)
+        if np.isnan(value):
+            # missing values do not change the running value
+            doc['values'][field].append(None)
+        else:
+            doc['values'][field].append(_delta(value - doc['last'].get(field, 0)))
+            doc['last'][field] = value
+    doc['lastDay'] = day
+    if first_case:
+        doc['firstCase'] = first_case
+    return True
+
+
+def _decode(deltas: list) -> np.ndarray:
+    """
+    running values of delta encoded values, None stays NaN
+    """
+    values = np.array(deltas, dtype=np.float64)
+    missing = np.isnan(values)
+    values = np.cumsum(np.where(missing, 0, values))
+    values[missing] = np.nan
+    return values
+
+
+class CovidSeriesStore:
+    """
+    reads and writes the covid table as per country series
+    """
+
+    def __init__(self, db, col_name: str):
+        """
+        :param db: mongo database
+        :param col_name: name of the covid collection (daily documents), the series are in <col_name>_series
+        """
+        self.daily = db[col_name]
+        self.collection = db[f'{col_name}_series']
+
+    @classmethod
+    def from_settings(cls, db, col_name: str, settings: dict):
+        """
+        creates the store from the "covid" section of settings.json
+        :param db: mongo database
+        :param col_name: name of the covid collection
+        :param settings: whole settings.json content
+        :return: None if the table is stored as one document per day (default)
+        """
+        if settings.get('covid', {}).get('storage', 'documents') != 'series':
+            return None
+        return cls(db, col_name)
+
+    def ensure_indexes(self):
+        self.collection.create_index([('country', ASCENDING), ('year', ASCENDING)], unique=True)
+        self.collection.create_index([('year', ASCENDING), ('lastDay', ASCENDING)])
+
+    def has_day(self, day: datetime.datetime) -> bool:
+        return self.collection.count_documents({'year': day.year, 'lastDay': {'$gte': day}}, limit=1) > 0
+
+    def _documents(self, years: set) -> dict:
+        return {(doc['country'], doc['year']): doc for doc in self.collection.find({'year': {'$in': sorted(years)}})}
+
+    def _write(self, docs: list):
+        if docs:
+            self.collection.bulk_write([ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in docs],
+                                       ordered=False)
+
+    def _store(self, tables: list, docs: dict) -> tuple:
+        """
+        appends the tables to the documents
+        :param tables: [(day, [(country, {field: float}, first case)])] sorted by day
+        :param docs: {(country, year): document}, new documents are added
+        :return: (keys of the changed documents, appended days)
+        """
+        changed = set()
+        days = set()
+        for day, rows in tables:
+            for country, values, first_case in rows:
+                key = (country, day.year)
+                doc = docs.get(key)
+                if doc is None:
+                    doc = docs[key] = {'_id': f'{country}|{day.year}', 'country': country, 'year': day.year,
+                                       'lastDay': None, 'days': [], 'values': {field: [] for field in SERIES_FIELDS},
+                                       'last': {}}
+                if _append(doc, day, values, first_case):
+                    changed.add(key)
+                    days.add(day)
+        return changed, days
+
+    def store_day(self, day: datetime.datetime, columns: dict) -> int:
+        """
+        appends the table of one day
+        :param day: date of the table (time is ignored)
+        :param columns: output of covid.parse_columns
+        :return: number of countries stored
+        """
+        day = datetime.datetime(day.year, day.month, day.day)
+        numeric = {field: columns[field] for field in SERIES_FIELDS if field in columns}
+        first_cases = columns.get('firstCase', [None] * len(columns['country']))
+        rows = [(country, {field: float(values[i]) for field, values in numeric.items()}, first_cases[i])
+                for i, country in enumerate(columns['country']) if country]
+        docs = self._documents({day.year})
+        changed, _ = self._store([(day, rows)], docs)
+        self._write([docs[key] for key in changed])
+        return len(changed)
+
+    def store_documents(self, documents) -> int:
+        """
+        appends daily documents (as stored in the covid collection or the backup) which are newer than the series
+        :param documents: iterable of {'_id': 'YYYY-MM-DD', 'data': [row]} sorted by day
+        :return: number of appended days
+        """
+        tables = []
+        for day_doc in documents:
+            day = datetime.datetime.fromisoformat(day_doc['_id'])
+            rows = [(row.get('country'), {field: _number(row.get(field)) for field in SERIES_FIELDS},
+                     row.get('firstCase') or None) for row in day_doc['data'] if row.get('country')]
+            tables.append((day, rows))
+        docs = self._documents({day.year for day, _ in tables})
+        changed, days = self._store(tables, docs)
+        self._write([docs[key] for key in changed])
+        return len(days)
+
+    def migrate(self) -> int:
+        """
+        appends the daily documents of the covid collection
+        :return: number of migrated days
+        """
+        self.ensure_indexes()
+        return self.store_documents(self.daily.find({}).sort('_id', ASCENDING))
+
+    def series(self, countries: list = None, start: datetime.datetime = None, end: datetime.datetime = None,
+               fields: list = None) -> dict:
+        """
+        decoded series of countries in a date range, only the documents of the years in the range are read
+        :param countries: country names (None = all)
+        :param start: first day (inclusive, None = no lower limit)
+        :param end: last day (exclusive, None = no upper limit)
+        :param fields: columns (default: all of SERIES_FIELDS)
+        :return: {country: {'dates': datetime64[D] array, field: float64 array (NaN = missing)}}
+        """
+        fields = list(fields or SERIES_FIELDS)
+        query = {}
+        if countries is not None:
+            query['country'] = {'$in': list(countries)}
+        if start or end:
+            query['year'] = {}
+            if start:
+                query['year']['$gte'] = start.year
+            if end:
+                query['year']['$lte'] = end.year
+        projection = {'country': 1, 'year': 1, 'days': 1, **{f'values.{field}': 1 for field in fields}}
+        parts = {}
+        for doc in self.collection.find(query, projection).sort([('country', ASCENDING), ('year', ASCENDING)]):
+            dates = np.datetime64(f'{doc["year"]}-01-01') + np.cumsum(np.array(doc['days'], dtype=np.int64))
+            country_parts = parts.setdefault(doc['country'], {'dates': [], **{field: [] for field in fields}})
+            country_parts['dates'].append(dates)
+            for field in fields:
+                country_parts[field].append(_decode(doc['values'][field]))
+
+        result = {}
+        for country, country_parts in parts.items():
+            dates = np.concatenate(country_parts['dates'])
+            selected = np.ones(len(dates), dtype=bool)
+            if start:
+                selected &= dates >= np.datetime64(start.date())
+            if end:
+                selected &= dates < np.datetime64(end.date())
+            result[country] = {name: np.concatenate(values)[selected] for name, values in country_parts.items()}
+        return result
+
+    def matrix(self, field: str, countries: list = None, start: datetime.datetime = None,
+               end: datetime.datetime = None) -> tuple:
+        """
+        one column of several countries on common dates
+        :param field: one of SERIES_FIELDS
+        :param countries: country names (None = all)
+        :param start: first day (inclusive)
+        :param end: last day (exclusive)
+        :return: (datetime64[D] array of the dates, names of the countries, float64 array countries x dates with NaN
+                 where a country has no value)
+        """
+        series = self.series(countries, start, end, [field])
+        names = [country for country in (countries or sorted(series)) if country in series]
+        dates = np.unique(np.concatenate([series[country]['dates'] for country in names])) if names else \
+            np.array([], dtype='datetime64[D]')
+        values = np.full((len(names), len(dates)), np.nan)
+        for row, country in enumerate(names):
+            values[row, np.searchsorted(dates, series[country]['dates'])] = series[country][field]
+        return dates, names, values
@@ -0,0 +1,312 @@
+"""
+long running scraper: every site is crawled on its own interval and the covid table is stored once a day, with one
+http client, MongoDB client and run writer for the whole time instead of a new process per run:
+    python -m datascraping daemon [--no-covid]
+
+the first run of a site is due one interval after its last stored run, sites which are due at the same time are
+staggered. Changes of settings.json are picked up while running (new, removed and changed sites, search terms and
+options). Stops after the current job on SIGINT / SIGTERM.
+"""
+
+import datetime
+import heapq
+import itertools
+import os
+import signal
+import threading
+
+from . import config
+from .archive import PageArchive
+from .backup import BackupSink
+from .dedup import SeenIndex
+from .fetcher import Fetcher
+from .metrics import Metrics
+from .persist import RunWriter, last_updates
+from .rollup import RollupStore
+from .scrape import crawl_site, site_name
+from .storage import BucketStore
+from .term_index import TermIndex
+
+# settings sections the shared clients and stores are created from
+CLIENT_SECTIONS = ('fetch', 'cache', 'retry', 'storage', 'rollup', 'term_index', 'archive', 'backup')
+
+
+class Job:
+    """
+    scheduled task: crawling one site or storing the covid table
+    """
+
+    def __init__(self, name: str, site_item: dict = None):
+        """
+        :param name: site name or 'covid'
+        :param site_item: entry of search_sites (None for the covid job)
+        """
+        self.name = name
+        self.site_item = site_item
+        # jobs replaced after a settings change stay in the heap and are skipped when they are due
+        self.cancelled = False
+
+
+def site_interval(site_item: dict, settings: dict) -> datetime.timedelta:
+    """
+    time between two runs of a site: "interval_hours" of the site or of the "daemon" section (default 3)
+    :param site_item: entry of search_sites
+    :param settings: whole settings.json content
+    :return:
+    """
+    hours = site_item.get('interval_hours', settings.get('daemon', {}).get('interval_hours', 3))
+    return datetime.timedelta(hours=float(hours))
+
+
+def next_daily(at: str, now: datetime.datetime) -> datetime.datetime:
+    """
+    next time of day after now
+    :param at: HH:MM
+    :param now:
+    :return:
+    """
+    hour, minute = (int(part) for part in at.split(':'))
+    due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return due if due > now else due + datetime.timedelta(days=1)
+
+
+class Daemon:
+    """
+    schedules the sites of settings.json with a heap of (due time, job)
+    """
+
+    def __init__(self, config_path: str = config.CONFIG_FILE, settings_path: str = config.SETTINGS_FILE,
+                 covid: bool = True):
+        """
+        :param config_path: config.ini
+        :param settings_path: settings.json, read again when it changes
+        :param covid: store the covid table every day
+        """
+        self.config_path = config_path
+        self.settings_path = settings_path
+        self.covid = covid
+        self.db = config.get_database(config_path)
+        self.col_name = config.collection_name('worduse_coll', config_path)
+        self.settings = None
+        self.settings_mtime = None
+        self.jobs = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._stop = threading.Event()
+        self.fetcher = self.run_writer = self.term_index = self.archive = self.backup = None
+        # runs a closed writer could not save (e.g. the database was down), written by the next writer
+        self.unsaved_runs = []
+        # counters of the whole lifetime, worduse.prom is written after every job and the json file when stopping
+        self.metrics = Metrics()
+
+    def stop(self, *_):
+        print('stopping after the current job')
+        self._stop.set()
+
+    def schedule(self, job: Job, due: datetime.datetime):
+        self.jobs[job.name] = job
+        heapq.heappush(self._heap, (due, next(self._sequence), job))
+
+    def open_clients(self):
+        """
+        creates the shared http client, run writer and stores from the current settings, the new writer saves the
+        unsaved runs of the previous one
+        :return:
+        """
+        settings = self.settings
+        bucket_store = BucketStore.from_settings(self.db, self.col_name, settings)
+        if bucket_store:
+            bucket_store.ensure_indexes()
+        rollup_store = RollupStore.from_settings(self.db, self.col_name, settings)
+        if rollup_store:
+            rollup_store.ensure_indexes()
+        self.fetcher = Fetcher.from_settings(settings)
+        self.run_writer = RunWriter(self.db, self.col_name, bucket_store, metrics=self.metrics,
+                                    rollup_store=rollup_store)
+        self.term_index = TermIndex.from_settings(settings)
+        self.archive = PageArchive.from_settings(settings)
+        self.backup = BackupSink.from_settings(settings)
+        unsaved_runs, self.unsaved_runs = self.unsaved_runs, []
+        for name, url, run in unsaved_runs:
+            self.run_writer.add(name, url, run)
+
+    def close_clients(self) -> list:
+        """
+        closes the shared clients and stores
+        :return: runs the writer could not save (they are in the backup), [(site name, site url, run)]
+        """
+        if self.fetcher is None:
+            return []
+        self.fetcher.close()
+        failed_runs = []
+        try:
+            print(f'saved {self.run_writer.close()} run(s) to the database')
+        except RuntimeError:
+            failed_runs = self.run_writer.take_failed()
+            print(f'{len(failed_runs)} run(s) could not be saved yet ({self.run_writer.error})')
+        finally:
+            # stores after a failed open_clients may be missing
+            for store in (self.backup, self.term_index, self.archive):
+                if store:
+                    store.close()
+            self.fetcher = self.run_writer = self.term_index = self.archive = self.backup = None
+        return failed_runs
+
+    def load_settings(self, now: datetime.datetime):
+        """
+        reads settings.json if it changed and schedules new or changed sites, the clients are created again if one of
+        their sections changed
+        :param now:
+        :return:
+        """
+        try:
+            mtime = os.stat(self.settings_path).st_mtime
+        except OSError as e:
+            # e.g. an editor replaces the file while saving, it is read again with the next check
+            if self.settings is None:
+                raise SystemExit(f'settings file not found: {self.settings_path}')
+            print(f'{self.settings_path} cannot be read, keeping the previous settings: {e}')
+            return
+        if mtime == self.settings_mtime and self.fetcher is not None:
+            return
+        self.settings_mtime = mtime
+        try:
+            settings = config.load_settings(self.settings_path)
+        except (ValueError, SystemExit) as e:
+            if self.settings is None:
+                raise SystemExit(f'{self.settings_path} is not valid: {e}')
+            if isinstance(e, SystemExit):
+                # removed after the check, read again next time
+                self.settings_mtime = None
+            print(f'{self.settings_path} is not valid, keeping the previous settings: {e}')
+            return
+        previous, self.settings = self.settings, settings
+        print(f'{"reloaded" if previous else "loaded"} {self.settings_path}: {len(settings["search_sites"])} sites, '
+              f'{len(settings["search_terms"])} search terms')
+        if self.fetcher is None or any(previous.get(section) != settings.get(section) for section in CLIENT_SECTIONS):
+            self.unsaved_runs.extend(self.close_clients())
+            self.open_clients()
+
+        site_items = {}
+        for site_item in settings['search_sites']:
+            if 'url' not in site_item:
+                print('settings file keys cannot be found')
+                continue
+            site_items[site_name(site_item['url'], site_item.get('name'))] = site_item
+        for name, job in list(self.jobs.items()):
+            if job.site_item is not None and (name not in site_items or site_items[name] != job.site_item):
+                job.cancelled = True
+                del self.jobs[name]
+
+        stagger = datetime.timedelta(minutes=float(settings.get('daemon', {}).get('stagger_minutes', 5)))
+        new_sites = [name for name in site_items if name not in self.jobs]
+        updated = last_updates(self.db[self.col_name], new_sites)
+        # sites due at the same time start stagger apart
+        due_times = [due for due, _, job in self._heap if not job.cancelled and job.site_item is not None]
+        for name in new_sites:
+            last_updated = updated.get(name)
+            due = max(last_updated + site_interval(site_items[name], settings) if last_updated else now, now)
+            while any(abs(due - other) < stagger for other in due_times):
+                due += stagger
+            due_times.append(due)
+            self.schedule(Job(name, site_items[name]), due)
+            print(f'{name}: next run at {due:%Y-%m-%d %H:%M:%S}')
+
+        if self.covid and 'covid' not in self.jobs:
+            self.schedule(Job('covid'), now)
+
+    def run_site(self, job: Job, now: datetime.datetime):
+        """
+        crawls a site and saves its run, the next run is scheduled one interval later
+        :param job:
+        :param now:
+        :return:
+        """
+        interval = site_interval(job.site_item, self.settings)
+        # another process (e.g. the scrape command) may have stored a run in the meantime
+        last_updated = last_updates(self.db[self.col_name], [job.name]).get(job.name)
+        if last_updated and last_updated + interval > now:
+            print(f'{job.name} was updated at {last_updated}, next run at {last_updated + interval:%H:%M:%S}')
+            self.schedule(job, last_updated + interval)
+            return
+        seen_index = SeenIndex.from_settings(self.settings)
+        # the summary stored with the run only contains this job, the totals are added to the daemon's metrics
+        metrics = Metrics()
+        try:
+            result = crawl_site(job.site_item, now, self.fetcher, seen_index, metrics, self.settings, self.term_index,
+                                self.archive)
+        finally:
+            seen_index.close()
+        if result['run'] is None:
+            print(f'{job.name}: skipped ({result["error"]})')
+        else:
+            self.backup.write_run(result['name'], result['url'], result['run'])
+            self.run_writer.add(result['name'], result['url'], result['run'])
+            print(f'{job.name}: {result["seconds"]:.1f}s, '
+                  f'{result["run"]["mainPageArticles"]["totalArticles"]} articles')
+        self.metrics.merge(metrics.to_dict())
+        self.metrics.export_prometheus(self.settings.get('metrics', {}).get('directory', './metrics'))
+        if self.fetcher.cache:
+            removed = self.fetcher.cache.maybe_evict()
+            if removed is not None:
+                print(f'removed {removed} entries from the http cache')
+        if self.run_writer.failed:
+            # e.g. the database was not reachable, the writer tries them again with the next runs
+            print(f'{self.run_writer.retry_failed()} run(s) could not be saved yet ({self.run_writer.error}), '
+                  f'retrying')
+        self.schedule(job, now + interval)
+
+    def run_covid(self, job: Job, now: datetime.datetime):
+        from . import covid
+        from .covid_series import CovidSeriesStore
+
+        daemon_settings = self.settings.get('daemon', {})
+        col_name = config.collection_name('covid_coll', self.config_path)
+        covid.run(self.db, col_name, url=daemon_settings.get('covid_url', covid.COVID_URL),
+                  backup=BackupSink.from_settings(self.settings, 'covid'),
+                  series_store=CovidSeriesStore.from_settings(self.db, col_name, self.settings))
+        self.schedule(job, next_daily(daemon_settings.get('covid_at', '06:00'), now))
+
+    def run_forever(self):
+        """
+        runs the due jobs until stopped, settings.json is checked for changes every check_seconds
+        :return:
+        """
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            while not self._stop.is_set():
+                now = datetime.datetime.now()
+                try:
+                    self.load_settings(now)
+                except Exception as e:  # e.g. the database is down while the clients are created again
+                    if self.settings is None:
+                        raise
+                    print(f'applying {self.settings_path} failed, trying again: {type(e).__name__}: {e}')
+                    self.unsaved_runs.extend(self.close_clients())
+                if self.fetcher is not None and self._heap and self._heap[0][0] <= now:
+                    _, _, job = heapq.heappop(self._heap)
+                    if job.cancelled:
+                        continue
+                    print(f'-> {job.name} at {now:%Y-%m-%d %H:%M:%S}')
+                    try:
+                        if job.site_item is None:
+                            self.run_covid(job, now)
+                        else:
+                            self.run_site(job, now)
+                    except Exception as e:  # the daemon keeps running, the job is tried again next time
+                        print(f'{job.name} failed: {type(e).__name__}: {e}')
+                        self.schedule(job, now + (site_interval(job.site_item, self.settings) if job.site_item
+                                                  else datetime.timedelta(hours=1)))
+                    continue
+                check_seconds = float(self.settings.get('daemon', {}).get('check_seconds', 30))
+                wait = check_seconds if not self._heap or self.fetcher is None else \
+                    min(check_seconds, (self._heap[0][0] - now).total_seconds())
+                self._stop.wait(max(wait, 0))
+        finally:
+            self.unsaved_runs.extend(self.close_clients())
+            if self.unsaved_runs:
+                print(f'{len(self.unsaved_runs)} run(s) could not be saved, write them from the backup with: '
+                      f'python -m datascraping restore')
+            self.metrics.export(self.settings.get('metrics', {}).get('directory', './metrics') if self.settings
+                                else './metrics', datetime.datetime.now())
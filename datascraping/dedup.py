@@ -0,0 +1,126 @@
+"""
+url canonicalization and an index of already counted articles, so every article is fetched and counted once per run
+(and, in incremental mode, only once at all)
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+
+# query parameters that only track where a click came from
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', 'xtor', '_ga',
+                   'wt_mc', 'wt.mc_id', 'ns_campaign', 'ns_mchannel', 'ns_source', 'ns_linkname', 'ns_fee',
+                   'at_medium', 'at_campaign', 'at_custom1', 'at_custom2', 'at_custom3', 'at_custom4'}
+TRACKING_PREFIXES = ('utm_',)
+
+
+def canonicalize_url(href: str, base_url: str = None):
+    """
+    resolves a (relative) href against base_url and removes fragments, tracking parameters and default ports
+    :param href:
+    :param base_url: url of the page the href was found on
+    :return: absolute canonical url or None if href is not an http(s) link
+    """
+    href = str(href).strip()
+    if not href:
+        return None
+    url = urljoin(base_url, href) if base_url else href
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ('http', 'https'):
+        return None
+    netloc = parts.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)]
+    return urlunsplit((scheme, netloc, parts.path or '/', urlencode(query), ''))
+
+
+class SeenIndex:
+    """
+    remembers which article urls were counted in this run and (optionally persistent, SQLite) in earlier runs
+    """
+
+    def __init__(self, path: str = None, incremental: bool = False, claims_path: str = None):
+        """
+        :param path: SQLite file of the persistent index (None = only deduplicate within this run)
+        :param incremental: skip articles that were already counted in an earlier run
+        :param claims_path: SQLite file with the claims of this run, shared by the processes crawling in parallel
+                            (None = claims are only kept in this process)
+        """
+        self.path = path
+        self.incremental = incremental
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self._db = None
+        self._claims = None
+        if claims_path:
+            # several processes insert into the same file, a writer waits for the others up to timeout seconds
+            self._claims = sqlite3.connect(claims_path, timeout=60, check_same_thread=False)
+            self._claims.execute('CREATE TABLE IF NOT EXISTS claims (url TEXT PRIMARY KEY)')
+            self._claims.commit()
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS seen ('
+                             'url TEXT PRIMARY KEY, site TEXT, first_seen TEXT, last_seen TEXT)')
+            self._db.commit()
+
+    @classmethod
+    def from_settings(cls, settings: dict, claims_path: str = None):
+        """
+        creates the index from the "dedup" section of settings.json
+        :param settings: whole settings.json content
+        :param claims_path: shared claims of this run (see __init__)
+        :return:
+        """
+        dedup_settings = settings.get('dedup', {})
+        return cls(path=dedup_settings.get('path'), incremental=bool(dedup_settings.get('incremental', False)),
+                   claims_path=claims_path)
+
+    def claim(self, url: str) -> bool:
+        """
+        checks if an article should be fetched and counted by the caller
+        :param url: canonical article url
+        :return: False if it was already claimed in this run (or counted in an earlier run in incremental mode)
+        """
+        with self._lock:
+            if url in self._claimed:
+                return False
+            if self.incremental and self._db:
+                if self._db.execute('SELECT 1 FROM seen WHERE url = ?', (url,)).fetchone():
+                    return False
+            self._claimed.add(url)
+            if self._claims:
+                # claimed by another process of this run
+                claimed = self._claims.execute('INSERT OR IGNORE INTO claims (url) VALUES (?)', (url,)).rowcount == 1
+                self._claims.commit()
+                return claimed
+            return True
+
+    def mark(self, url: str, site: str):
+        """
+        stores that an article was counted
+        :param url: canonical article url
+        :param site: name of the site the article was found on
+        :return:
+        """
+        if not self._db:
+            return
+        now = datetime.datetime.now().isoformat()
+        with self._lock:
+            self._db.execute('INSERT INTO seen (url, site, first_seen, last_seen) VALUES (?, ?, ?, ?) '
+                             'ON CONFLICT(url) DO UPDATE SET last_seen = excluded.last_seen', (url, site, now, now))
+            self._db.commit()
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+        if self._claims:
+            self._claims.close()
+            self._claims = None
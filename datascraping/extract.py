@@ -0,0 +1,191 @@
+"""
+single pass extraction of the <article> tags of a page into compact records,
+either from a parsed BeautifulSoup tree or incrementally from a stream of response chunks
+"""
+
+from collections import Counter, namedtuple
+from contextlib import nullcontext
+
+from bs4 import SoupStrainer
+from lxml import etree
+
+from .dedup import canonicalize_url
+from .matcher import TermMatcher, tokenize
+
+# only <article> subtrees are ever read, everything else is skipped while parsing
+ARTICLE_STRAINER = SoupStrainer('article')
+
+# title: article title (or 'no title'), link: resolved article url (or None),
+# counts: {search term: occurrences}, token_count: number of words in the article,
+# frequencies: Counter of all words (only if requested for the term index, else None)
+ArticleRecord = namedtuple('ArticleRecord', ['title', 'link', 'counts', 'token_count', 'frequencies'],
+                           defaults=(None,))
+
+NO_TITLE = 'no title'
+# BeautifulSoup's get_text() leaves out the content of these tags
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+def resolve_link(href: str, main_url: str):
+    """
+    checks if a href points to an html page below the main page
+    :param href: value of the href attribute (absolute or relative)
+    :param main_url: the main page url
+    :return: canonical absolute article url or None
+    """
+    ret_url = canonicalize_url(href, main_url)
+    main_url = canonicalize_url(main_url)
+    if not ret_url or not main_url or ret_url == main_url or not ret_url.startswith(main_url):
+        return None
+    last_segment = ret_url.split('?')[0].rsplit('/', 1)[-1]
+    link_ending = last_segment.rsplit('.', 1)[-1].lower()
+    if '.' not in last_segment or link_ending == 'html' or link_ending == 'htm':
+        return ret_url
+    return None
+
+
+def _count_words(text: str, matcher: TermMatcher, timer=None, frequencies: bool = False) -> tuple:
+    """
+    tokenizes and counts the text of one article
+    :param text:
+    :param matcher: compiled search terms
+    :param timer: metrics.StageTimer measuring the count stage (optional)
+    :param frequencies: also count every word
+    :return: (counts, number of tokens, Counter of all words or None)
+    """
+    with timer.stage('count') if timer else nullcontext():
+        tokens = tokenize(text)
+        word_frequencies = Counter(tokens) if frequencies else None
+        return matcher.count(tokens, word_frequencies), len(tokens), word_frequencies
+
+
+def extract_article(article, main_url: str, title_attr: str, matcher: TermMatcher, timer=None,
+                    frequencies: bool = False) -> ArticleRecord:
+    """
+    reads title, link and word counts of one <article> tag with a single walk over its <a> tags
+    :param article: BeautifulSoup Pageelement <article>
+    :param main_url: the main page url
+    :param title_attr: attribute of the <a> tag holding the title
+    :param matcher: compiled search terms
+    :param timer: metrics.StageTimer measuring the count stage (optional)
+    :param frequencies: also count every word (ArticleRecord.frequencies)
+    :return:
+    """
+    title = None
+    link = None
+    for a_tag in article.find_all('a'):
+        if title is None and a_tag.has_attr(title_attr):
+            title = a_tag[title_attr]
+        if link is None and a_tag.has_attr('href'):
+            link = resolve_link(a_tag['href'], main_url)
+        if title is not None and link is not None:
+            break
+    counts, token_count, word_frequencies = _count_words(article.get_text(), matcher, timer, frequencies)
+    return ArticleRecord(title if title is not None else NO_TITLE, link, counts, token_count, word_frequencies)
+
+
+def extract_articles(html, main_url: str, title_attr: str, matcher: TermMatcher, timer=None,
+                     frequencies: bool = False) -> list:
+    """
+    extracts all <article> tags of a parsed page
+    :param html: BeautifulSoup of the page
+    :param main_url: the main page url
+    :param title_attr: attribute of the <a> tag holding the title
+    :param matcher: compiled search terms
+    :param timer: metrics.StageTimer measuring the count stage (optional)
+    :param frequencies: also count every word (ArticleRecord.frequencies)
+    :return: list of ArticleRecord in page order
+    """
+    return [extract_article(article, main_url, title_attr, matcher, timer, frequencies)
+            for article in html.find_all('article')]
+
+
+def _element_text(element) -> str:
+    """
+    text of an lxml element like BeautifulSoup's get_text() (no comments, scripts or styles)
+    :param element:
+    :return:
+    """
+    parts = []
+
+    def walk(node):
+        if isinstance(node.tag, str) and node.tag not in SKIPPED_TEXT_TAGS:
+            if node.text:
+                parts.append(node.text)
+            for child in node:
+                walk(child)
+                if child.tail:
+                    parts.append(child.tail)
+
+    walk(element)
+    return ''.join(parts)
+
+
+def _record_from_element(element, main_url: str, title_attr: str, matcher: TermMatcher, timer=None,
+                         frequencies: bool = False) -> ArticleRecord:
+    title = None
+    link = None
+    for a_tag in element.iter('a'):
+        if title is None and a_tag.get(title_attr) is not None:
+            title = a_tag.get(title_attr)
+        if link is None and a_tag.get('href') is not None:
+            link = resolve_link(a_tag.get('href'), main_url)
+        if title is not None and link is not None:
+            break
+    counts, token_count, word_frequencies = _count_words(_element_text(element), matcher, timer, frequencies)
+    return ArticleRecord(title if title is not None else NO_TITLE, link, counts, token_count, word_frequencies)
+
+
+def stream_articles(chunks, main_url: str, title_attr: str, matcher: TermMatcher, encoding: str = None,
+                    max_bytes: int = None, timer=None, frequencies: bool = False):
+    """
+    parses a page incrementally and yields a record as soon as an <article> tag is closed,
+    the parsed elements are dropped afterwards so only the currently open article is kept in memory
+    :param chunks: iterable of bytes (e.g. response.iter_content())
+    :param main_url: the main page url
+    :param title_attr: attribute of the <a> tag holding the title
+    :param matcher: compiled search terms
+    :param encoding: charset of the page, detected by lxml if None
+    :param max_bytes: stop reading after this many bytes (None = no limit)
+    :param timer: metrics.StageTimer measuring the count stage (optional)
+    :param frequencies: also count every word (ArticleRecord.frequencies)
+    :return: generator of ArticleRecord in page order
+    """
+    parser = etree.HTMLPullParser(events=('start', 'end'), tag='article', encoding=encoding)
+    # start index of the open articles; nested articles are finished first, but are yielded in page order
+    open_articles = []
+    finished = []
+    started = 0
+    received = 0
+
+    def handle_events():
+        nonlocal started
+        for event, element in parser.read_events():
+            if event == 'start':
+                open_articles.append(started)
+                started += 1
+                continue
+            record = _record_from_element(element, main_url, title_attr, matcher, timer, frequencies)
+            finished.append((open_articles.pop(), record))
+            if not open_articles:
+                # drop the finished article and everything parsed before it
+                element.clear()
+                parent = element.getparent()
+                while parent is not None and element.getprevious() is not None:
+                    del parent[0]
+
+    for chunk in chunks:
+        received += len(chunk)
+        if max_bytes and received > max_bytes:
+            print(f'page {main_url} is larger than {max_bytes} bytes, only the first part is used')
+            break
+        parser.feed(chunk)
+        handle_events()
+        if not open_articles and finished:
+            finished.sort(key=lambda item: item[0])
+            yield from (record for _, record in finished)
+            finished.clear()
+    parser.close()
+    handle_events()
+    finished.sort(key=lambda item: item[0])
+    yield from (record for _, record in finished)
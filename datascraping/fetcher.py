@@ -0,0 +1,204 @@
+"""
+shared http client for the scrapers: one keep-alive connection pool per host,
+a limit of parallel requests per host and a politeness delay between requests to the same host
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from email.message import Message
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .http_cache import HttpCache
+from .retry import RETRY_STATUSES, CircuitBreaker, FetchError, RetryPolicy, parse_retry_after
+
+
+def host_of(url: str) -> str:
+    """
+    returns the lowercase host of an url (used as key for pools and limits)
+    :param url:
+    :return:
+    """
+    return urlsplit(url).netloc.lower()
+
+
+def declared_charset(headers) -> str:
+    """
+    charset of the Content-Type header, unlike requests no ISO-8859-1 fallback is assumed
+    :param headers: response headers
+    :return: None if the server did not declare a charset
+    """
+    message = Message()
+    message['content-type'] = headers.get('Content-Type', '')
+    return message.get_param('charset')
+
+
+class _HostState:
+    """
+    session, semaphore and timing information of a single host
+    """
+
+    def __init__(self, concurrency: int, delay: float):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(concurrency, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.slots = threading.BoundedSemaphore(max(concurrency, 1))
+        self.lock = threading.Lock()
+        self.next_request = 0.0
+
+
+class Fetcher:
+    """
+    handles http requests for all sites of a run
+    """
+
+    def __init__(self, concurrency: int = 1, delay: float = 0.1, host_limits: dict = None, cache: HttpCache = None,
+                 streaming: bool = False, max_page_mb: float = None, retry: RetryPolicy = None,
+                 breaker: CircuitBreaker = None):
+        """
+        :param concurrency: default number of parallel requests per host
+        :param delay: default minimum time (s) between two requests to the same host
+        :param host_limits: {host: {'concurrency': int, 'delay': float}} overrides
+        :param cache: optional response cache for conditional requests
+        :param streaming: parse pages incrementally while downloading instead of building a whole tree
+        :param max_page_mb: pages larger than this are cut off in streaming mode (None = no limit)
+        :param retry: retry policy for connection errors, timeouts, 429 and 5xx responses
+        :param breaker: per host circuit breaker
+        """
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache
+        self.streaming = streaming
+        self.max_page_bytes = int(max_page_mb * 1024 * 1024) if max_page_mb else None
+        self.concurrency = concurrency
+        self.delay = delay
+        self.host_limits = dict(host_limits or {})
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings: dict):
+        """
+        creates a fetcher from the "fetch" section of settings.json and the per site overrides
+        :param settings: whole settings.json content
+        :return:
+        """
+        fetch_settings = settings.get('fetch', {})
+        retry_settings = settings.get('retry', {})
+        retry = RetryPolicy(max_attempts=int(retry_settings.get('max_attempts', 4)),
+                            base_delay=float(retry_settings.get('base_delay', 1.0)),
+                            max_delay=float(retry_settings.get('max_delay', 60.0)),
+                            url_budget=float(retry_settings.get('url_budget', 120.0)),
+                            run_budget=retry_settings.get('run_budget'))
+        breaker = CircuitBreaker(failure_threshold=int(retry_settings.get('breaker_threshold', 5)),
+                                 reset_after=float(retry_settings.get('breaker_reset', 300.0)))
+        fetcher = cls(concurrency=int(fetch_settings.get('concurrency', 1)),
+                      delay=float(fetch_settings.get('delay', 0.1)),
+                      cache=HttpCache.from_settings(settings),
+                      streaming=bool(fetch_settings.get('streaming', False)),
+                      max_page_mb=fetch_settings.get('max_page_mb'),
+                      retry=retry,
+                      breaker=breaker)
+        for site_item in settings.get('search_sites', []):
+            if 'concurrency' in site_item or 'delay' in site_item:
+                fetcher.set_host_limits(site_item['url'], site_item.get('concurrency'), site_item.get('delay'))
+        return fetcher
+
+    def set_host_limits(self, url: str, concurrency: int = None, delay: float = None):
+        """
+        overrides concurrency and / or delay for the host of url
+        :param url:
+        :param concurrency:
+        :param delay:
+        :return:
+        """
+        limits = self.host_limits.setdefault(host_of(url), {})
+        if concurrency is not None:
+            limits['concurrency'] = int(concurrency)
+        if delay is not None:
+            limits['delay'] = float(delay)
+
+    def concurrency_for(self, url: str) -> int:
+        return self.host_limits.get(host_of(url), {}).get('concurrency', self.concurrency)
+
+    def _host(self, url: str) -> _HostState:
+        host = host_of(url)
+        with self._hosts_lock:
+            state = self._hosts.get(host)
+            if not state:
+                limits = self.host_limits.get(host, {})
+                state = _HostState(limits.get('concurrency', self.concurrency), limits.get('delay', self.delay))
+                self._hosts[host] = state
+        return state
+
+    @contextmanager
+    def slot(self, url: str):
+        """
+        waits for a free request slot of the host and for the politeness delay
+        :param url:
+        :return: session of the host
+        """
+        state = self._host(url)
+        with state.slots:
+            with state.lock:
+                wait = state.next_request - time.monotonic()
+                state.next_request = max(state.next_request, time.monotonic()) + state.delay
+            if wait > 0:
+                time.sleep(wait)
+            yield state.session
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        GET request through the pooled session of the host, retried on connection errors, timeouts, 429 and 5xx
+        :param url:
+        :param kwargs: passed to requests
+        :return: response (any status code that is not retried)
+        :raises FetchError: if the retry policy gives up, the circuit breaker skips the host or the request fails in a
+                            way that is not retried
+        """
+        host = host_of(url)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if not self.breaker.allow(host):
+                raise FetchError(url, 'host is skipped after repeated failures')
+            retry_after = None
+            try:
+                with self.slot(url) as session:
+                    response = session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                reason = type(e).__name__
+            except requests.exceptions.RequestException as e:
+                # e.g. TooManyRedirects, InvalidURL or a broken body, a problem of this url which a retry does not fix
+                raise FetchError(url, f'{type(e).__name__}: {e}') from e
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success(host)
+                    return response
+                reason = f'status code {response.status_code}'
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                response.close()
+
+            self.breaker.record_failure(host)
+            attempt += 1
+            if attempt >= self.retry.max_attempts:
+                raise FetchError(url, f'{reason} after {attempt} attempts')
+            delay = self.retry.backoff(attempt, retry_after)
+            if time.monotonic() - started + delay > self.retry.url_budget:
+                raise FetchError(url, f'{reason}, time budget of the url used up')
+            if not self.retry.reserve(delay):
+                raise FetchError(url, f'{reason}, retry budget of the run used up')
+            print(f'{reason} for {url}, retry in {delay:.1f} seconds')
+            time.sleep(delay)
+
+    def close(self):
+        with self._hosts_lock:
+            for state in self._hosts.values():
+                state.session.close()
+            self._hosts = {}
@@ -0,0 +1,297 @@
+"""
+persistent http response cache for conditional requests (ETag / Last-Modified)
+
+layout of the cache directory:
+    entries/<sha1 of normalized url>.json   validators and metadata of an url
+    objects/<sha256[:2]>/<sha256>           response bodies, stored once per content
+    tmp/                                    files being written, moved into entries / objects when complete
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# temporary files older than this were left by a killed process and are removed by evict
+STALE_TMP_SECONDS = 3600
+
+
+def normalize_url(url: str) -> str:
+    """
+    normalizes an url for use as cache key (lowercase scheme and host, no default port, sorted query, no fragment)
+    :param url:
+    :return:
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def _write_atomic(path: str, data: bytes, tmp_dir: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class HttpCache:
+    """
+    content addressed on disk cache keyed by normalized url
+    """
+
+    def __init__(self, directory: str = './cache/http', max_size_mb: float = 500, max_age_hours: float = 72,
+                 evict_minutes: float = 60):
+        """
+        :param directory:
+        :param max_size_mb:
+        :param max_age_hours:
+        :param evict_minutes: time between two evictions of long running processes (see maybe_evict)
+        """
+        self.directory = directory
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_hours * 3600
+        self.evict_seconds = evict_minutes * 60
+        self._lock = threading.Lock()
+        self._last_evicted = time.monotonic()
+        os.makedirs(os.path.join(directory, 'entries'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        self.tmp_dir = os.path.join(directory, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings: dict):
+        """
+        creates the cache from the "cache" section of settings.json
+        :param settings: whole settings.json content
+        :return: None if caching is not configured
+        """
+        cache_settings = settings.get('cache')
+        if not cache_settings:
+            return None
+        return cls(directory=cache_settings.get('directory', './cache/http'),
+                   max_size_mb=float(cache_settings.get('max_size_mb', 500)),
+                   max_age_hours=float(cache_settings.get('max_age_hours', 72)),
+                   evict_minutes=float(cache_settings.get('evict_minutes', 60)))
+
+    def _entry_path(self, url: str) -> str:
+        key = hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'entries', f'{key}.json')
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def _read_entry(self, url: str):
+        try:
+            with open(self._entry_path(url), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def conditional_headers(self, url: str) -> dict:
+        """
+        request headers to revalidate the cached response of url
+        :param url:
+        :return: empty dict if url is not cached
+        """
+        entry = self._read_entry(url)
+        if not entry or time.time() - entry['storedAt'] > self.max_age:
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('lastModified'):
+            headers['If-Modified-Since'] = entry['lastModified']
+        return headers
+
+    def store(self, url: str, response):
+        """
+        stores a 200 response if it has validators (ETag or Last-Modified)
+        :param url:
+        :param response: requests response
+        :return:
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        self.store_body(url, response.content, response.encoding or response.apparent_encoding,
+                        etag=etag, last_modified=last_modified)
+
+    def store_chunks(self, url: str, response, chunks, encoding: str = None):
+        """
+        passes the chunks of a streamed 200 response through and stores the body once the stream was read completely,
+        the body is written to a temporary file instead of being kept in memory
+        :param url:
+        :param response: requests response (stream=True)
+        :param chunks: iterable of bytes
+        :param encoding: charset declared by the server (None = detected by the parser)
+        :return: generator of the same chunks
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            yield from chunks
+            return
+        digest = hashlib.sha256()
+        size = 0
+        complete = False
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if not complete:
+                os.remove(tmp_path)
+        object_path = self._object_path(digest.hexdigest())
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.replace(tmp_path, object_path)
+        self._write_entry(url, digest.hexdigest(), size, encoding, etag, last_modified)
+
+    def store_body(self, url: str, body: bytes, encoding: str, etag: str = None, last_modified: str = None):
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            _write_atomic(object_path, body, self.tmp_dir)
+        self._write_entry(url, digest, len(body), encoding, etag, last_modified)
+
+    def _write_entry(self, url: str, digest: str, size: int, encoding: str, etag: str, last_modified: str):
+        now = time.time()
+        entry = {
+            'url': normalize_url(url),
+            'etag': etag,
+            'lastModified': last_modified,
+            'encoding': encoding,
+            'digest': digest,
+            'size': size,
+            'storedAt': now,
+            'usedAt': now
+        }
+        _write_atomic(self._entry_path(url), json.dumps(entry).encode('utf-8'), self.tmp_dir)
+
+    def load_body(self, url: str):
+        """
+        loads the cached body of url (after a 304 response) and marks it as used
+        :param url:
+        :return: (body bytes, encoding) or None if the entry or its body is gone
+        """
+        entry = self._read_entry(url)
+        if not entry:
+            return None
+        try:
+            with open(self._object_path(entry['digest']), 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        entry['usedAt'] = time.time()
+        _write_atomic(self._entry_path(url), json.dumps(entry).encode('utf-8'), self.tmp_dir)
+        return body, entry.get('encoding')
+
+    def load(self, url: str):
+        """
+        loads the cached body of url as text
+        :param url:
+        :return: decoded text or None if the entry or its body is gone
+        """
+        cached = self.load_body(url)
+        if cached is None:
+            return None
+        body, encoding = cached
+        return body.decode(encoding or 'utf-8', errors='replace')
+
+    def evict(self):
+        """
+        removes entries older than max age, then the least recently used entries until the cache fits max size,
+        then all bodies that are not referenced anymore and temporary files left by killed processes
+        :return: number of removed entries
+        """
+        with self._lock:
+            entries_dir = os.path.join(self.directory, 'entries')
+            now = time.time()
+            entries = []
+            removed = 0
+            for file_name in os.listdir(self.tmp_dir):
+                self._remove_stale(os.path.join(self.tmp_dir, file_name), now)
+            for file_name in os.listdir(entries_dir):
+                path = os.path.join(entries_dir, file_name)
+                if not file_name.endswith('.json'):
+                    # temporary file of an earlier version (written next to the entries)
+                    self._remove_stale(path, now)
+                    continue
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    entry = None
+                if not entry or now - entry['storedAt'] > self.max_age:
+                    os.remove(path)
+                    removed += 1
+                    continue
+                entries.append((entry['usedAt'], path, entry))
+
+            # bodies are shared between urls with the same content, count the references per body
+            references = Counter(entry['digest'] for _, _, entry in entries)
+            sizes = {entry['digest']: entry['size'] for _, _, entry in entries}
+            total = sum(sizes.values())
+            entries.sort(key=lambda item: item[0])
+            for _, path, entry in entries:
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                removed += 1
+                references[entry['digest']] -= 1
+                if references[entry['digest']] == 0:
+                    del references[entry['digest']]
+                    total -= sizes[entry['digest']]
+
+            objects_dir = os.path.join(self.directory, 'objects')
+            for prefix in os.listdir(objects_dir):
+                prefix_dir = os.path.join(objects_dir, prefix)
+                if not os.path.isdir(prefix_dir):
+                    # temporary file of an earlier version (streamed bodies were written into objects/)
+                    self._remove_stale(prefix_dir, now)
+                    continue
+                for digest in os.listdir(prefix_dir):
+                    if digest.endswith('.tmp'):
+                        self._remove_stale(os.path.join(prefix_dir, digest), now)
+                    elif digest not in references:
+                        os.remove(os.path.join(prefix_dir, digest))
+            self._last_evicted = time.monotonic()
+            return removed
+
+    def maybe_evict(self):
+        """
+        evicts if the last eviction of this process was evict_minutes ago, for the daemon and the workers which run
+        longer than one scrape
+        :return: number of removed entries, None if it was not due
+        """
+        if time.monotonic() - self._last_evicted < self.evict_seconds:
+            return None
+        return self.evict()
+
+    @staticmethod
+    def _remove_stale(path: str, now: float):
+        """
+        removes a temporary file if no process wrote to it for STALE_TMP_SECONDS
+        :param path:
+        :param now:
+        :return:
+        """
+        try:
+            if os.path.isfile(path) and now - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                os.remove(path)
+        except OSError:  # removed by another process in the meantime
+            pass
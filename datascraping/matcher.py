@@ -0,0 +1,123 @@
+"""
+counts many search terms in a single pass over the words of a text
+
+supported search terms:
+    word        exact word (hash lookup)
+    corona*     every word starting with "corona" (prefix trie)
+    covid 19    phrase of several words (Aho-Corasick automaton over words)
+"""
+
+import re
+from collections import Counter
+
+# same separators as the old .lower().replace('\n', ' ').replace('/', ' ').split(' ')
+TOKEN_SPLIT = re.compile(r'[ \n/]+')
+WILDCARD = '*'
+
+
+def tokenize(text: str) -> list:
+    """
+    converts a text into a list of lowercase words
+    :param text:
+    :return:
+    """
+    return [token for token in TOKEN_SPLIT.split(text.lower()) if token]
+
+
+class TermMatcher:
+    """
+    precompiled matcher for a list of search terms
+    """
+
+    def __init__(self, terms: list):
+        self.terms = list(terms)
+        self.words = []
+        # prefix trie: node = [children dict, terms ending here]
+        self.prefix_root = [{}, []]
+        self.has_prefixes = False
+        # phrase automaton: goto transitions, failure links and outputs per state
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.has_phrases = False
+
+        for term in dict.fromkeys(self.terms):
+            parts = [part for part in TOKEN_SPLIT.split(term) if part]
+            if len(parts) > 1:
+                self._add_phrase(term, parts)
+            elif term.endswith(WILDCARD) and len(term) > 1:
+                self._add_prefix(term, term[:-1])
+            else:
+                self.words.append(term)
+        if self.has_phrases:
+            self._build_failure_links()
+
+    def _add_prefix(self, term: str, prefix: str):
+        node = self.prefix_root
+        for char in prefix:
+            node = node[0].setdefault(char, [{}, []])
+        node[1].append(term)
+        self.has_prefixes = True
+
+    def _add_phrase(self, term: str, parts: list):
+        state = 0
+        for part in parts:
+            nxt = self.goto[state].get(part)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[state][part] = nxt
+            state = nxt
+        self.out[state].append(term)
+        self.has_phrases = True
+
+    def _build_failure_links(self):
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for token, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(token, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def count(self, tokens: list, frequencies: Counter = None) -> dict:
+        """
+        counts all search terms in a list of words
+        :param tokens: output of tokenize
+        :param frequencies: Counter of tokens if the caller already has it
+        :return: {term: occurrences} in the order of the search terms
+        """
+        counts = dict.fromkeys(self.terms, 0)
+        if frequencies is None:
+            frequencies = Counter(tokens)
+        for word in self.words:
+            counts[word] = frequencies.get(word, 0)
+
+        if self.has_prefixes:
+            root = self.prefix_root
+            for token, n in frequencies.items():
+                node = root
+                for char in token:
+                    node = node[0].get(char)
+                    if node is None:
+                        break
+                    for term in node[1]:
+                        counts[term] += n
+
+        if self.has_phrases:
+            goto, fail, out = self.goto, self.fail, self.out
+            state = 0
+            for token in tokens:
+                while state and token not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(token, 0)
+                for term in out[state]:
+                    counts[term] += 1
+        return counts
+
+    def count_text(self, text: str) -> dict:
+        return self.count(tokenize(text))
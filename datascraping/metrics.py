@@ -0,0 +1,292 @@
+"""
+timing and throughput metrics of the word use scraper: counters and histograms per site and stage (fetch, parse,
+count, database write), exported at the end of a run as JSON and in the Prometheus text format
+"""
+
+import bisect
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'worduse_'
+# upper bounds (s) of the duration histograms
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGES = ('fetch', 'parse', 'count')
+
+
+class StageTimer:
+    """
+    seconds per stage and downloaded bytes of a single page (one thread), nested stages are subtracted from the
+    enclosing stage so every second is counted once
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.bytes = 0
+        self.from_cache = False
+        self._nested = []
+
+    def add(self, stage: str, seconds: float):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        measures the code inside the with block as stage name
+        :param name:
+        :return:
+        """
+        started = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            nested = self._nested.pop()
+            elapsed = time.perf_counter() - started
+            self.add(name, elapsed - nested)
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def timed_chunks(self, chunks):
+        """
+        counts the bytes of a streamed body and its download time as fetch stage
+        :param chunks: iterator of bytes
+        :return: generator of the same chunks
+        """
+        chunks = iter(chunks)
+        while True:
+            with self.stage('fetch'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            self.bytes += len(chunk)
+            yield chunk
+
+
+class Histogram:
+    """
+    cumulative histogram in the Prometheus layout (counts per upper bound, sum and count)
+    """
+
+    def __init__(self, buckets: tuple = SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: 'Histogram'):
+        if other.buckets != self.buckets:
+            raise ValueError('histograms with different buckets cannot be merged')
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def to_dict(self) -> dict:
+        return {'buckets': list(self.buckets), 'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        histogram = cls(data['buckets'])
+        histogram.counts = list(data['counts'])
+        histogram.sum = data['sum']
+        histogram.count = data['count']
+        return histogram
+
+
+class Metrics:
+    """
+    thread safe registry of labelled counters and histograms
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        increases a counter
+        :param name: metric name without prefix and _total
+        :param value:
+        :param labels:
+        :return:
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        adds a value to a histogram
+        :param name: metric name without prefix
+        :param value:
+        :param labels:
+        :return:
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def record_page(self, site_name: str, kind: str, timer: StageTimer, status: int = None):
+        """
+        stores the stage timings of one fetched page
+        :param site_name:
+        :param kind: page (main page) or article
+        :param timer: timings of the page
+        :param status: http status code (None if the request failed)
+        :return:
+        """
+        for stage in STAGES:
+            if stage in timer.seconds:
+                self.observe(f'{stage}_seconds', timer.seconds[stage], site=site_name, kind=kind)
+        self.inc('downloaded_bytes', timer.bytes, site=site_name, kind=kind)
+        self.inc('requests', site=site_name, kind=kind, status=str(status) if status else 'error')
+        if timer.from_cache:
+            self.inc('cache_hits', site=site_name, kind=kind)
+
+    def site_summary(self, site_name: str) -> dict:
+        """
+        totals of one site, stored alongside its run if configured
+        :param site_name:
+        :return: {'pages', 'downloadedBytes', 'fetchSeconds', 'parseSeconds', 'countSeconds'}
+        """
+        summary = {'pages': 0, 'downloadedBytes': 0}
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                if dict(labels).get('site') != site_name:
+                    continue
+                if name == 'requests':
+                    summary['pages'] += value
+                elif name == 'downloaded_bytes':
+                    summary['downloadedBytes'] += value
+            for stage in STAGES:
+                seconds = sum(histogram.sum for (name, labels), histogram in self.histograms.items()
+                              if name == f'{stage}_seconds' and dict(labels).get('site') == site_name)
+                summary[f'{stage}Seconds'] = round(seconds, 3)
+        return summary
+
+    def merge(self, data: dict):
+        """
+        adds the metrics of another process
+        :param data: output of to_dict
+        :return:
+        """
+        with self._lock:
+            for counter in data['counters']:
+                key = self._key(counter['name'], counter['labels'])
+                self.counters[key] = self.counters.get(key, 0) + counter['value']
+            for entry in data['histograms']:
+                key = self._key(entry['name'], entry['labels'])
+                histogram = Histogram.from_dict(entry)
+                if key in self.histograms:
+                    self.histograms[key].merge(histogram)
+                else:
+                    self.histograms[key] = histogram
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [dict(histogram.to_dict(), name=name, labels=dict(labels))
+                               for (name, labels), histogram in sorted(self.histograms.items())]
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        text exposition format (e.g. for the textfile collector of the node exporter)
+        :return:
+        """
+        data = self.to_dict()
+        lines = []
+        typed = set()
+        for counter in data['counters']:
+            name = f'{PREFIX}{counter["name"]}_total'
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            lines.append(f'{name}{_format_labels(counter["labels"])} {counter["value"]}')
+        for histogram in data['histograms']:
+            name = f'{PREFIX}{histogram["name"]}'
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(histogram["labels"], le=bound)} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(histogram["labels"], le="+Inf")} {histogram["count"]}')
+            lines.append(f'{name}_sum{_format_labels(histogram["labels"])} {histogram["sum"]}')
+            lines.append(f'{name}_count{_format_labels(histogram["labels"])} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def stage_totals(self) -> dict:
+        """
+        seconds per stage over all sites
+        :return:
+        """
+        with self._lock:
+            totals = {}
+            for (name, labels), histogram in self.histograms.items():
+                totals[name] = totals.get(name, 0.0) + histogram.sum
+            return totals
+
+    def export(self, directory: str, now: datetime.datetime) -> tuple:
+        """
+        writes <directory>/worduse_<time>.json and <directory>/worduse.prom (overwritten by every run)
+        :param directory:
+        :param now: creation time of the run
+        :return: (json path, prometheus path)
+        """
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, f'worduse_{now.strftime("%Y%m%d_%H%M%S")}.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.to_dict(), createdAt=now.isoformat()), f, indent=4)
+        return json_path, self.export_prometheus(directory)
+
+    def export_prometheus(self, directory: str) -> str:
+        """
+        writes <directory>/worduse.prom only, e.g. after every job of the daemon
+        :param directory:
+        :return: prometheus path
+        """
+        os.makedirs(directory, exist_ok=True)
+        prom_path = os.path.join(directory, 'worduse.prom')
+        # written to a temporary file first so a collector never reads half a file
+        with open(prom_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(prom_path + '.tmp', prom_path)
+        return prom_path
+
+
+def _format_labels(labels: dict, **extra) -> str:
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
@@ -0,0 +1,269 @@
+"""
+persistence stage of the word use scraper: one query for all throttle checks and a background writer which stores the
+runs with bulk upserts while the next site is fetched
+"""
+
+import datetime
+import threading
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+def last_updates(collection, site_names: list) -> dict:
+    """
+    updatedAt of all sites with a single query
+    :param collection: word use collection (per site documents)
+    :param site_names:
+    :return: {site name: updatedAt}, sites without document are missing
+    """
+    return {doc['_id']: doc.get('updatedAt')
+            for doc in collection.find({'_id': {'$in': list(site_names)}}, {'updatedAt': 1})}
+
+
+def throttled_sites(collection, site_names: list, now: datetime.datetime, hours: float = 3) -> dict:
+    """
+    sites which were updated less than hours ago
+    :param collection: word use collection (per site documents)
+    :param site_names:
+    :param now:
+    :param hours:
+    :return: {site name: updatedAt}
+    """
+    limit = now - datetime.timedelta(hours=hours)
+    return {name: updated for name, updated in last_updates(collection, site_names).items()
+            if updated and updated > limit}
+
+
+def run_key(run_at: datetime.datetime) -> str:
+    """
+    run time as stored in the term index and the page archive, truncated to milliseconds like the dates stored by
+    MongoDB
+    :param run_at:
+    :return:
+    """
+    return run_at.replace(microsecond=run_at.microsecond // 1000 * 1000).isoformat(timespec='milliseconds')
+
+
+class RunWriter:
+    """
+    stores runs in the background, all runs waiting when the writer is free are sent in one bulk_write per collection
+    """
+
+    def __init__(self, db, col_name: str, bucket_store=None, metrics=None, rollup_store=None, max_attempts: int = 5,
+                 retry_seconds: float = 1):
+        """
+        :param db: mongo database
+        :param col_name: name of the word use collection
+        :param bucket_store: storage.BucketStore if runs are stored in buckets
+        :param metrics: metrics.Metrics receiving the write times (optional)
+        :param rollup_store: rollup.RollupStore if the hourly / daily / weekly totals are maintained
+        :param max_attempts: attempts to write a batch before its runs are kept in failed
+        :param retry_seconds: wait before the second attempt, doubled for every further attempt
+        """
+        self.db = db
+        self.col_name = col_name
+        self.bucket_store = bucket_store
+        self.rollup_store = rollup_store
+        self.metrics = metrics
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_seconds = retry_seconds
+        self.written = 0
+        # last write error, runs which could not be written are kept in failed until retry_failed is called, as
+        # (site name, site url, run, operations which are not applied yet)
+        self.error = None
+        self.failed = []
+        self._pending = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._work, name='run-writer', daemon=True)
+        self._thread.start()
+
+    def operations(self, site_name: str, site_url: str, run: dict) -> list:
+        """
+        upserts storing one run, writing them again does not change the stored run or the rollups
+        :param site_name:
+        :param site_url:
+        :param run: run structure with createdAt
+        :return: [(collection name, UpdateOne)]
+        """
+        rollup_operations = []
+        if self.rollup_store:
+            rollup_operations = [(self.rollup_store.collection.name, operation)
+                                 for operation in self.rollup_store.run_operations(site_name, run)]
+        if self.bucket_store:
+            *bucket_operations, site_update = self.bucket_store.run_operations(site_name, site_url, run)
+            return [(self.bucket_store.collection.name, operation) for operation in bucket_operations] + \
+                [(self.col_name, site_update)] + rollup_operations
+        # the run is only pushed if it is not stored yet, so a batch which is written again (e.g. after a timeout of a
+        # write the server applied) does not store it twice
+        return [
+            (self.col_name, UpdateOne({'_id': site_name},
+                                      {'$setOnInsert': {'url': site_url, 'createdAt': run['createdAt'], 'data': []}},
+                                      upsert=True)),
+            (self.col_name, UpdateOne({'_id': site_name, 'data.createdAt': {'$ne': run['createdAt']}},
+                                      {'$push': {'data': run}, '$set': {'updatedAt': run['createdAt']}}))
+        ] + rollup_operations
+
+    def add(self, site_name: str, site_url: str, run: dict):
+        """
+        queues one run for writing
+        :param site_name:
+        :param site_url:
+        :param run: run structure with createdAt
+        :return:
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('run writer is closed')
+            if not self._thread.is_alive():
+                raise RuntimeError(f'run writer stopped: {self.error}')
+            self._pending.append((site_name, site_url, run, self.operations(site_name, site_url, run)))
+            self._condition.notify()
+
+    def retry_failed(self) -> int:
+        """
+        queues the runs which could not be written again
+        :return: number of queued runs
+        """
+        with self._condition:
+            failed, self.failed = self.failed, []
+            self._pending = failed + self._pending
+            self._condition.notify()
+        return len(failed)
+
+    def take_failed(self) -> list:
+        """
+        removes the runs which could not be written, e.g. to add them to a new writer after the settings changed
+        :return: [(site name, site url, run)]
+        """
+        with self._condition:
+            failed, self.failed = self.failed, []
+        return [(site_name, site_url, run) for site_name, site_url, run, _ in failed]
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                batch, self._pending = self._pending, []
+                if not batch and self._closed:
+                    return
+            delay = self.retry_seconds
+            for attempt in range(1, self.max_attempts + 1):
+                batch, error = self._write(batch)
+                if error is None:
+                    break
+                self.error = error
+                print(f'saving {len(batch)} run(s) failed (attempt {attempt} of {self.max_attempts}): '
+                      f'{type(error).__name__}: {error}')
+                if attempt < self.max_attempts:
+                    time.sleep(delay)
+                    delay *= 2
+            else:
+                with self._condition:
+                    self.failed.extend(batch)
+
+    def _write(self, batch: list) -> tuple:
+        """
+        writes a batch with one bulk_write per collection
+        :param batch: [(site name, site url, run, operations)]
+        :return: (runs which are not completely written, error or None), operations which were written are left out
+                 so a retry does not apply them again
+        """
+        by_collection = {}
+        for *_, run_operations in batch:
+            for collection_name, operation in run_operations:
+                by_collection.setdefault(collection_name, []).append(operation)
+        applied = set()
+        error = None
+        for collection_name, operations in by_collection.items():
+            started = time.perf_counter()
+            try:
+                self.db[collection_name].bulk_write(operations, ordered=True)
+            except BulkWriteError as e:
+                # ordered: the operations before the first failing one were applied
+                write_errors = e.details.get('writeErrors') or [{'index': 0}]
+                applied.update(id(operation) for operation in operations[:write_errors[0]['index']])
+                error = e
+                break
+            except Exception as e:  # e.g. connection errors, retried by _work (the operations are idempotent)
+                error = e
+                break
+            applied.update(id(operation) for operation in operations)
+            if self.metrics:
+                self.metrics.observe('db_write_seconds', time.perf_counter() - started, collection=collection_name)
+        remaining = []
+        for site_name, site_url, run, run_operations in batch:
+            run_operations = [(collection_name, operation) for collection_name, operation in run_operations
+                              if id(operation) not in applied]
+            if run_operations:
+                remaining.append((site_name, site_url, run, run_operations))
+        written = len(batch) - len(remaining)
+        if written:
+            if self.metrics:
+                self.metrics.inc('runs_written', written)
+            self.written += written
+            print(f'saved {written} run(s) to {", ".join(by_collection)}')
+        return remaining, error
+
+    def close(self) -> int:
+        """
+        waits until all queued runs (and once more the failed runs) are written
+        :return: number of written runs
+        :raises RuntimeError: if runs could not be written, they are in the backup and can be restored
+        """
+        self.retry_failed()
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        if self.failed:
+            raise RuntimeError(f'{len(self.failed)} run(s) could not be saved ({type(self.error).__name__}: '
+                               f'{self.error}), write them from the backup with: python -m datascraping restore')
+        return self.written
+
+
+# page kinds of the term index and the page archive and the run field their counts belong to
+KIND_FIELDS = {'main': 'mainPage', 'article': 'mainPageArticles'}
+
+
+def run_count_updates(run_counts: dict, bucket_store=None, col_name: str = None) -> list:
+    """
+    updates writing recomputed counts into the stored runs, runs that are not stored are left out by MongoDB
+    :param run_counts: {(site, run_at): {'mainPage': {term: count}, 'mainPageArticles': {term: count}}}
+    :param bucket_store: storage.BucketStore if runs are stored in buckets
+    :param col_name: name of the word use collection (per site documents)
+    :return: [(collection name, UpdateOne)], two per run
+    """
+    operations = []
+    for (site_name, run_at), fields in run_counts.items():
+        if bucket_store:
+            collection_name, query, path = bucket_store.collection.name, {'site': site_name}, 'runs'
+        else:
+            collection_name, query, path = col_name, {'_id': site_name}, 'data'
+        # one update per field, so every $set only touches one sub document of the matched run
+        for field, counts in fields.items():
+            update = {f'{path}.$.{field}.totalWords.{term}': count for term, count in counts.items()}
+            operations.append((collection_name, UpdateOne(dict(query, **{f'{path}.createdAt': run_at}),
+                                                          {'$set': update})))
+    return operations
+
+
+def print_run_count_totals(run_counts: dict, terms: list):
+    """
+    prints the number of runs and the article counts of every site before recomputed counts are written
+    :param run_counts: {(site, run_at): {'mainPage': {term: count}, 'mainPageArticles': {term: count}}}
+    :param terms: search terms which were counted
+    :return:
+    """
+    totals = {}
+    for (site_name, _), fields in run_counts.items():
+        site_totals = totals.setdefault(site_name, {'runs': 0, 'counts': dict.fromkeys(terms, 0)})
+        site_totals['runs'] += 1
+        for term, count in fields['mainPageArticles'].items():
+            site_totals['counts'][term] += count
+    for site_name, site_totals in sorted(totals.items()):
+        print(f'{site_name}: {site_totals["runs"]} runs, articles: '
+              f'{", ".join(f"{term} {count}" for term, count in site_totals["counts"].items())}')
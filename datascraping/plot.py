@@ -0,0 +1,338 @@
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
+from plotly.offline import plot
+import random
+import datetime
+import hashlib
+import html
+import json
+import os
+import re
+from .query import query_runs
+from .rollup import RollupStore
+from .series import build_matrix, site_series, column_values, downsample, TOTAL_ARTICLES
+
+PLOT_MODES = ('single', 'sites')
+# state of the per site report: digest of the plotted data of every site
+MANIFEST_FILE = 'report.json'
+
+
+def random_color():
+    rgb = [random.randrange(160), random.randrange(50, 100), random.randrange(90, 100)]
+    return f'hsv({int(260+rgb[0])%360},{int(rgb[1]*1)},{int(rgb[2]*1)})'
+
+
+def rgb_to_str(r: int, g: int, b: int) -> str:
+    return f'rgb({r},{g},{b})'
+
+
+def set_colors_for_words(search_terms: list) -> dict:
+    colors = {}
+    word_count = len(search_terms)
+    color_delta = 255/word_count
+    index = 0
+    for sw in search_terms:
+        # set color for words
+         colors[sw] = random_color()
+        #col = int(color_delta * index)
+        #colors[sw] = rgb_to_str(col, col, col)
+        #index += 1
+
+    return colors
+
+
+def term_colors(search_terms: list) -> dict:
+    """
+    colors like set_colors_for_words, but the same for a term in every report so re-rendered sites match the others
+    :param search_terms:
+    :return:
+    """
+    colors = {}
+    for sw in search_terms:
+        rng = random.Random(sw)
+        rgb = [rng.randrange(160), rng.randrange(50, 100), rng.randrange(90, 100)]
+        colors[sw] = f'hsv({int(260+rgb[0])%360},{int(rgb[1])},{int(rgb[2])})'
+    return colors
+
+
+def build_figure(matrix, search_terms: list):
+    """
+    one subplot per site with the total articles and the counts of the search terms
+    :param matrix: output of series.build_matrix
+    :param search_terms:
+    :return: plotly figure
+    """
+    # fig = go.Figure()
+    # titles for graphs (subplots)
+    titles = list(matrix.columns.get_level_values(0).unique())
+    # min and max date to have all xaxis the same start and end date
+    lowest_date = matrix.index[0]
+    highest_date = matrix.index[-1]
+
+    # create figure with subplots
+    fig = make_subplots(rows=len(titles), cols=1, subplot_titles=tuple(titles))
+
+    # index of graph
+    index = 0
+    # color struct for words
+    colors_words = set_colors_for_words(search_terms)
+    show_legend_temp = True
+
+    for site_name in titles:
+        index += 1
+        data_x, site_frame = site_series(matrix, site_name)
+
+        fig.add_trace(
+            go.Scatter(
+                legendgroup='total articles',
+                x=data_x,
+                y=column_values(site_frame, TOTAL_ARTICLES),
+                name='total articles',
+                showlegend=show_legend_temp,
+                line=dict(color='black', width=1),
+                mode='lines', # lines+markers
+            ),
+            row=index,
+            col=1,
+        )
+
+        for search_word in search_terms:
+            data_y = column_values(site_frame, search_word)
+            # add trace (as subplot)
+            fig.add_trace(
+                go.Scatter(
+                    legendgroup=search_word,
+                    x=data_x,
+                    y=data_y,
+                    name=search_word,
+                    showlegend=show_legend_temp,
+                    line=dict(color=colors_words[search_word], width=2),
+                    mode='lines',
+                ),
+                row=index,
+                col=1,
+            )
+
+        # update layout for each subplot
+        show_legend_temp = False
+        fig['layout'][f'xaxis{index}'].update(dict(
+            range=[lowest_date, highest_date],
+            rangemode='normal',
+            showline=True,
+            showgrid=False,
+            showticklabels=True,
+            linecolor='rgb(204, 204, 204)',
+            linewidth=2,
+            ticks='outside',
+            tickfont=dict(
+                family='Arial',
+                size=12,
+                color='rgb(82, 82, 82)',
+            ),
+            tickangle=-45,
+        ))
+        fig['layout'][f'yaxis{index}'].update(dict(
+            showgrid=True,
+            zeroline=False,
+            showline=False,
+            showticklabels=True,
+        ))
+
+    '''fig.update_layout(
+        xaxis=dict(
+            rangemode='normal',
+            showline=True,
+            showgrid=True,
+            showticklabels=True,
+            linecolor='rgb(204, 204, 204)',
+            linewidth=2,
+            ticks='outside',
+            tickfont=dict(
+                family='Arial',
+                size=12,
+                color='rgb(82, 82, 82)',
+            ),
+            tickangle=-45,
+        ),
+        yaxis=dict(
+            showgrid=False,
+            zeroline=False,
+            showline=False,
+            showticklabels=False,
+        ),
+        plot_bgcolor='white'
+    )'''
+
+    # update layout for general figure
+    fig.update_layout(plot_bgcolor='white')
+
+    # config_plot = dict({'scrollZoom': True})
+    # fig.show(config=config_plot)
+    # fig.show()
+    return fig
+
+
+def build_site_figure(dates, site_frame, site_name: str, search_terms: list, colors: dict, max_points: int):
+    """
+    WebGL figure of one site, every trace downsampled to max_points
+    :param dates: output of series.site_series
+    :param site_frame: output of series.site_series
+    :param site_name:
+    :param search_terms:
+    :param colors: {term: color}
+    :param max_points: points per trace (0 = all)
+    :return: plotly figure
+    """
+    fig = go.Figure()
+    x, y = downsample(dates, column_values(site_frame, TOTAL_ARTICLES), max_points)
+    fig.add_trace(go.Scattergl(x=x, y=y, name='total articles', line=dict(color='black', width=1), mode='lines'))
+    for search_word in search_terms:
+        x, y = downsample(dates, column_values(site_frame, search_word), max_points)
+        fig.add_trace(go.Scattergl(x=x, y=y, name=search_word, line=dict(color=colors[search_word], width=2),
+                                   mode='lines'))
+    fig.update_layout(title=site_name, plot_bgcolor='white')
+    fig.update_xaxes(showline=True, showgrid=False, linecolor='rgb(204, 204, 204)', linewidth=2, ticks='outside',
+                     tickfont=dict(family='Arial', size=12, color='rgb(82, 82, 82)'), tickangle=-45)
+    fig.update_yaxes(showgrid=True, zeroline=False, showline=False)
+    return fig
+
+
+def site_file_name(site_name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', site_name) + '.html'
+
+
+def site_digest(dates, site_frame, options: dict) -> str:
+    """
+    fingerprint of the plotted data of a site and the options it was plotted with
+    :param dates: output of series.site_series
+    :param site_frame: output of series.site_series
+    :param options: query and rendering options (terms, measure, ...)
+    :return:
+    """
+    digest = hashlib.sha1(json.dumps(options, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(dates.astype('datetime64[ns]').tobytes())
+    digest.update(site_frame.to_numpy(dtype=float).tobytes())
+    digest.update('|'.join(site_frame.columns).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def write_index(directory: str, manifest: dict):
+    """
+    index.html linking the report of every site
+    :param directory:
+    :param manifest: {site name: {'file', 'lastDate', 'renderedAt', ...}}
+    :return:
+    """
+    rows = ''.join(
+        f'<tr><td><a href="{html.escape(entry["file"])}">{html.escape(site_name)}</a></td>'
+        f'<td>{html.escape(entry["lastDate"])}</td><td>{html.escape(entry["renderedAt"])}</td></tr>\n'
+        for site_name, entry in sorted(manifest.items()))
+    with open(os.path.join(directory, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>word use</title></head><body>\n'
+                f'<h1>word use</h1>\n<table>\n<tr><th>site</th><th>last run</th><th>rendered</th></tr>\n{rows}'
+                f'</table>\n</body></html>\n')
+
+
+def write_site_reports(matrix, search_terms: list, directory: str, max_points: int, options: dict) -> int:
+    """
+    one html file per site sharing one plotly.min.js in directory and an index.html, sites of which the data did not
+    change since the last report are not rendered again
+    :param matrix: output of series.build_matrix
+    :param search_terms:
+    :param directory:
+    :param max_points: points per trace (0 = all)
+    :param options: query options which change the plotted data (part of the digest)
+    :return: number of rendered sites
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    colors = term_colors(search_terms)
+    options = dict(options, terms=search_terms, max_points=max_points)
+    rendered = 0
+    for site_name in matrix.columns.get_level_values(0).unique():
+        dates, site_frame = site_series(matrix, site_name)
+        digest = site_digest(dates, site_frame, options)
+        entry = manifest.get(site_name)
+        if entry and entry['digest'] == digest and os.path.exists(os.path.join(directory, entry['file'])):
+            continue
+        file_name = site_file_name(site_name)
+        fig = build_site_figure(dates, site_frame, site_name, search_terms, colors, max_points)
+        # plotly.min.js is copied into the directory once and referenced by every file
+        pio.write_html(fig, os.path.join(directory, file_name), include_plotlyjs='directory', auto_open=False)
+        manifest[site_name] = {
+            'file': file_name,
+            'digest': digest,
+            'lastDate': str(dates[-1])[:19] if len(dates) else '',
+            'renderedAt': datetime.datetime.now().isoformat(timespec='seconds')
+        }
+        rendered += 1
+        print(f'rendered {site_name} into {file_name}')
+    write_index(directory, manifest)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return rendered
+
+
+def run(db, col_name: str, settings: dict, sites: list = None, terms: list = None, since: datetime.datetime = None,
+        until: datetime.datetime = None, resample: str = None, measure: str = 'run', mode: str = None,
+        max_points: int = None):
+    """
+    plots the word use of the selected sites into ./backup/<date>.html, or with mode "sites" into one file per site
+    and an index.html in the "directory" of the "plot" section of settings.json (default ./report)
+    :param db: mongo database
+    :param col_name: name of the word use collection
+    :param settings: whole settings.json content
+    :param sites: site names (None = all)
+    :param terms: search terms (None = search_terms of settings.json)
+    :param since: first date to plot
+    :param until: plot runs before this date
+    :param resample: None, hour, day or week (read from the rollups if they are enabled)
+    :param measure: run (occurrences per run), article (per article) or words (per 1,000 words), article and words
+                    are read from the rollups
+    :param mode: single (one figure with all sites) or sites (default: "mode" of the "plot" section or single)
+    :param max_points: points per trace in mode sites (default: "max_points" of the "plot" section or 2000, 0 = all)
+    :return:
+    """
+    search_terms = terms or settings['search_terms']
+    plot_settings = settings.get('plot', {})
+    mode = mode or plot_settings.get('mode', 'single')
+    if mode not in PLOT_MODES:
+        raise SystemExit(f'unknown plot mode: {mode}, use one of {PLOT_MODES}')
+
+    rollup_store = RollupStore.from_settings(db, col_name, settings)
+    if (resample == 'hour' or measure != 'run') and rollup_store is None:
+        raise SystemExit('hourly plots and other measures than run need the rollups, add "rollup": {"enabled": true} '
+                         'to settings.json and run: python -m datascraping rollup')
+    if rollup_store and (resample or measure != 'run'):
+        # pre aggregated totals per hour / day / week instead of every run
+        try:
+            runs_by_site = rollup_store.query(resample or 'hour', sites=sites, terms=search_terms, start=since,
+                                              end=until, measure=measure)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    else:
+        # only createdAt, totalArticles and the selected word counts are transferred, sorted by date
+        runs_by_site = query_runs(db, col_name, settings, sites=sites, terms=search_terms,
+                                  start=since, end=until, resample=resample)
+    if not runs_by_site:
+        raise SystemExit('no data found for the selected sites and time window')
+    # one date index for all sites, time x (totalArticles, terms) matrix per site
+    matrix = build_matrix(runs_by_site, search_terms)
+    del runs_by_site
+    if mode == 'sites':
+        directory = plot_settings.get('directory', './report')
+        max_points = int(plot_settings.get('max_points', 2000)) if max_points is None else max_points
+        options = {'since': since, 'until': until, 'resample': resample, 'measure': measure}
+        rendered = write_site_reports(matrix, search_terms, directory, max_points, options)
+        print(f'rendered {rendered} changed site(s), report: {os.path.join(directory, "index.html")}')
+        return
+    fig = build_figure(matrix, search_terms)
+
+    # save plot as html file with datetime as name
+    file_name = str(datetime.datetime.now().replace(microsecond=0)).replace(':', '-').replace(' ', 'T')
+    plot(fig, filename=f'./backup/{file_name}.html')
@@ -0,0 +1,130 @@
+"""
+server side queries of the word use runs: date range filter, projection of the plotted fields and optional resampling
+are done in a MongoDB aggregation pipeline so only the needed values are transferred
+"""
+
+import datetime
+
+from .storage import BucketStore
+
+RESAMPLE_UNITS = ('day', 'week')
+
+
+def _project_stage(prefix: str, terms: list) -> dict:
+    """
+    projection of createdAt, totalArticles and the word counts of the articles
+    :param prefix: path of the run inside the unwound document
+    :param terms: search terms to project (None = all)
+    :return:
+    """
+    projection = {
+        '_id': 0,
+        'site': '$site' if prefix == 'runs' else '$_id',
+        'createdAt': f'${prefix}.createdAt',
+        'totalArticles': f'${prefix}.mainPageArticles.totalArticles',
+        'totalTokens': f'${prefix}.mainPageArticles.totalTokens',
+    }
+    if terms is None:
+        projection['totalWords'] = f'${prefix}.mainPageArticles.totalWords'
+    else:
+        projection['totalWords'] = {term: f'${prefix}.mainPageArticles.totalWords.{term}' for term in terms}
+    return {'$project': projection}
+
+
+def _resample_stages(unit: str, terms: list) -> list:
+    """
+    averages the runs per site and day / week
+    :param unit: day or week
+    :param terms: search terms (required, sub documents cannot be averaged as a whole)
+    :return:
+    """
+    if unit not in RESAMPLE_UNITS:
+        raise ValueError(f'unknown resample unit: {unit}, use one of {RESAMPLE_UNITS}')
+    # start of the day / monday of the week ($dateFromParts instead of $dateTrunc to support MongoDB < 5.0)
+    truncate = {'$dateFromParts': {'year': {'$year': '$createdAt'}, 'month': {'$month': '$createdAt'},
+                                   'day': {'$dayOfMonth': '$createdAt'}}}
+    if unit == 'week':
+        days_since_monday = {'$mod': [{'$add': [{'$dayOfWeek': '$createdAt'}, 5]}, 7]}
+        truncate = {'$subtract': [truncate, {'$multiply': [days_since_monday, 24 * 60 * 60 * 1000]}]}
+    group = {
+        '_id': {'site': '$site', 'createdAt': truncate},
+        'totalArticles': {'$avg': '$totalArticles'},
+    }
+    for i, term in enumerate(terms):
+        group[f't{i}'] = {'$avg': f'$totalWords.{term}'}
+    return [
+        {'$group': group},
+        {'$project': {
+            '_id': 0,
+            'site': '$_id.site',
+            'createdAt': '$_id.createdAt',
+            'totalArticles': 1,
+            'totalWords': {term: f'$t{i}' for i, term in enumerate(terms)}
+        }}
+    ]
+
+
+def build_pipeline(bucketed: bool, sites: list = None, terms: list = None, start: datetime.datetime = None,
+                   end: datetime.datetime = None, resample: str = None) -> list:
+    """
+    aggregation pipeline returning one flat row per run (or per resampled day / week)
+    :param bucketed: runs are stored in buckets (storage.BucketStore) instead of the per site documents
+    :param sites: site names (None = all)
+    :param terms: search terms (None = all, not allowed together with resample)
+    :param start: inclusive (None = no lower limit)
+    :param end: exclusive (None = no upper limit)
+    :param resample: None, day or week
+    :return:
+    """
+    prefix = 'runs' if bucketed else 'data'
+    first_match = {}
+    if sites:
+        first_match['site' if bucketed else '_id'] = {'$in': list(sites)}
+    if bucketed and end:
+        first_match['bucketStart'] = {'$lt': end}
+    if bucketed and start:
+        first_match['bucketEnd'] = {'$gt': start}
+
+    run_match = {}
+    if start:
+        run_match['$gte'] = start
+    if end:
+        run_match['$lt'] = end
+
+    pipeline = []
+    if first_match:
+        pipeline.append({'$match': first_match})
+    pipeline.append({'$project': {'site': 1, prefix: 1}})
+    pipeline.append({'$unwind': f'${prefix}'})
+    if run_match:
+        pipeline.append({'$match': {f'{prefix}.createdAt': run_match}})
+    pipeline.append(_project_stage(prefix, terms))
+    if resample:
+        if terms is None:
+            raise ValueError('terms are required for resampling')
+        pipeline.extend(_resample_stages(resample, terms))
+    pipeline.append({'$sort': {'site': 1, 'createdAt': 1}})
+    return pipeline
+
+
+def query_runs(db, col_name: str, settings: dict, sites: list = None, terms: list = None,
+               start: datetime.datetime = None, end: datetime.datetime = None, resample: str = None) -> dict:
+    """
+    runs of the word use scraper grouped by site
+    :param db: mongo database
+    :param col_name: name of the word use collection
+    :param settings: whole settings.json content (storage mode)
+    :param sites: site names (None = all)
+    :param terms: search terms (None = all)
+    :param start: inclusive (None = no lower limit)
+    :param end: exclusive (None = no upper limit)
+    :param resample: None, day or week
+    :return: {site name: [{'createdAt', 'totalArticles', 'totalWords': {term: count}}]} sorted by site and date
+    """
+    bucket_store = BucketStore.from_settings(db, col_name, settings)
+    collection = bucket_store.collection if bucket_store else db[col_name]
+    pipeline = build_pipeline(bool(bucket_store), sites, terms, start, end, resample)
+    runs_by_site = {}
+    for row in collection.aggregate(pipeline, allowDiskUse=True):
+        runs_by_site.setdefault(row.pop('site'), []).append(row)
+    return runs_by_site
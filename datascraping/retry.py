@@ -0,0 +1,134 @@
+"""
+retry policy (exponential backoff with jitter, Retry-After, attempt and time budgets) and a per host circuit breaker
+used by fetcher.Fetcher
+"""
+
+import email.utils
+import random
+import threading
+import time
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class FetchError(Exception):
+    """
+    an url could not be fetched within the retry policy or its host is skipped by the circuit breaker
+    """
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f'{url}: {reason}')
+        self.url = url
+        self.reason = reason
+
+
+def parse_retry_after(value: str):
+    """
+    seconds to wait from a Retry-After header (delay in seconds or http date)
+    :param value:
+    :return: None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+class RetryPolicy:
+    """
+    decides if and how long to wait before the next attempt
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 60.0,
+                 url_budget: float = 120.0, run_budget: float = None):
+        """
+        :param max_attempts: attempts per url (including the first one)
+        :param base_delay: delay (s) before the first retry, doubled for every further retry
+        :param max_delay: upper limit (s) of a single delay
+        :param url_budget: maximum time (s) spent on one url including retries
+        :param run_budget: maximum time (s) spent waiting for retries in the whole run (None = no limit)
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.url_budget = url_budget
+        self.run_budget = run_budget
+        self._run_waited = 0.0
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        """
+        delay before the next attempt, exponential backoff with full jitter or the server's Retry-After
+        :param attempt: number of failed attempts so far (>= 1)
+        :param retry_after: seconds requested by the server
+        :return:
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def reserve(self, delay: float) -> bool:
+        """
+        takes a delay from the run budget
+        :param delay:
+        :return: False if the run budget is used up
+        """
+        with self._lock:
+            if self.run_budget is not None and self._run_waited + delay > self.run_budget:
+                return False
+            self._run_waited += delay
+            return True
+
+
+class CircuitBreaker:
+    """
+    stops requests to a host after several failures in a row and lets a single trial request through after a cooldown
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 300.0):
+        """
+        :param failure_threshold: failed attempts in a row that open the circuit
+        :param reset_after: seconds until a trial request is allowed again
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._failures = {}
+        self._open_until = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host: str) -> bool:
+        with self._lock:
+            open_until = self._open_until.get(host)
+            if open_until is None:
+                return True
+            if time.monotonic() < open_until:
+                return False
+            # half open: one trial request, the next failure opens the circuit again
+            self._open_until[host] = time.monotonic() + self.reset_after
+            self._failures[host] = self.failure_threshold - 1
+            return True
+
+    def record_success(self, host: str):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._open_until.pop(host, None)
+
+    def record_failure(self, host: str):
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if failures >= self.failure_threshold:
+                if host not in self._open_until or self._open_until[host] <= time.monotonic():
+                    print(f'{host} failed {failures} times in a row, skipping it for {self.reset_after:.0f}s')
+                self._open_until[host] = time.monotonic() + self.reset_after
+
+    def is_open(self, host: str) -> bool:
+        with self._lock:
+            return self._open_until.get(host, 0) > time.monotonic()
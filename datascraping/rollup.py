@@ -0,0 +1,212 @@
+"""
+pre aggregated word use: the article counts of every run are added with $inc upserts to one document per site and
+hour / day / week (collection "<worduse_coll>_rollup") when the run is stored, so plots of long time ranges read a few
+documents per site instead of every run.
+
+enable with
+    "rollup": {"enabled": true, "units": ["hour", "day", "week"]}
+and build the rollups of the runs stored so far (or after changing stored counts) with:
+    python -m datascraping rollup [--sites ...]
+"""
+
+import datetime
+
+from pymongo import ASCENDING, InsertOne, UpdateOne
+
+from .persist import run_key
+
+UNITS = ('hour', 'day', 'week')
+# run: average occurrences per run, article: per article, words: per 1,000 words of the articles
+MEASURES = ('run', 'article', 'words')
+
+
+def unit_start(date: datetime.datetime, unit: str) -> datetime.datetime:
+    """
+    start of the hour, day or week (monday) a date belongs to
+    :param date:
+    :param unit: hour, day or week
+    :return:
+    """
+    if unit == 'hour':
+        return date.replace(minute=0, second=0, microsecond=0)
+    day = datetime.datetime(date.year, date.month, date.day)
+    if unit == 'day':
+        return day
+    if unit == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    raise ValueError(f'unknown unit: {unit}, use one of {UNITS}')
+
+
+def _term_key(term: str) -> str:
+    # a dot would be read as a sub document in the $inc path
+    return term.replace('.', '\uff0e')
+
+
+def _term(key: str) -> str:
+    return key.replace('\uff0e', '.')
+
+
+def _increments(articles: dict) -> dict:
+    """
+    amounts one run adds to its rollups
+    :param articles: mainPageArticles of a run ({'totalArticles', 'totalWords', 'totalTokens'})
+    :return: {field path: amount}
+    """
+    increments = {'runs': 1, 'articles': articles.get('totalArticles') or 0, 'tokens': articles.get('totalTokens') or 0}
+    for term, count in (articles.get('totalWords') or {}).items():
+        increments[f'words.{_term_key(term)}'] = count or 0
+    return increments
+
+
+def _rollup_id(site_name: str, unit: str, start: datetime.datetime) -> str:
+    return f'{site_name}|{unit}|{start.isoformat()}'
+
+
+class RollupStore:
+    """
+    reads and writes the per site and hour / day / week totals of the word use runs
+    """
+
+    def __init__(self, db, col_name: str, units: list = UNITS):
+        """
+        :param db: mongo database
+        :param col_name: name of the word use collection, the rollups are in <col_name>_rollup
+        :param units: rollups which are maintained
+        """
+        for unit in units:
+            if unit not in UNITS:
+                raise ValueError(f'unknown unit: {unit}, use one of {UNITS}')
+        self.db = db
+        self.col_name = col_name
+        self.collection = db[f'{col_name}_rollup']
+        self.units = list(units)
+
+    @classmethod
+    def from_settings(cls, db, col_name: str, settings: dict):
+        """
+        creates the store from the "rollup" section of settings.json
+        :param db: mongo database
+        :param col_name: name of the word use collection
+        :param settings: whole settings.json content
+        :return: None if no rollups are maintained (default)
+        """
+        rollup_settings = settings.get('rollup', {})
+        if not rollup_settings.get('enabled', False):
+            return None
+        return cls(db, col_name, rollup_settings.get('units', UNITS))
+
+    def ensure_indexes(self):
+        self.collection.create_index([('unit', ASCENDING), ('site', ASCENDING), ('start', ASCENDING)])
+
+    def run_operations(self, site_name: str, run: dict) -> list:
+        """
+        upserts adding one run to its rollups
+        :param site_name:
+        :param run: run structure with createdAt
+        :return: two UpdateOne per unit (create the rollup, add the run if it is not added yet)
+        """
+        created_at = run['createdAt']
+        increments = _increments(run['mainPageArticles'])
+        key = run_key(created_at)
+        operations = []
+        for unit in self.units:
+            start = unit_start(created_at, unit)
+            rollup_id = _rollup_id(site_name, unit, start)
+            operations.append(UpdateOne(
+                {'_id': rollup_id},
+                {'$setOnInsert': {'site': site_name, 'unit': unit, 'start': start, 'runKeys': []}},
+                upsert=True
+            ))
+            # runKeys holds the runs which are added, a run written again is not counted twice
+            operations.append(UpdateOne(
+                {'_id': rollup_id, 'runKeys': {'$ne': key}},
+                {
+                    '$inc': increments,
+                    '$max': {'lastRun': created_at},
+                    '$push': {'runKeys': key}
+                }
+            ))
+        return operations
+
+    def rebuild(self, settings: dict, sites: list = None) -> int:
+        """
+        replaces the rollups of sites with the totals of their stored runs
+        :param settings: whole settings.json content (storage mode)
+        :param sites: site names (None = all sites of the word use collection)
+        :return: number of runs
+        """
+        from .query import query_runs
+
+        self.ensure_indexes()
+        sites = sites or sorted(self.db[self.col_name].distinct('_id'))
+        rebuilt = 0
+        for site_name in sites:
+            runs = query_runs(self.db, self.col_name, settings, sites=[site_name]).get(site_name, [])
+            rollups = {}
+            for run in runs:
+                increments = _increments(run)
+                for unit in self.units:
+                    start = unit_start(run['createdAt'], unit)
+                    rollup = rollups.setdefault(_rollup_id(site_name, unit, start), {
+                        'site': site_name, 'unit': unit, 'start': start, 'runs': 0, 'articles': 0, 'tokens': 0,
+                        'words': {}, 'lastRun': run['createdAt'], 'runKeys': []})
+                    rollup['runKeys'].append(run_key(run['createdAt']))
+                    for path, amount in increments.items():
+                        if path.startswith('words.'):
+                            key = path[len('words.'):]
+                            rollup['words'][key] = rollup['words'].get(key, 0) + amount
+                        else:
+                            rollup[path] += amount
+                    rollup['lastRun'] = max(rollup['lastRun'], run['createdAt'])
+            self.collection.delete_many({'site': site_name, 'unit': {'$in': self.units}})
+            if rollups:
+                self.collection.bulk_write([InsertOne(dict(rollup, _id=rollup_id))
+                                            for rollup_id, rollup in rollups.items()], ordered=False)
+            print(f'{site_name}: {len(runs)} runs in {len(rollups)} rollups')
+            rebuilt += len(runs)
+        return rebuilt
+
+    def query(self, unit: str, sites: list = None, terms: list = None, start: datetime.datetime = None,
+              end: datetime.datetime = None, measure: str = 'run') -> dict:
+        """
+        word use per site and hour / day / week
+        :param unit: hour, day or week (must be maintained)
+        :param sites: site names (None = all)
+        :param terms: search terms (None = all)
+        :param start: inclusive (None = no lower limit)
+        :param end: exclusive (None = no upper limit)
+        :param measure: run (average occurrences per run), article (per article) or words (per 1,000 words)
+        :return: {site name: [{'createdAt', 'totalArticles', 'totalWords': {term: value}}]} like query.query_runs,
+                 totalArticles is the average per run, values which cannot be computed are None
+        """
+        if unit not in self.units:
+            raise ValueError(f'no {unit} rollups, settings.json maintains {", ".join(self.units)}')
+        if measure not in MEASURES:
+            raise ValueError(f'unknown measure: {measure}, use one of {MEASURES}')
+        query = {'unit': unit}
+        if sites:
+            query['site'] = {'$in': list(sites)}
+        if start or end:
+            query['start'] = {}
+            if start:
+                query['start']['$gte'] = unit_start(start, unit)
+            if end:
+                query['start']['$lt'] = end
+        projection = {'site': 1, 'start': 1, 'runs': 1, 'articles': 1, 'tokens': 1}
+        if terms is None:
+            projection['words'] = 1
+        else:
+            projection.update({f'words.{_term_key(term)}': 1 for term in terms})
+
+        runs_by_site = {}
+        for rollup in self.collection.find(query, projection).sort([('site', ASCENDING), ('start', ASCENDING)]):
+            divisor = {'run': rollup['runs'], 'article': rollup['articles'], 'words': rollup['tokens'] / 1000}[measure]
+            words = {_term(key): count for key, count in rollup.get('words', {}).items()}
+            if terms is not None:
+                words = {term: words.get(term, 0) for term in terms}
+            runs_by_site.setdefault(rollup['site'], []).append({
+                'createdAt': rollup['start'],
+                'totalArticles': rollup['articles'] / rollup['runs'],
+                'totalWords': {term: count / divisor if divisor else None for term, count in words.items()}
+            })
+        return runs_by_site
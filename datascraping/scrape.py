@@ -0,0 +1,722 @@
+"""
+Author: Oliver Tworkowski
+This script searches for words on a website which has <article> tags. This applies to almost all newspaper websites
+To add or remove websites and words to be searched for, modify the settings.json file
+"""
+
+import requests
+from bs4 import BeautifulSoup
+import datetime
+import os
+import tempfile
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from .fetcher import Fetcher, declared_charset, host_of
+from .retry import FetchError
+from .matcher import TermMatcher, tokenize
+from .dedup import SeenIndex
+from .http_cache import HttpCache
+from .storage import BucketStore
+from .rollup import RollupStore
+from .persist import RunWriter, throttled_sites
+from .metrics import Metrics, StageTimer
+from .term_index import TermIndex
+from .archive import PageArchive
+from .backup import BackupSink
+from .extract import ARTICLE_STRAINER, NO_TITLE, extract_articles, resolve_link, stream_articles
+
+# Stackoverflow Solution
+def truncate(fl: float, n: int):
+    """
+    Truncates/pads a float f to n decimal places without rounding
+    """
+    s = '{}'.format(fl)
+    if 'e' in s or 'E' in s:
+        return '{0:.{1}f}'.format(fl, n)
+    i, p, d = s.partition('.')
+    return '.'.join([i, (d + '0' * n)[:n]])
+
+
+# Stackoverflow Solution
+def print_progress_bar(iteration, total, prefix='', suffix='', usepercent=True, decimals=1, fill='█'):
+    """
+    Call in a loop to create terminal progress bar
+    @params:
+        iteration   - Required  : current iteration (Int)
+        total       - Required  : total iterations (Int)
+        prefix      - Optional  : prefix string (Str)
+        suffix      - Optional  : suffix string (Str)
+        usepercent  - Optoinal  : display percentage (Bool)
+        decimals    - Optional  : positive number of decimals in percent complete (Int), ignored if usepercent = False
+        length      - Optional  : character length of bar (Int)
+        fill        - Optional  : bar fill character (Str)
+    """
+    # length is calculated by terminal width
+    twx, twy = shutil.get_terminal_size()
+    length = twx - 1 - len(prefix) - len(suffix) - 4
+    if usepercent:
+        length = length - 6
+    filled_length = int(length * iteration // total)
+    bar = fill * filled_length + '-' * (length - filled_length)
+    # process percent
+    if usepercent:
+        percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
+        print('\r%s |%s| %s%% %s' % (prefix, bar, percent, suffix), end='', flush=True)
+    else:
+        print('\r%s |%s| %s' % (prefix, bar, suffix), end='', flush=True)
+    # Print New Line on Complete
+    if iteration == total:
+        print(flush=True)
+
+
+def site_name(site_url: str, name: str = None) -> str:
+    """
+    name the runs of a site are stored under: the lowercase name of settings.json or the domain of the url
+    :param site_url:
+    :param name: "name" of the entry in search_sites (optional)
+    :return:
+    """
+    if not name:
+        return site_url.replace('https://www.', '').split('.')[0].lower()
+    return name.lower()
+
+
+class Site:
+    """
+    handle requests and website information
+    """
+
+    def __init__(self, site_url: str, name=None, fetcher: Fetcher = None):
+        self.url = site_url
+        self.fetcher = fetcher or Fetcher()
+        self.name = site_name(site_url, name)
+        self.search = []
+        self.matcher = TermMatcher([])
+        self.records = None
+        # reason why the site could not be fetched (None = ok)
+        self.error = None
+        # status code of the response and seconds per stage, reported to metrics by the caller
+        self.status = None
+        self.timer = StageTimer()
+        self.metrics = None
+        # raw body and charset of the page, kept for the page archive
+        self.raw_body = None
+        self.raw_encoding = None
+        self.archive = None
+        # the page is downloaded when its articles are first needed (get_article_records), in streaming mode no tree
+        # is kept
+        self.html = None
+        self.article_title_tag = 'title'
+        self.is_mainpage = False
+        self.seen_index = SeenIndex()
+        # word frequencies of the counted pages are stored for backfilling new search terms
+        self.term_index = None
+        self.run_at = None
+
+    def set_article_title_tag(self, tag_name: str):
+        """
+        provide the tag name inside the article tag if given (doesn't influence result if no title found)
+        :param tag_name:
+        :return:
+        """
+        self.article_title_tag = tag_name
+
+    def set_seen_index(self, seen_index: SeenIndex):
+        """
+        shares the index of already counted articles between sites
+        :param seen_index:
+        :return:
+        """
+        self.seen_index = seen_index
+
+    def set_term_index(self, term_index: TermIndex, run_at: datetime.datetime):
+        """
+        stores the word frequencies of this page and its articles in the term index
+        :param term_index:
+        :param run_at: createdAt of the run
+        :return:
+        """
+        self.term_index = term_index
+        self.run_at = run_at
+        self.records = None
+
+    def set_archive(self, archive: PageArchive, run_at: datetime.datetime):
+        """
+        stores the raw body of this page and its articles in the page archive
+        :param archive:
+        :param run_at: createdAt of the run
+        :return:
+        """
+        self.archive = archive
+        self.run_at = run_at
+
+    def archive_page(self, site_name: str, kind: str):
+        """
+        adds the downloaded body to the page archive (if set)
+        :param site_name: name of the site the page belongs to
+        :param kind: main (front page) or article
+        :return:
+        """
+        if self.archive and self.raw_body is not None:
+            self.archive.add(self.url, site_name, kind, self.run_at, self.raw_body, self.raw_encoding)
+
+    def set_metrics(self, metrics: Metrics):
+        """
+        registry the timings of the articles are reported to
+        :param metrics:
+        :return:
+        """
+        self.metrics = metrics
+
+    def set_as_mainpage(self):
+        """
+        sets the current instance as main page (front page of newspaper)
+        :return:
+        """
+        self.is_mainpage = True
+
+    @staticmethod
+    def init_word_dict(search: list) -> dict:
+        """
+        initiates a dict (probably obsolete)
+        :param search:
+        :return:
+        """
+        word_dict = {}
+        for w in search:
+            word_dict[w] = 0
+        return word_dict
+
+    @staticmethod
+    def format_to_readable(inner_html_text: str) -> list:
+        """
+        converts a whole article inner html text into a beautiful list of words :)
+        :param inner_html_text:
+        :return:
+        """
+        return tokenize(inner_html_text)
+
+    def request_site(self, stream=False):
+        """
+        requests the website (conditionally if it is cached) and handles exceptions
+        :param stream: do not download the body yet (read it with iter_content)
+        :return: (response, None), (None, (cached body, encoding)) after a 304 or (None, None) if it failed
+        """
+        cache = self.fetcher.cache
+        headers = cache.conditional_headers(self.url) if cache else {}
+        while True:
+            try:
+                with self.timer.stage('fetch'):
+                    site_response = self.fetcher.get(self.url, timeout=15, headers=headers, stream=stream)
+            except FetchError as e:
+                print(f'skipping {e}')
+                self.error = e.reason
+                return None, None
+            self.status = site_response.status_code
+            print(
+                f'status code: {site_response.status_code}, response time(s): {site_response.elapsed.total_seconds()}')
+            if not stream or site_response.status_code != 200:
+                site_response.close()
+            if site_response.status_code >= 400:
+                print(f'{site_response.status_code} Error')
+                self.error = f'status code {site_response.status_code}'
+                return None, None
+            if site_response.status_code == 304:
+                cached = cache.load_body(self.url)
+                if cached is not None:
+                    self.timer.from_cache = True
+                    return None, cached
+                # cached body was evicted in the meantime, request again without validators
+                headers = {}
+                continue
+            return site_response, None
+
+    def get_site(self):
+        """
+        gets website content as tree of its <article> tags
+        :return:
+        """
+        site_response, cached = self.request_site()
+        with self.timer.stage('parse'):
+            if cached is not None:
+                body, encoding = cached
+                self.raw_body, self.raw_encoding = body, encoding
+                return BeautifulSoup(body.decode(encoding or 'utf-8', errors='replace'), 'lxml',
+                                     parse_only=ARTICLE_STRAINER)
+            if site_response is None:
+                return BeautifulSoup("", 'lxml', parse_only=ARTICLE_STRAINER)
+            self.timer.bytes += len(site_response.content)
+            self.raw_body, self.raw_encoding = site_response.content, site_response.encoding
+            if self.fetcher.cache and site_response.status_code == 200:
+                self.fetcher.cache.store(self.url, site_response)
+            return BeautifulSoup(site_response.text, 'lxml', parse_only=ARTICLE_STRAINER)
+
+    def stream_site(self) -> list:
+        """
+        downloads the website in chunks and extracts every <article> as soon as it is complete (streaming mode)
+        :return: list of extract.ArticleRecord
+        """
+        site_response, cached = self.request_site(stream=True)
+        if cached is not None:
+            body, encoding = cached
+            chunks = [body]
+        elif site_response is None:
+            return []
+        else:
+            encoding = declared_charset(site_response.headers)
+            chunks = self.timer.timed_chunks(site_response.iter_content(chunk_size=64 * 1024))
+            if self.fetcher.cache and site_response.status_code == 200:
+                chunks = self.fetcher.cache.store_chunks(self.url, site_response, chunks, encoding)
+        kept = None
+        if self.archive:
+            chunks = kept = self._keep_chunks(chunks, encoding)
+        try:
+            # the download of the chunks is measured as fetch stage inside the parse stage
+            with self.timer.stage('parse'):
+                return list(stream_articles(chunks, self.url, self.article_title_tag, self.matcher, encoding=encoding,
+                                            max_bytes=self.fetcher.max_page_bytes, timer=self.timer,
+                                            frequencies=self.term_index is not None))
+        except requests.exceptions.RequestException as e:
+            print(f'download of {self.url} failed: {e}')
+            self.error = type(e).__name__
+            return []
+        finally:
+            if kept is not None:
+                # sets raw_body if stream_articles stopped reading before the end of the page
+                kept.close()
+            if site_response is not None:
+                site_response.close()
+
+    def _keep_chunks(self, chunks, encoding: str):
+        """
+        passes the chunks on and keeps the body for the page archive, also if the reader stops early (max_page_bytes),
+        so the archive holds the part of the page which was counted
+        :param chunks:
+        :param encoding:
+        :return:
+        """
+        body = []
+        try:
+            for chunk in chunks:
+                body.append(chunk)
+                yield chunk
+        finally:
+            self.raw_body, self.raw_encoding = b''.join(body), encoding
+
+    def specifiy_search(self, srch: list, matcher: TermMatcher = None):
+        """
+        sets searchlist for this instance
+        :param srch:
+        :param matcher: already compiled matcher for srch (shared between articles)
+        :return:
+        """
+        self.search = srch
+        self.matcher = matcher or TermMatcher(srch)
+        self.records = None
+
+    def search_words(self, inner_html_text: str) -> dict:
+        """
+        searches website for words
+        :param inner_html_text:
+        :return:
+        """
+        return self.matcher.count(self.format_to_readable(inner_html_text))
+
+    def get_page_words(self) -> dict:
+        """
+        counts the words for a website that have been found
+        :return:
+        """
+        records = self.get_article_records()
+        total = self.init_word_dict(self.search)
+        for record in records:
+            for search_item, count in record.counts.items():
+                total[search_item] += count
+        ret = {'totalWords': total, 'totalTokens': sum(record.token_count for record in records)}
+        if self.is_mainpage:
+            ret['totalArticles'] = len(records)
+        return ret
+
+    def get_article_records(self) -> list:
+        """
+        extracts title, link and word counts of every <article> tag once, shared by get_page_words and get_article_words
+        :return: list of extract.ArticleRecord
+        """
+        if self.records is None:
+            if self.fetcher.streaming:
+                self.records = self.stream_site()
+            else:
+                if self.html is None:
+                    self.html = self.get_site()
+                with self.timer.stage('parse'):
+                    self.records = extract_articles(self.html, self.url, self.article_title_tag, self.matcher,
+                                                    timer=self.timer, frequencies=self.term_index is not None)
+        return self.records
+
+    @staticmethod
+    def find_article_link(article, main_url: str):
+        """
+        tries to find an article reference in article tag
+        :param article: BeautifulSoup Pageelement <article>
+        :param main_url: the main page url
+        :return:
+        """
+        article_tags = article.find_all('a')
+        for article_tag in article_tags:
+            if article_tag.has_attr('href'):
+                ret_url = resolve_link(article_tag['href'], main_url)
+                if ret_url:
+                    return ret_url
+        return None
+
+    def get_article_name(self, article):
+        """
+        tries to get the articles name
+        :param article: BeautifulSoup Pageelement <article> tag
+        :return:
+        """
+        article_tags = article.find_all('a')
+        for article_tag in article_tags:
+            try:
+                art_name = article_tag[self.article_title_tag]
+                return art_name
+            except KeyError:
+                continue
+        return NO_TITLE
+
+    def fetch_article(self, article_url: str, article_name: str) -> dict:
+        """
+        downloads a single article and counts its words (thread safe, uses the shared fetcher)
+        :param article_url:
+        :param article_name:
+        :return: word counts or {'articleName', 'articleLink', 'reason'} if the article was skipped
+        """
+        rec_article = Site(article_url, article_name, fetcher=self.fetcher)
+        rec_article.specifiy_search(self.search, self.matcher)
+        if self.term_index:
+            rec_article.set_term_index(self.term_index, self.run_at)
+        if self.archive:
+            rec_article.set_archive(self.archive, self.run_at)
+
+        result = rec_article.get_page_words()
+        if self.metrics:
+            self.metrics.record_page(self.name, 'article', rec_article.timer, rec_article.status)
+            self.metrics.inc('articles', site=self.name, result='skipped' if rec_article.error else 'counted')
+        if rec_article.error:
+            return {'articleName': rec_article.name, 'articleLink': rec_article.url, 'reason': rec_article.error}
+        result['articleName'] = rec_article.name
+        result['articleLink'] = rec_article.url
+        if self.term_index:
+            self.term_index.add_page(self.name, self.run_at, 'article', rec_article.url,
+                                     rec_article.get_article_records())
+        rec_article.archive_page(self.name, 'article')
+        self.seen_index.mark(article_url, self.name)
+        print(rec_article.url)
+        return result
+
+    def article_references(self) -> list:
+        """
+        links and titles of the articles on the frontpage, articles without link or already counted have no link
+        :return: [(article url or None, title)] in the order of the frontpage
+        """
+        references = []
+        for record in self.get_article_records():
+            article_url = record.link
+            if not article_url:
+                print(f'could not find reference to article: \"{record.title}\"')
+            elif not self.seen_index.claim(article_url):
+                print(f'article already counted: {article_url}')
+                if self.metrics:
+                    self.metrics.inc('articles', site=self.name, result='duplicate')
+                article_url = None
+            references.append((article_url, record.title))
+        return references
+
+    def get_article_words(self, specific_articles=False) -> dict:
+        """
+        gets all content included in articles which are on the frontpage
+        :param specific_articles:
+        :return:
+        """
+        references = self.article_references()
+        main_page_articles_total = len(references)
+
+        # results are stored by index to keep the order of the front page when fetching concurrently
+        results = [None] * main_page_articles_total
+        concurrency = self.fetcher.concurrency_for(self.url)
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {executor.submit(self.fetch_article, article_url, article_name): i
+                           for i, (article_url, article_name) in enumerate(references) if article_url}
+                done_count = main_page_articles_total - len(futures)
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    done_count += 1
+                    print_progress_bar(done_count, main_page_articles_total,
+                                       prefix=f'{done_count}/{main_page_articles_total}')
+                    print()
+        else:
+            for i, (article_url, article_name) in enumerate(references):
+                if article_url:
+                    results[i] = self.fetch_article(article_url, article_name)
+                print_progress_bar(i + 1, main_page_articles_total, prefix=f'{i + 1}/{main_page_articles_total}')
+                # new line
+                print()
+        return self.sum_article_words(results, self.search, specific_articles)
+
+    @staticmethod
+    def sum_article_words(results: list, search: list, specific_articles=False) -> dict:
+        """
+        sums the word counts of the articles of a frontpage
+        :param results: results of fetch_article (None for articles which were not fetched)
+        :param search: search terms
+        :param specific_articles: include the counts of every article
+        :return:
+        """
+        article_list = [result for result in results if result and 'reason' not in result]
+        skipped_articles = [result for result in results if result and 'reason' in result]
+
+        total = Site.init_word_dict(search)
+        for article_info in article_list:
+            for search_item in search:
+                if article_info['totalWords'][search_item] == 0:
+                    continue
+                total[search_item] += article_info['totalWords'][search_item]
+
+        ret = {
+            'totalWords': total,
+            'totalArticles': len(article_list),
+            # number of words of all counted articles
+            'totalTokens': sum(article_info.get('totalTokens', 0) for article_info in article_list)
+        }
+        if skipped_articles:
+            ret['skippedArticles'] = skipped_articles
+        if specific_articles:
+            ret['articles'] = article_list
+
+        return ret
+
+    def introduce_self(self):
+        return f'{self.name} | {self.url}'
+
+
+def crawl_site(site_item: dict, now: datetime.datetime, fetcher: Fetcher, seen_index: SeenIndex,
+               metrics: Metrics, settings: dict, term_index: TermIndex = None, archive: PageArchive = None) -> dict:
+    """
+    gathers the word counts of one site
+    :param site_item: entry of search_sites
+    :param now: creation time of the run
+    :param fetcher: http client
+    :param seen_index: already counted articles
+    :param metrics: registry of the stage timings
+    :param settings: whole settings.json content
+    :param term_index: stores the word frequencies of the pages (optional)
+    :param archive: stores the raw pages (optional)
+    :return: {'name', 'url', 'run', 'seconds'}
+    """
+    start = time.perf_counter()
+    site = Site(site_item['url'], site_item.get('name'), fetcher=fetcher)
+    site.specifiy_search(settings['search_terms'])
+    site.set_as_mainpage()
+    site.set_seen_index(seen_index)
+    site.set_metrics(metrics)
+    if term_index:
+        site.set_term_index(term_index, now)
+    if archive:
+        site.set_archive(archive, now)
+    # site.set_article_title_tag(site_item['titleTag'])
+    print(f'-> gathering data for {site.introduce_self()}')
+
+    main_page = site.get_page_words()
+    metrics.record_page(site.name, 'page', site.timer, site.status)
+    if site.error:
+        print(f'skipping {site.name}: {site.error}')
+        metrics.observe('site_seconds', time.perf_counter() - start, site=site.name)
+        return {'name': site.name, 'url': site.url, 'run': None, 'error': site.error,
+                'seconds': time.perf_counter() - start}
+    if term_index:
+        term_index.add_page(site.name, now, 'main', site.url, site.get_article_records())
+    site.archive_page(site.name, 'main')
+    search_word_struct = {
+        'createdAt': now,
+        'mainPage': main_page,
+        'mainPageArticles': site.get_article_words()
+    }
+    seconds = time.perf_counter() - start
+    metrics.observe('site_seconds', seconds, site=site.name)
+    if settings.get('metrics', {}).get('store_in_runs', False):
+        search_word_struct['metrics'] = dict(metrics.site_summary(site.name), seconds=round(seconds, 3))
+    return {'name': site.name, 'url': site.url, 'run': search_word_struct, 'seconds': seconds}
+
+
+def crawl_host(site_items: list, now: datetime.datetime, settings: dict, claims_path: str = None) -> tuple:
+    """
+    process pool task: crawls the sites of one host one after another, so the per host limits of the fetcher still apply
+    :param site_items: entries of search_sites with the same host
+    :param now: creation time of the run
+    :param settings: whole settings.json content
+    :param claims_path: SQLite file of the articles claimed by all processes of this run
+    :return: (list of crawl_site results, metrics of the process as dict)
+    """
+    fetcher = Fetcher.from_settings(settings)
+    seen_index = SeenIndex.from_settings(settings, claims_path)
+    metrics = Metrics()
+    term_index = TermIndex.from_settings(settings)
+    archive = PageArchive.from_settings(settings)
+    try:
+        results = [crawl_site(site_item, now, fetcher, seen_index, metrics, settings, term_index, archive)
+                   for site_item in site_items]
+        return results, metrics.to_dict()
+    finally:
+        fetcher.close()
+        seen_index.close()
+        if term_index:
+            term_index.close()
+        if archive:
+            archive.close()
+
+
+def save_result(result: dict, run_writer: RunWriter, continue_flag: str, backup: BackupSink) -> str:
+    """
+    queues the run of a site for the database and appends it to the backup (after confirmation, so a restore does not
+    write declined runs)
+    :param result: output of crawl_site
+    :param run_writer:
+    :param continue_flag: answer of the last confirmation
+    :param backup: sink of the worduse stream
+    :return: new continue_flag
+    """
+    if result['run'] is None:
+        return continue_flag
+    search_word_struct = result['run']
+
+    if continue_flag != 'yy':
+        print(f'continue saving {result["name"]} to database? (y / n / yy = yes for all upcoming): ')
+        continue_flag = str(input()).lower()
+        if continue_flag == 'yy':
+            print('will save to database for all!')
+
+    if continue_flag == 'y' or continue_flag == 'yy':
+        backup.write_run(result['name'], result['url'], search_word_struct)
+        print(f'appended run to the backup: {backup.path}')
+        run_writer.add(result['name'], result['url'], search_word_struct)
+        print(f'queued run of {result["name"]} for saving')
+    else:
+        print('will not save to database')
+    return continue_flag
+
+
+def run(settings: dict, db, col_name: str, yes: bool = False, processes: int = 1):
+    """
+    crawls all due sites of settings.json and saves their runs
+    :param settings: whole settings.json content
+    :param db: mongo database
+    :param col_name: name of the word use collection
+    :param yes: save all results without asking
+    :param processes: crawl sites of different hosts in parallel processes
+    :return:
+    """
+    search_sites = settings['search_sites']
+    # runs are pushed into time buckets instead of the per site documents if configured
+    bucket_store = BucketStore.from_settings(db, col_name, settings)
+    if bucket_store:
+        bucket_store.ensure_indexes()
+    rollup_store = RollupStore.from_settings(db, col_name, settings)
+    if rollup_store:
+        rollup_store.ensure_indexes()
+
+    continue_flag = 'yy' if yes else ''
+    now = datetime.datetime.now()
+    # throttle check of all sites in one query, runs are written in the background while the next site is fetched
+    recently_updated = throttled_sites(db[col_name], [site_name(site_item['url'], site_item.get('name'))
+                                                      for site_item in search_sites if 'url' in site_item], now,
+                                       hours=3)
+    metrics = Metrics()
+    run_writer = RunWriter(db, col_name, bucket_store, metrics=metrics, rollup_store=rollup_store)
+    backup = BackupSink.from_settings(settings)
+    due_sites = []
+    for site_item in search_sites:
+        if 'url' not in site_item:
+            print('settings file keys cannot be found')
+            continue
+        name = site_name(site_item['url'], site_item.get('name'))
+        last_updated = recently_updated.get(name)
+        if last_updated:
+            print(
+                f'{name} was updated less than 3 hours ago: {last_updated}, '
+                f'please run again at {last_updated + datetime.timedelta(hours=3)}')
+            continue
+        due_sites.append(site_item)
+
+    run_start = time.perf_counter()
+    results = []
+    try:
+        if processes > 1:
+            # one task per host, a result is saved as soon as the sites before it in settings.json are saved
+            hosts = {}
+            for position, site_item in enumerate(due_sites):
+                hosts.setdefault(host_of(site_item['url']), []).append(position)
+            crawled = {}
+            # an article linked from sites of several hosts is claimed (fetched and counted) by one process only
+            claims_fd, claims_path = tempfile.mkstemp(prefix='claims-', suffix='.sqlite')
+            os.close(claims_fd)
+            try:
+                with ProcessPoolExecutor(max_workers=min(processes, max(len(hosts), 1))) as executor:
+                    futures = {executor.submit(crawl_host, [due_sites[position] for position in positions], now,
+                                               settings, claims_path): positions for positions in hosts.values()}
+                    for future in as_completed(futures):
+                        host_results, host_metrics = future.result()
+                        metrics.merge(host_metrics)
+                        crawled.update(zip(futures[future], host_results))
+                        while len(results) in crawled:
+                            result = crawled.pop(len(results))
+                            results.append(result)
+                            continue_flag = save_result(result, run_writer, continue_flag, backup)
+                            print()
+            finally:
+                os.remove(claims_path)
+        else:
+            # one pooled http client for the whole run (keep-alive connections, per host limits)
+            fetcher = Fetcher.from_settings(settings)
+            # articles counted in this run (and in earlier runs if the index is persistent)
+            seen_index = SeenIndex.from_settings(settings)
+            term_index = TermIndex.from_settings(settings)
+            archive = PageArchive.from_settings(settings)
+            try:
+                for site_item in due_sites:
+                    result = crawl_site(site_item, now, fetcher, seen_index, metrics, settings, term_index, archive)
+                    results.append(result)
+                    continue_flag = save_result(result, run_writer, continue_flag, backup)
+                    time.sleep(3)
+                    print()
+            finally:
+                fetcher.close()
+                seen_index.close()
+                if term_index:
+                    term_index.close()
+                if archive:
+                    archive.close()
+    finally:
+        # the runs saved so far are written even if a site task failed
+        try:
+            backup.close()
+        finally:
+            print(f'saved {run_writer.close()} run(s) to the database')
+    cache = HttpCache.from_settings(settings)
+    if cache:
+        print(f'removed {cache.evict()} entries from the http cache')
+
+    for result in results:
+        status = f'skipped ({result["error"]})' if result['run'] is None else \
+            f'{len(result["run"]["mainPageArticles"].get("skippedArticles", []))} article(s) skipped'
+        print(f'{result["name"]}: {result["seconds"]:.1f}s, {status}')
+    print(f'total: {time.perf_counter() - run_start:.1f}s')
+    stage_totals = metrics.stage_totals()
+    print(', '.join(f'{stage}: {stage_totals.get(f"{stage}_seconds", 0.0):.2f}s'
+                    for stage in ('fetch', 'parse', 'count', 'db_write')))
+    json_path, prom_path = metrics.export(settings.get('metrics', {}).get('directory', './metrics'), now)
+    print(f'saved metrics: {json_path}, {prom_path}')
+
+
+# TODO: Prevent saving data twice within 12 hours
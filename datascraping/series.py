@@ -0,0 +1,98 @@
+"""
+columnar intermediate for plotting: one date index shared by all sites and a dense time x (totalArticles, terms) matrix
+per site, built once from the queried runs
+"""
+
+import numpy as np
+import pandas as pd
+
+TOTAL_ARTICLES = 'totalArticles'
+# 1.0 where the site has a run, so runs without any value are kept as well
+RUN_MARKER = ' run'
+
+
+def build_matrix(runs_by_site: dict, terms: list) -> pd.DataFrame:
+    """
+    aligns the runs of all sites on one date index
+    :param runs_by_site: output of query.query_runs
+    :param terms: search terms (columns)
+    :return: DataFrame indexed by date with columns (site, totalArticles | term), NaN where a value is missing
+    """
+    frames = {}
+    for site_name, runs in runs_by_site.items():
+        frame = pd.DataFrame.from_records([run.get('totalWords') or {} for run in runs], columns=terms)
+        frame.insert(0, TOTAL_ARTICLES, [run.get(TOTAL_ARTICLES) for run in runs])
+        frame.insert(0, RUN_MARKER, 1.0)
+        frame.index = pd.DatetimeIndex([run['createdAt'] for run in runs])
+        frames[site_name] = frame[~frame.index.duplicated(keep='last')].astype(float)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=1).sort_index()
+
+
+def site_series(matrix: pd.DataFrame, site_name: str) -> tuple:
+    """
+    the dates of a site's own runs and its value matrix at those dates
+    :param matrix: output of build_matrix
+    :param site_name:
+    :return: (dates as numpy datetime64 array, DataFrame with totalArticles and term columns)
+    """
+    site_frame = matrix[site_name]
+    has_run = site_frame[RUN_MARKER].notna().to_numpy()
+    return matrix.index.to_numpy()[has_run], site_frame.loc[has_run, site_frame.columns != RUN_MARKER]
+
+
+def column_values(site_frame: pd.DataFrame, column: str) -> np.ndarray:
+    """
+    values of one column as float array (NaN = no value, drawn as gap)
+    :param site_frame: second element of site_series
+    :param column: totalArticles or a term
+    :return:
+    """
+    return site_frame[column].to_numpy(dtype=float)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    largest triangle three buckets downsampling: keeps the first and last point and from every bucket in between the
+    point forming the largest triangle with the previously kept point and the average of the next bucket
+    :param x: float array, ascending
+    :param y: float array without NaN
+    :param threshold: number of points to keep
+    :return: indices of the kept points, ascending
+    """
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+    # threshold - 2 buckets between the first and the last point
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x, next_y = x[end:edges[bucket + 2]].mean(), y[end:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample(dates: np.ndarray, values: np.ndarray, max_points: int) -> tuple:
+    """
+    the points of one trace reduced to max_points with lttb, missing values are left out
+    :param dates: datetime64 array
+    :param values: float array (NaN = no value)
+    :param max_points: number of points to keep (0 = all)
+    :return: (dates, values)
+    """
+    present = ~np.isnan(values)
+    dates, values = dates[present], values[present]
+    if not max_points or len(values) <= max_points:
+        return dates, values
+    kept = lttb(dates.astype('datetime64[ns]').astype(np.int64).astype(np.float64), values, max_points)
+    return dates[kept], values[kept]
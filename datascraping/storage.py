@@ -0,0 +1,159 @@
+"""
+time bucketed storage of the word use runs
+
+every run of a site is pushed into the bucket document of its site and time range
+(collection "<worduse_coll>_runs", one document per site and day / week / month) instead of into one ever growing
+document per site. The per site document in "<worduse_coll>" only keeps url, createdAt and updatedAt.
+
+migrate existing per site documents:
+    python -m datascraping migrate [--granularity month] [--drop-data]
+"""
+
+import datetime
+
+from pymongo import ASCENDING, UpdateOne
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def bucket_range(date: datetime.datetime, granularity: str) -> tuple:
+    """
+    start (inclusive) and end (exclusive) of the bucket a date belongs to
+    :param date:
+    :param granularity: day, week or month
+    :return:
+    """
+    day = datetime.datetime(date.year, date.month, date.day)
+    if granularity == 'day':
+        return day, day + datetime.timedelta(days=1)
+    if granularity == 'week':
+        start = day - datetime.timedelta(days=day.weekday())
+        return start, start + datetime.timedelta(days=7)
+    if granularity == 'month':
+        start = day.replace(day=1)
+        end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+        return start, end
+    raise ValueError(f'unknown granularity: {granularity}, use one of {GRANULARITIES}')
+
+
+class BucketStore:
+    """
+    reads and writes runs of the word use scraper in time buckets
+    """
+
+    def __init__(self, db, col_name: str, granularity: str = 'month'):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'unknown granularity: {granularity}, use one of {GRANULARITIES}')
+        self.sites = db[col_name]
+        self.collection = db[f'{col_name}_runs']
+        self.granularity = granularity
+
+    @classmethod
+    def from_settings(cls, db, col_name: str, settings: dict):
+        """
+        creates the store from the "storage" section of settings.json
+        :param db: mongo database
+        :param col_name: name of the word use collection
+        :param settings: whole settings.json content
+        :return: None if the runs are stored in the per site documents (default)
+        """
+        storage_settings = settings.get('storage', {})
+        if storage_settings.get('mode', 'documents') != 'buckets':
+            return None
+        return cls(db, col_name, storage_settings.get('granularity', 'month'))
+
+    def ensure_indexes(self):
+        self.collection.create_index([('site', ASCENDING), ('bucketStart', ASCENDING)], unique=True)
+        self.collection.create_index([('bucketStart', ASCENDING), ('bucketEnd', ASCENDING)])
+
+    def run_operations(self, site_name: str, site_url: str, run: dict) -> list:
+        """
+        write operations which store one run and update the per site document, a run which is already in its bucket is
+        not pushed again
+        :param site_name:
+        :param site_url:
+        :param run: run structure with createdAt
+        :return: [UpdateOne creating the bucket, UpdateOne pushing the run (both on the bucket collection), UpdateOne on
+                 the site collection]
+        """
+        created_at = run['createdAt']
+        bucket_start, bucket_end = bucket_range(created_at, self.granularity)
+        bucket_insert = UpdateOne(
+            {'site': site_name, 'bucketStart': bucket_start},
+            {'$setOnInsert': {'bucketEnd': bucket_end, 'granularity': self.granularity, 'runs': [], 'count': 0}},
+            upsert=True
+        )
+        bucket_update = UpdateOne(
+            {'site': site_name, 'bucketStart': bucket_start, 'runs.createdAt': {'$ne': created_at}},
+            {
+                '$push': {'runs': run},
+                '$inc': {'count': 1},
+                '$min': {'firstRun': created_at},
+                '$max': {'lastRun': created_at}
+            }
+        )
+        site_update = UpdateOne(
+            {'_id': site_name},
+            {
+                '$setOnInsert': {'url': site_url, 'createdAt': created_at},
+                '$set': {'updatedAt': created_at}
+            },
+            upsert=True
+        )
+        return [bucket_insert, bucket_update, site_update]
+
+    def runs(self, site_name: str, start: datetime.datetime = None, end: datetime.datetime = None) -> list:
+        """
+        runs of a site in a date range, only the buckets overlapping the range are read
+        :param site_name:
+        :param start: inclusive (None = no lower limit)
+        :param end: exclusive (None = no upper limit)
+        :return: runs sorted by createdAt
+        """
+        query = {'site': site_name}
+        if end:
+            query['bucketStart'] = {'$lt': end}
+        if start:
+            query['bucketEnd'] = {'$gt': start}
+        runs = []
+        for bucket in self.collection.find(query, {'runs': 1}).sort('bucketStart', ASCENDING):
+            runs.extend(run for run in bucket['runs']
+                        if (not start or run['createdAt'] >= start) and (not end or run['createdAt'] < end))
+        runs.sort(key=lambda run: run['createdAt'])
+        return runs
+
+    def site_documents(self, start: datetime.datetime = None, end: datetime.datetime = None) -> list:
+        """
+        runs of all sites in the shape of the per site documents ({'_id': name, 'url': url, 'data': [runs]})
+        :param start:
+        :param end:
+        :return:
+        """
+        documents = []
+        for site_doc in self.sites.find({}, {'data': 0}).sort('_id', ASCENDING):
+            site_doc['data'] = self.runs(site_doc['_id'], start, end)
+            if site_doc['data']:
+                documents.append(site_doc)
+        return documents
+
+    def migrate(self, drop_data: bool = False) -> int:
+        """
+        copies the runs of the per site documents into buckets (runs that already exist in a bucket are skipped)
+        :param drop_data: remove the data array from the per site documents afterwards
+        :return: number of migrated runs
+        """
+        self.ensure_indexes()
+        migrated = 0
+        for site_doc in self.sites.find({'data': {'$exists': True}}):
+            existing = {run['createdAt'] for run in self.runs(site_doc['_id'])}
+            runs = [run for run in site_doc['data'] if run['createdAt'] not in existing]
+            operations = [operation for run in runs
+                          for operation in self.run_operations(site_doc['_id'], site_doc.get('url'), run)[:2]]
+            if operations:
+                self.collection.bulk_write(operations, ordered=True)
+            migrated += len(runs)
+            print(f'migrated {len(runs)} runs of {site_doc["_id"]}')
+            if drop_data:
+                self.sites.update_one({'_id': site_doc['_id']}, {'$unset': {'data': ''}})
+        return migrated
+
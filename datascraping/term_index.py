@@ -0,0 +1,137 @@
+"""
+inverted index of the word frequencies of every counted page, so search terms added later can be counted in earlier
+runs without downloading anything again:
+    python -m datascraping backfill <term> [<term> ...]
+
+words are dictionary encoded (table vocab), every main page and article of a run is one document (table docs) and the
+postings hold the sparse term frequency vectors as (word, document, count) rows clustered by word
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+from .matcher import TOKEN_SPLIT, WILDCARD
+from .persist import KIND_FIELDS, run_key
+
+
+class TermIndex:
+    """
+    SQLite term frequency index of the crawled pages (thread safe, one writer at a time)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # processes crawling different hosts write to the same file
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._word_ids = {}
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS vocab (id INTEGER PRIMARY KEY, word TEXT UNIQUE NOT NULL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, site TEXT NOT NULL, '
+                         'run_at TEXT NOT NULL, kind TEXT NOT NULL, url TEXT, token_count INTEGER)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS docs_site_run ON docs (site, run_at)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS postings (word_id INTEGER NOT NULL, doc_id INTEGER NOT NULL, '
+                         'count INTEGER NOT NULL, PRIMARY KEY (word_id, doc_id)) WITHOUT ROWID')
+        self._db.commit()
+
+    @classmethod
+    def from_settings(cls, settings: dict):
+        """
+        creates the index from the "term_index" section of settings.json
+        :param settings: whole settings.json content
+        :return: None if no term index is configured
+        """
+        index_settings = settings.get('term_index')
+        if index_settings is None:
+            return None
+        return cls(index_settings.get('path', './term_index.sqlite'))
+
+    def _ids_of(self, words) -> dict:
+        """
+        ids of words, unknown words are added to the vocabulary (caller holds the lock)
+        :param words:
+        :return: {word: id}
+        """
+        missing = [word for word in words if word not in self._word_ids]
+        if missing:
+            self._db.executemany('INSERT OR IGNORE INTO vocab (word) VALUES (?)', ((word,) for word in missing))
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                self._word_ids.update(self._db.execute(
+                    f'SELECT word, id FROM vocab WHERE word IN ({",".join("?" * len(chunk))})', chunk).fetchall())
+        return {word: self._word_ids[word] for word in words}
+
+    def add_page(self, site_name: str, run_at: datetime.datetime, kind: str, url: str, records: list) -> int:
+        """
+        stores the word frequencies of one page
+        :param site_name:
+        :param run_at: createdAt of the run
+        :param kind: main (front page) or article
+        :param url:
+        :param records: extract.ArticleRecord with frequencies
+        :return: document id
+        """
+        frequencies = Counter()
+        for record in records:
+            frequencies.update(record.frequencies or {})
+        with self._lock:
+            word_ids = self._ids_of(list(frequencies))
+            doc_id = self._db.execute('INSERT INTO docs (site, run_at, kind, url, token_count) VALUES (?, ?, ?, ?, ?)',
+                                      (site_name, run_key(run_at), kind, url,
+                                       sum(record.token_count for record in records))).lastrowid
+            self._db.executemany('INSERT INTO postings (word_id, doc_id, count) VALUES (?, ?, ?)',
+                                 ((word_ids[word], doc_id, count) for word, count in frequencies.items()))
+            self._db.commit()
+        return doc_id
+
+    def matching_words(self, term: str) -> list:
+        """
+        ids of the vocabulary words counted for a search term
+        :param term: word or prefix (corona*), phrases cannot be counted from word frequencies
+        :return:
+        """
+        if len([part for part in TOKEN_SPLIT.split(term) if part]) > 1:
+            raise ValueError(f'"{term}" is a phrase, only words and prefixes (word*) can be counted from the index')
+        with self._lock:
+            if term.endswith(WILDCARD) and len(term) > 1:
+                prefix = term[:-1]
+                rows = self._db.execute('SELECT id FROM vocab WHERE word >= ? AND word < ?',
+                                        (prefix, prefix + '\U0010ffff')).fetchall()
+            else:
+                rows = self._db.execute('SELECT id FROM vocab WHERE word = ?', (term,)).fetchall()
+        return [row[0] for row in rows]
+
+    def run_counts(self, terms: list) -> dict:
+        """
+        counts of the terms per run, summed over the documents of the run like the counts stored in the run
+        :param terms:
+        :return: {(site, run_at): {'mainPage': {term: count}, 'mainPageArticles': {term: count}}}
+        """
+        with self._lock:
+            counts = {}
+            for site_name, run_at in self._db.execute('SELECT DISTINCT site, run_at FROM docs').fetchall():
+                counts[(site_name, datetime.datetime.fromisoformat(run_at))] = \
+                    {field: dict.fromkeys(terms, 0) for field in KIND_FIELDS.values()}
+        for term in terms:
+            word_ids = self.matching_words(term)
+            with self._lock:
+                for start in range(0, len(word_ids), 500):
+                    chunk = word_ids[start:start + 500]
+                    rows = self._db.execute(
+                        'SELECT d.site, d.run_at, d.kind, SUM(p.count) FROM postings p JOIN docs d ON d.id = p.doc_id '
+                        f'WHERE p.word_id IN ({",".join("?" * len(chunk))}) GROUP BY d.site, d.run_at, d.kind',
+                        chunk).fetchall()
+                    for site_name, run_at, kind, count in rows:
+                        counts[(site_name, datetime.datetime.fromisoformat(run_at))][KIND_FIELDS[kind]][term] += count
+        return counts
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+
@@ -0,0 +1,422 @@
+"""
+MongoDB backed work queue, so the articles of large frontpages can be fetched by several machines:
+    python -m datascraping enqueue      coordinator: counts the frontpages and queues their articles
+    python -m datascraping work         worker (any number, on any machine with access to the database)
+    python -m datascraping reduce       stores the runs of which all articles are done
+
+the queue collection <worduse_coll>_queue holds one document per run (kind "run") and one per article (kind
+"article"). A worker leases an article for visibility_seconds, an article which is not acknowledged in time (e.g. the
+worker died) is leased again by the next worker, up to max_attempts times.
+"""
+
+import datetime
+import os
+import socket
+import threading
+import time
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .archive import PageArchive
+from .backup import BackupSink
+from .dedup import SeenIndex
+from .fetcher import Fetcher
+from .metrics import Metrics
+from .persist import RunWriter, run_key
+from .rollup import RollupStore
+from .scrape import Site, site_name
+from .storage import BucketStore
+from .term_index import TermIndex
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def worker_id() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class WorkQueue:
+    """
+    durable queue of the articles of the queued runs with lease / ack
+    """
+
+    def __init__(self, db, col_name: str, visibility_seconds: float = 300, max_attempts: int = 3):
+        """
+        :param db: mongo database
+        :param col_name: name of the word use collection, the queue is <col_name>_queue
+        :param visibility_seconds: time a worker has to acknowledge a leased article
+        :param max_attempts: leases of an article before it is given up
+        """
+        self.db = db
+        self.collection = db[f'{col_name}_queue']
+        self.visibility = datetime.timedelta(seconds=visibility_seconds)
+        self.max_attempts = max_attempts
+
+    @classmethod
+    def from_settings(cls, db, col_name: str, settings: dict):
+        """
+        creates the queue from the "queue" section of settings.json
+        :param db: mongo database
+        :param col_name: name of the word use collection
+        :param settings: whole settings.json content
+        :return:
+        """
+        queue_settings = settings.get('queue', {})
+        return cls(db, col_name, float(queue_settings.get('visibility_seconds', 300)),
+                   int(queue_settings.get('max_attempts', 3)))
+
+    def ensure_indexes(self):
+        self.collection.create_index([('kind', ASCENDING), ('state', ASCENDING), ('leaseUntil', ASCENDING)])
+        self.collection.create_index([('run', ASCENDING), ('state', ASCENDING)])
+
+    def open_runs(self) -> dict:
+        """
+        runs which are queued but not reduced yet
+        :return: {site name: createdAt}
+        """
+        return {doc['site']: doc['createdAt'] for doc in self.collection.find({'kind': 'run', 'state': PENDING},
+                                                                             {'site': 1, 'createdAt': 1})}
+
+    def enqueue(self, site_name: str, site_url: str, run_at: datetime.datetime, search: list, main_page: dict,
+                references: list) -> int:
+        """
+        queues a counted frontpage and its articles
+        :param site_name:
+        :param site_url:
+        :param run_at: createdAt of the run
+        :param search: search terms, every worker counts the same terms
+        :param main_page: word counts of the frontpage (mainPage of the run)
+        :param references: [(article url or None, title)] in the order of the frontpage
+        :return: number of inserted articles (0 if the run is already queued)
+        """
+        run_id = f'{site_name}|{run_key(run_at)}'
+        articles = [{
+            '_id': f'{run_id}|{position}',
+            'kind': 'article',
+            'run': run_id,
+            'position': position,
+            'site': site_name,
+            'siteUrl': site_url,
+            'url': article_url,
+            'title': title,
+            'createdAt': run_at,
+            'search': search,
+            'state': PENDING,
+            'attempts': 0,
+            'leaseUntil': None
+        } for position, (article_url, title) in enumerate(references) if article_url]
+        if self.collection.count_documents({'_id': run_id}, limit=1):
+            # e.g. a second site of settings.json which is stored under the same name
+            print(f'{site_name}: a run of {run_at} is already queued, the articles of {site_url} are not queued')
+            return 0
+        # the run is inserted last, so it is only reduced once all of its articles are queued
+        queued = len(articles)
+        if articles:
+            try:
+                self.collection.insert_many(articles, ordered=False)
+            except BulkWriteError as e:
+                # articles of a coordinator which was interrupted while queuing this run
+                if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                    raise
+                queued = e.details['nInserted']
+        try:
+            self.collection.insert_one({'_id': run_id, 'kind': 'run', 'site': site_name, 'url': site_url,
+                                        'createdAt': run_at, 'search': search, 'mainPage': main_page,
+                                        'articles': len(references), 'state': PENDING})
+        except DuplicateKeyError:
+            print(f'{site_name}: the run of {run_at} was queued by another coordinator in the meantime')
+        return queued
+
+    def lease(self, worker: str, now: datetime.datetime = None):
+        """
+        leases the oldest pending article (or one whose lease expired)
+        :param worker: id of the worker
+        :param now:
+        :return: article document or None if there is nothing to do
+        """
+        now = now or datetime.datetime.now()
+        return self.collection.find_one_and_update(
+            {'kind': 'article', 'attempts': {'$lt': self.max_attempts},
+             '$or': [{'state': PENDING}, {'state': LEASED, 'leaseUntil': {'$lt': now}}]},
+            {'$set': {'state': LEASED, 'leaseUntil': now + self.visibility, 'worker': worker},
+             '$inc': {'attempts': 1}},
+            sort=[('run', ASCENDING), ('position', ASCENDING)],
+            return_document=ReturnDocument.AFTER)
+
+    def ack(self, article: dict, worker: str, result: dict) -> bool:
+        """
+        stores the result of a leased article
+        :param article: leased article document
+        :param worker: id of the worker
+        :param result: result of scrape.Site.fetch_article
+        :return: False if the lease was lost (expired and leased by another worker)
+        """
+        if 'reason' not in result:
+            update = {'$set': {'state': DONE, 'result': result}}
+        elif article['attempts'] < self.max_attempts:
+            # skipped articles are leased again later
+            update = {'$set': {'state': PENDING, 'reason': result['reason']}}
+        else:
+            update = {'$set': {'state': FAILED, 'result': result}}
+        return self.collection.update_one({'_id': article['_id'], 'state': LEASED, 'worker': worker},
+                                          update).modified_count == 1
+
+    def give_up(self, now: datetime.datetime = None) -> int:
+        """
+        marks articles which were leased max_attempts times without result as failed
+        :param now:
+        :return: number of failed articles
+        """
+        now = now or datetime.datetime.now()
+        return self.collection.update_many(
+            {'kind': 'article', 'attempts': {'$gte': self.max_attempts},
+             '$or': [{'state': PENDING}, {'state': LEASED, 'leaseUntil': {'$lt': now}}]},
+            {'$set': {'state': FAILED}}).modified_count
+
+    def unfinished(self) -> int:
+        """
+        number of articles which are pending or leased (after giving up the articles without attempts left)
+        :return:
+        """
+        self.give_up()
+        return self.collection.count_documents({'kind': 'article', 'state': {'$in': [PENDING, LEASED]}})
+
+    def status(self) -> dict:
+        """
+        number of articles per state
+        :return: {state: count}
+        """
+        return {doc['_id']: doc['count'] for doc in self.collection.aggregate([
+            {'$match': {'kind': 'article'}},
+            {'$group': {'_id': '$state', 'count': {'$sum': 1}}}])}
+
+    def finished_runs(self, now: datetime.datetime = None) -> list:
+        """
+        queued runs of which every article is done or failed
+        :param now:
+        :return: run documents with the article documents in 'results' (ordered like the frontpage)
+        """
+        self.give_up(now)
+        finished = []
+        for run in self.collection.find({'kind': 'run', 'state': PENDING}).sort('createdAt', ASCENDING):
+            if self.collection.count_documents({'run': run['_id'], 'state': {'$in': [PENDING, LEASED]}}):
+                continue
+            run['results'] = list(self.collection.find({'run': run['_id']}).sort('position', ASCENDING))
+            finished.append(run)
+        return finished
+
+    def mark_backed_up(self, run_ids: list):
+        """
+        marks reduced runs whose run is in the backup, so a repeated reduce does not append them again
+        :param run_ids:
+        :return:
+        """
+        if run_ids:
+            self.collection.update_many({'_id': {'$in': list(run_ids)}}, {'$set': {'backedUp': True}})
+
+    def remove_run(self, run_id: str):
+        """
+        removes a reduced run and its articles from the queue
+        :param run_id:
+        :return:
+        """
+        self.collection.delete_many({'run': run_id})
+        self.collection.delete_one({'_id': run_id})
+
+
+def enqueue_site(site_item: dict, now: datetime.datetime, fetcher: Fetcher, seen_index: SeenIndex, settings: dict,
+                 queue: WorkQueue, term_index: TermIndex = None, archive: PageArchive = None) -> int:
+    """
+    coordinator: counts the frontpage of a site and queues its articles (like scrape.crawl_site without fetching them)
+    :param site_item: entry of search_sites
+    :param now: creation time of the run
+    :param fetcher: http client
+    :param seen_index: already counted articles
+    :param settings: whole settings.json content
+    :param queue:
+    :param term_index: stores the word frequencies of the frontpage (optional)
+    :param archive: stores the raw frontpage (optional)
+    :return: number of queued articles, None if the frontpage could not be fetched
+    """
+    site = Site(site_item['url'], site_item.get('name'), fetcher=fetcher)
+    site.specifiy_search(settings['search_terms'])
+    site.set_as_mainpage()
+    site.set_seen_index(seen_index)
+    if term_index:
+        site.set_term_index(term_index, now)
+    if archive:
+        site.set_archive(archive, now)
+    print(f'-> queuing articles of {site.introduce_self()}')
+    main_page = site.get_page_words()
+    if site.error:
+        print(f'skipping {site.name}: {site.error}')
+        return None
+    if term_index:
+        term_index.add_page(site.name, now, 'main', site.url, site.get_article_records())
+    site.archive_page(site.name, 'main')
+    return queue.enqueue(site.name, site.url, now, settings['search_terms'], main_page, site.article_references())
+
+
+def enqueue_sites(settings: dict, db, col_name: str, queue: WorkQueue) -> int:
+    """
+    coordinator: queues the articles of all due sites of settings.json (sites updated less than 3 hours ago or with a
+    run in the queue are not due)
+    :param settings: whole settings.json content
+    :param db: mongo database
+    :param col_name: name of the word use collection
+    :param queue:
+    :return: number of queued articles
+    """
+    from .persist import throttled_sites
+
+    queue.ensure_indexes()
+    now = datetime.datetime.now()
+    search_sites = [site_item for site_item in settings['search_sites'] if 'url' in site_item]
+    recently_updated = throttled_sites(db[col_name], [site_name(site_item['url'], site_item.get('name'))
+                                                      for site_item in search_sites], now, hours=3)
+    fetcher = Fetcher.from_settings(settings)
+    seen_index = SeenIndex.from_settings(settings)
+    term_index = TermIndex.from_settings(settings)
+    archive = PageArchive.from_settings(settings)
+    queued = 0
+    try:
+        for site_item in search_sites:
+            name = site_name(site_item['url'], site_item.get('name'))
+            # read for every site, it contains the runs queued for the sites before (which may have the same name)
+            open_runs = queue.open_runs()
+            if name in recently_updated or name in open_runs:
+                print(f'{name} is not due: updated at {recently_updated.get(name) or open_runs.get(name)}')
+                continue
+            queued += enqueue_site(site_item, now, fetcher, seen_index, settings, queue, term_index, archive) or 0
+    finally:
+        fetcher.close()
+        seen_index.close()
+        for store in (term_index, archive):
+            if store:
+                store.close()
+    return queued
+
+
+def work(queue: WorkQueue, settings: dict, exit_when_empty: bool = False, poll_seconds: float = 5) -> int:
+    """
+    worker: fetches and counts leased articles until stopped (or until the queue is empty)
+    :param queue:
+    :param settings: whole settings.json content (fetch options, term index, archive, dedup)
+    :param exit_when_empty: stop when no article is pending or leased
+    :param poll_seconds: wait between two leases if the queue is empty
+    :return: number of processed articles
+    """
+    fetcher = Fetcher.from_settings(settings)
+    seen_index = SeenIndex.from_settings(settings)
+    term_index = TermIndex.from_settings(settings)
+    archive = PageArchive.from_settings(settings)
+    metrics = Metrics()
+    sites = {}
+    sites_lock = threading.Lock()
+    processed = []
+
+    def parent_site(article: dict) -> Site:
+        # one Site per queued run holds the search terms and stores of the articles of its frontpage
+        with sites_lock:
+            site = sites.get(article['run'])
+            if site is None:
+                site = sites[article['run']] = Site(article['siteUrl'], article['site'], fetcher=fetcher)
+                site.specifiy_search(article['search'])
+                site.set_seen_index(seen_index)
+                site.set_metrics(metrics)
+                if term_index:
+                    site.set_term_index(term_index, article['createdAt'])
+                if archive:
+                    site.set_archive(archive, article['createdAt'])
+            return site
+
+    def loop(worker: str):
+        while True:
+            article = queue.lease(worker)
+            if article is None:
+                if exit_when_empty and not queue.unfinished():
+                    return
+                time.sleep(poll_seconds)
+                continue
+            result = parent_site(article).fetch_article(article['url'], article['title'])
+            if not queue.ack(article, worker, result):
+                print(f'lease of {article["url"]} expired, the result is dropped')
+            processed.append(article['_id'])
+
+    # one lease loop per parallel download, the fetcher keeps the per host limits
+    threads = [threading.Thread(target=loop, args=(f'{worker_id()}-{i}',), daemon=True)
+               for i in range(max(int(settings.get('fetch', {}).get('concurrency', 1)), 1))]
+    try:
+        for thread in threads:
+            thread.start()
+        # workers run longer than one scrape, the http cache is kept within its limits while they run
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(poll_seconds)
+                removed = fetcher.cache.maybe_evict() if fetcher.cache else None
+                if removed is not None:
+                    print(f'removed {removed} entries from the http cache')
+    finally:
+        fetcher.close()
+        seen_index.close()
+        for store in (term_index, archive):
+            if store:
+                store.close()
+        metrics.export(settings.get('metrics', {}).get('directory', './metrics'), datetime.datetime.now())
+    return len(processed)
+
+
+def reduce_runs(queue: WorkQueue, db, col_name: str, settings: dict) -> int:
+    """
+    stores the runs of which all articles are done (like scrape.run) and removes them from the queue
+    :param queue:
+    :param db: mongo database
+    :param col_name: name of the word use collection
+    :param settings: whole settings.json content
+    :return: number of stored runs
+    """
+    bucket_store = BucketStore.from_settings(db, col_name, settings)
+    if bucket_store:
+        bucket_store.ensure_indexes()
+    rollup_store = RollupStore.from_settings(db, col_name, settings)
+    if rollup_store:
+        rollup_store.ensure_indexes()
+    reduced = []
+    for run in queue.finished_runs():
+        results = [None] * run['articles']
+        for article in run['results']:
+            results[article['position']] = article.get('result') or {
+                'articleName': article['title'], 'articleLink': article['url'],
+                'reason': article.get('reason', 'lease expired')}
+        reduced.append((run, {
+            'createdAt': run['createdAt'],
+            'mainPage': run['mainPage'],
+            'mainPageArticles': Site.sum_article_words(results, run['search'])
+        }))
+    if not reduced:
+        return 0
+
+    # an interrupted reduce is repeated by the next one: runs which are in the backup are marked in the queue, writing
+    # a run again does not change the database
+    backup = BackupSink.from_settings(settings)
+    try:
+        for run, search_word_struct in reduced:
+            if not run.get('backedUp'):
+                backup.write_run(run['site'], run['url'], search_word_struct)
+    finally:
+        backup.close()
+    queue.mark_backed_up([run['_id'] for run, _ in reduced])
+    run_writer = RunWriter(db, col_name, bucket_store, rollup_store=rollup_store)
+    try:
+        for run, search_word_struct in reduced:
+            run_writer.add(run['site'], run['url'], search_word_struct)
+            print(f'{run["site"]}: {search_word_struct["mainPageArticles"]["totalArticles"]} articles')
+    finally:
+        run_writer.close()
+    for run, _ in reduced:
+        queue.remove_run(run['_id'])
+    return len(reduced)